@@ -0,0 +1,210 @@
+# ASGI entry point: serves the Flask app (server.py) from an asyncio loop.
+
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from server import SSE_MAX_SUBSCRIBERS, app as wsgi_app
+
+# Requests admitted at once (including those streaming a response); more
+# than this are turned away with 503 + Retry-After instead of queueing.
+MAX_CONCURRENCY = int(os.environ.get("ASGI_CONCURRENCY", 1000))
+# Threads running Flask views, i.e. doing the file/SQLite I/O.
+MAX_THREADS = int(os.environ.get("ASGI_THREADS", 32))
+# Threads pulling event-stream (/api/events) responses, which block for
+# a heartbeat at a time; kept apart so streams can't starve MAX_THREADS.
+MAX_STREAM_THREADS = int(os.environ.get("ASGI_STREAM_THREADS", SSE_MAX_SUBSCRIBERS))
+# Largest request body accepted, in bytes.
+MAX_BODY = int(os.environ.get("ASGI_MAX_BODY", 1 << 20))
+RETRY_AFTER = os.environ.get("ASGI_RETRY_AFTER", "1")
+
+# _read_body's answer when the client went away mid-body.
+DISCONNECTED = object()
+
+
+class WSGIBridge:
+    """ Runs a WSGI app under an ASGI server.
+
+    The event loop owns every connection: it reads the request body,
+    then hands the WSGI call to a bounded thread pool and awaits it, and
+    pulls each chunk of the response from the pool in turn. A slow client
+    therefore waits on the loop, not in a thread, and a slow disk write
+    holds one pool thread rather than a whole worker process. A counter
+    caps how many requests are in flight; beyond it the bridge answers
+    503 straight away so load sheds at the edge instead of piling up.
+
+    text/event-stream responses are pulled on a separate pool, and once
+    the client disconnects the response is closed after the chunk being
+    produced, so an abandoned stream frees its thread within a heartbeat. """
+
+    def __init__(self, app, max_concurrency=MAX_CONCURRENCY, max_threads=MAX_THREADS,
+                 max_body=MAX_BODY, max_stream_threads=MAX_STREAM_THREADS):
+        self.app = app
+        self.max_concurrency = max_concurrency
+        self.max_body = max_body
+        self.executor = ThreadPoolExecutor(max_threads, thread_name_prefix="wsgi")
+        self.stream_executor = ThreadPoolExecutor(max_stream_threads, thread_name_prefix="wsgi-stream")
+        self.in_flight = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            if self.in_flight >= self.max_concurrency:
+                await self._reject(send, 503, b"Server busy, try again shortly.",
+                                   [(b"retry-after", RETRY_AFTER.encode())])
+                return
+            self.in_flight += 1
+            try:
+                await self._handle(scope, receive, send)
+            finally:
+                self.in_flight -= 1
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=True)
+                self.stream_executor.shutdown(wait=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    @staticmethod
+    async def _reject(send, status, text, headers=()):
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"text/plain; charset=utf-8"),
+                                (b"content-length", str(len(text)).encode()),
+                                *headers]})
+        await send({"type": "http.response.body", "body": text})
+
+    async def _read_body(self, receive):
+        """ The whole request body, None if it exceeds max_body, or
+        DISCONNECTED if the client left before sending all of it. """
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return DISCONNECTED
+            size += len(message.get("body", b""))
+            if size > self.max_body:
+                return None
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                return b"".join(chunks)
+
+    def _environ(self, scope, body):
+        server = scope.get("server") or ("localhost", 80)
+        client = scope.get("client") or ("", 0)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+            "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+            "SERVER_NAME": server[0],
+            "SERVER_PORT": str(server[1]),
+            "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+            "REMOTE_ADDR": client[0],
+            "REMOTE_PORT": str(client[1]),
+            "CONTENT_LENGTH": str(len(body)),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": True,
+            "wsgi.run_once": False,
+            # Streams get their own pool here (see server.change_events).
+            "lms.stream_pool": True,
+        }
+        for name, value in scope.get("headers", []):
+            name = name.decode("latin-1").upper().replace("-", "_")
+            value = value.decode("latin-1")
+            if name == "CONTENT_TYPE":
+                environ["CONTENT_TYPE"] = value
+            elif name != "CONTENT_LENGTH":
+                key = "HTTP_" + name
+                environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+    def _start(self, environ):
+        """ Calls the WSGI app (in a pool thread). Returns the status,
+        headers, any bytes passed to write() and the body iterator. """
+        started = {}
+        written = []
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and started:
+                raise exc_info[1].with_traceback(exc_info[2])
+            started["status"] = int(status.split(" ", 1)[0])
+            started["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1"))
+                                  for k, v in headers]
+            return written.append
+
+        result = self.app(environ, start_response)
+        iterator = iter(result)
+        # Run the generator up to its first chunk so that start_response
+        # has been called even by apps that defer it.
+        first = next(iterator, None)
+        if first is not None:
+            written.append(first)
+        return started, written, result, iterator
+
+    @staticmethod
+    async def _disconnected(receive):
+        """ Returns once the client has gone away. Only called after the
+        body has been read, so everything left to receive is the
+        disconnect. """
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    async def _handle(self, scope, receive, send):
+        body = await self._read_body(receive)
+        if body is DISCONNECTED:
+            return      # never run a view on a truncated body
+        if body is None:
+            await self._reject(send, 413, b"Request body too large.")
+            return
+        loop = asyncio.get_running_loop()
+        started, written, result, iterator = await loop.run_in_executor(
+            self.executor, self._start, self._environ(scope, body))
+        streaming = any(name == b"content-type" and value.startswith(b"text/event-stream")
+                        for name, value in started["headers"])
+        executor = self.stream_executor if streaming else self.executor
+        gone = asyncio.ensure_future(self._disconnected(receive))
+        try:
+            await send({"type": "http.response.start", "status": started["status"],
+                        "headers": started["headers"]})
+            for chunk in written:
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk,
+                                "more_body": True})
+            while True:
+                step = loop.run_in_executor(executor, next, iterator, None)
+                await asyncio.wait((step, gone), return_when=asyncio.FIRST_COMPLETED)
+                # A generator can't be closed mid-step, so on disconnect
+                # let the current one finish before closing below.
+                chunk = await step
+                if chunk is None or gone.done():
+                    break
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk,
+                                "more_body": True})
+            if not gone.done():
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            gone.cancel()
+            close = getattr(result, "close", None)
+            if close:
+                await loop.run_in_executor(executor, close)
+
+app = WSGIBridge(wsgi_app)
+
+if __name__ == "__main__":
+    import uvicorn
+    port = int(os.environ.get("PORT", 5000))
+    print(f"Starting ASGI server on port {port}...")
+    uvicorn.run(app, host="0.0.0.0", port=port)
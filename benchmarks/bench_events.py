@@ -0,0 +1,205 @@
+"""Many concurrent /api/events subscribers against a local server.
+
+    python benchmarks/bench_events.py --subscribers 200 --changes 300
+    python benchmarks/bench_events.py --url http://127.0.0.1:5000 --subscribers 50
+
+Opens --subscribers SSE streams, then makes --changes catalog changes
+(issue/return pairs) over HTTP and checks that every stream received
+every change exactly once and in order, reporting delivery latency from
+the moment each write was sent. Without --url a threaded server is
+started in-process on a synthetic catalog. Also checks that a stream
+reconnecting with Last-Event-ID gets the changes it missed replayed.
+Exits non-zero if anything was lost.
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+from harness import ROOT, summarize, write_results
+from synth import write_catalog
+
+
+class Subscriber(threading.Thread):
+    """ Reads one event stream, recording (seq, arrival time) of changes. """
+
+    def __init__(self, base, last_event_id=None):
+        super().__init__(daemon=True)
+        url = urllib.parse.urlsplit(base)
+        self.conn = http.client.HTTPConnection(url.hostname, url.port, timeout=60)
+        headers = {"Accept": "text/event-stream"}
+        if last_event_id:
+            headers["Last-Event-ID"] = last_event_id
+        self.conn.request("GET", "/api/events", headers=headers)
+        self.response = self.conn.getresponse()
+        self.status = self.response.status
+        self.received = []
+        self.resyncs = 0
+        self.last_id = None
+
+    def run(self):
+        if self.status != 200:
+            return
+        event = {}
+        try:
+            for raw in self.response:
+                line = raw.decode("utf-8").rstrip("\n")
+                if line:
+                    field, _, value = line.partition(": ")
+                    event[field] = value
+                    continue
+                if event.get("event") == "change":
+                    self.received.append((json.loads(event["data"])["seq"], time.perf_counter()))
+                elif event.get("event") == "resync":
+                    self.resyncs += 1
+                self.last_id = event.get("id", self.last_id)
+                event = {}
+        except (OSError, ValueError, http.client.HTTPException):
+            pass
+
+    def close(self):
+        self.conn.sock and self.conn.sock.close()
+
+
+def post(base, path, body):
+    url = urllib.parse.urlsplit(base)
+    conn = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+    conn.request("POST", path, json.dumps(body), {"Content-Type": "application/json"})
+    response = conn.getresponse()
+    data = json.loads(response.read())
+    conn.close()
+    return response.status, data
+
+
+def get(base, path):
+    url = urllib.parse.urlsplit(base)
+    conn = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+    conn.request("GET", path)
+    response = conn.getresponse()
+    data = json.loads(response.read())
+    conn.close()
+    return data
+
+
+def make_changes(base, book_ids, n):
+    """ Issues and returns books until `n` changes were made; returns the
+    perf_counter time each write was sent, in order. """
+    sent = []
+    for i in range(n):
+        sent.append(time.perf_counter())
+        book_id = book_ids[(i // 2) % len(book_ids)]
+        if i % 2 == 0:
+            status, _ = post(base, "/api/issue", {"book_id": book_id, "user_name": "Feed Bench"})
+        else:
+            status, _ = post(base, "/api/return", {"book_id": book_id})
+        if status != 200:
+            sys.exit(f"write {i} failed with {status}")
+    return sent
+
+
+def run(base, args):
+    book_ids = [row["id"] for row in get(base, "/api/books?status=available&limit=50")]
+    subscribers = [Subscriber(base) for _ in range(args.subscribers)]
+    refused = sum(s.status != 200 for s in subscribers)
+    for s in subscribers:
+        s.start()
+    time.sleep(0.5)
+
+    start = time.perf_counter()
+    written = make_changes(base, book_ids, args.changes)
+    elapsed = time.perf_counter() - start
+    time.sleep(args.settle)
+
+    latencies, lost, out_of_order = [], 0, 0
+    for s in subscribers:
+        if s.status != 200:
+            continue
+        seqs = [seq for seq, _ in s.received]
+        out_of_order += seqs != sorted(seqs) or len(set(seqs)) != len(seqs)
+        lost += max(0, args.changes - len(s.received))
+        for (_, arrived), sent in zip(s.received, written):
+            latencies.append(arrived - sent)
+
+    # A client that drops and reconnects with its last ID gets a replay.
+    probe = next(s for s in subscribers if s.status == 200)
+    probe.close()
+    resume_from = probe.last_id
+    post(base, "/api/issue", {"book_id": book_ids[0], "user_name": "Feed Bench"})
+    post(base, "/api/return", {"book_id": book_ids[0]})
+    again = Subscriber(base, resume_from)
+    again.start()
+    time.sleep(args.settle)
+    replayed = len(again.received)
+    again.close()
+    for s in subscribers:
+        s.close()
+
+    results = {
+        "delivery": summarize(latencies, elapsed),
+        "subscribers": args.subscribers,
+        "refused": refused,
+        "changes": args.changes,
+        "lost": lost,
+        "out_of_order_streams": out_of_order,
+        "replayed_after_reconnect": replayed,
+        "writes_per_s": round(args.changes / elapsed, 1),
+    }
+    d = results["delivery"]
+    print(f"{args.subscribers} subscribers ({refused} refused), {args.changes} changes "
+          f"at {results['writes_per_s']}/s")
+    print(f"delivery latency p50 {d.get('p50_ms', 0):.2f} ms, p99 {d.get('p99_ms', 0):.2f} ms, "
+          f"max {d.get('max_ms', 0):.2f} ms; lost {lost}, out of order {out_of_order}, "
+          f"replayed after reconnect {replayed}/2")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--books", type=int, default=5_000)
+    parser.add_argument("--subscribers", type=int, default=100)
+    parser.add_argument("--changes", type=int, default=200)
+    parser.add_argument("--settle", type=float, default=1.0,
+                        help="seconds to wait for deliveries after writing")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", help="drive an already running server")
+    parser.add_argument("--json", metavar="PATH", help="write results to PATH")
+    args = parser.parse_args()
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    if args.url:
+        results = run(args.url, args)
+    else:
+        workdir = tempfile.mkdtemp(prefix="lms-events-")
+        try:
+            write_catalog(os.path.join(workdir, "books.csv"), args.books, args.seed)
+            os.chdir(workdir)
+            # werkzeug's threaded server starts a thread per request, so
+            # streams can't starve it the way they would a gthread worker.
+            os.environ.setdefault("SSE_MAX_SUBSCRIBERS", str(args.subscribers + 1))
+            os.environ.setdefault("SSE_MAX_WSGI_SUBSCRIBERS", str(args.subscribers + 1))
+            sys.path.insert(0, ROOT)
+            from werkzeug.serving import make_server
+            logging.getLogger("werkzeug").setLevel(logging.ERROR)
+            import server
+            httpd = make_server("127.0.0.1", 0, server.app, threaded=True)
+            threading.Thread(target=httpd.serve_forever, daemon=True).start()
+            results = run(f"http://127.0.0.1:{httpd.server_port}", args)
+            server.lms._closed.set()
+        finally:
+            os.chdir(ROOT)
+            shutil.rmtree(workdir, ignore_errors=True)
+    if json_path:
+        write_results(json_path, "events", vars(args), results)
+    sys.exit(1 if results["lost"] or results["out_of_order_streams"] else 0)
+
+
+if __name__ == "__main__":
+    main()
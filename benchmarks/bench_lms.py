@@ -0,0 +1,142 @@
+"""Micro-benchmarks of LMS and its HTTP routes on a synthetic catalog.
+
+    python benchmarks/bench_lms.py --books 100000 --loans 20000 --json out.json
+    python benchmarks/harness.py before.json out.json
+
+Covers startup (CSV, database, snapshot), search and search_books,
+display_books(sort_by_title=True), issue/return cycles, history pages
+and chat replies. Runs in a scratch directory; the CLI methods' output
+goes to /dev/null.
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+from harness import ROOT, measure, once, report, summarize, write_results
+from synth import fake_queries, seed_loans, write_catalog
+
+sys.path.insert(0, ROOT)
+
+from loans import LoanPolicy  # noqa: E402
+from main import LMS  # noqa: E402
+
+
+class BenchLMS(LMS):
+    SNAPSHOT_INTERVAL = 0
+
+    def __init__(self):
+        super().__init__("books.csv", "Bench Library", policy=LoanPolicy(max_loans=10 ** 9))
+
+
+def stop(lms, snapshot=False):
+    if not snapshot:
+        lms._closed.set()
+    lms.close()
+    lms.storage.close()
+
+
+@contextlib.contextmanager
+def quiet(stdin=""):
+    """ Feeds `stdin` to input() and discards printed output. """
+    saved = sys.stdin
+    sys.stdin = io.StringIO(stdin)
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            yield
+    finally:
+        sys.stdin = saved
+
+
+def run(args):
+    results = {}
+
+    def record(name, samples):
+        results[name] = summarize(samples)
+        report(name, results[name])
+
+    write_catalog("books.csv", args.books, args.seed)
+    lms, seconds = once(BenchLMS)
+    record("startup.csv_cold", [seconds])
+    _, seconds = once(lambda: seed_loans(lms, args.loans, seed=args.seed))
+    record("seed_loans", [seconds])
+    stop(lms)
+    lms, seconds = once(BenchLMS)
+    record("startup.database", [seconds])
+    stop(lms, snapshot=True)
+    lms, seconds = once(BenchLMS)
+    record("startup.snapshot", [seconds])
+
+    rng = random.Random(args.seed)
+    queries = iter(fake_queries(args.repeat * 4 + 8, args.seed))
+    _, seconds = once(lambda: lms.search("river king"))
+    record("search.first (builds index)", [seconds])
+    record("search", measure(lambda: lms.search(next(queries)), args.repeat))
+    record("search.limit10", measure(lambda: lms.search(next(queries), limit=10), args.repeat))
+
+    def search_books():
+        with quiet(next(queries) + "\n"):
+            lms.search_books()
+    record("search_books (CLI)", measure(search_books, max(args.repeat // 10, 3)))
+
+    def display_sorted():
+        with quiet():
+            lms.display_books(sort_by_title=True)
+    record("display_books(sort_by_title)", measure(display_sorted, 3))
+
+    free = [book_id for book_id, book in lms.books() if book.status == "Available"]
+    cycle = iter(rng.sample(free, min(len(free), args.repeat + 1)))
+
+    def issue_return():
+        book_id = next(cycle)
+        lms.issue(book_id, "Bench Reader")
+        lms.return_book(book_id)
+    record("issue+return", measure(issue_return, min(args.repeat, len(free) - 1)))
+    stop(lms)
+
+    # The routes go through a server module started in this directory.
+    import server
+    client = server.app.test_client()
+    record("GET /api/history", measure(lambda: client.get("/api/history?limit=100"), args.repeat))
+    record("GET /api/history?user=",
+           measure(lambda: client.get("/api/history?limit=100&user=Bench+Reader"), args.repeat))
+    messages = iter(["sherlock holmes mysteries", "something about dinosaurs",
+                     "books on signal processing"] + fake_queries(args.repeat * 2, args.seed + 1))
+    record("POST /api/chat",
+           measure(lambda: client.post("/api/chat", json={"message": next(messages)}), args.repeat))
+    record("GET /api/books?limit=50",
+           measure(lambda: client.get(f"/api/books?limit=50&offset={rng.randrange(args.books)}"),
+                   args.repeat))
+    server.lms._closed.set()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--books", type=int, default=100_000)
+    parser.add_argument("--loans", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", metavar="PATH", help="write results to PATH")
+    args = parser.parse_args()
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    workdir = tempfile.mkdtemp(prefix="lms-bench-")
+    os.chdir(workdir)
+    try:
+        print(f"{args.books} books, {args.loans} loans in {workdir}")
+        results = run(args)
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+    if json_path:
+        write_results(json_path, "lms", vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
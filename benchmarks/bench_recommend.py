@@ -0,0 +1,92 @@
+"""Top-k latency of recommender.Recommender on a synthetic catalog.
+
+    python benchmarks/bench_recommend.py --books 1000000
+
+Prints build time, matrix size, single-query latency percentiles and
+batched throughput. --dim defaults to what server.py runs with
+(RECOMMENDER_DIM, else recommender.DEFAULT_DIM).
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from recommender import DEFAULT_DIM, Recommender  # noqa: E402
+
+WORDS = ("history space war love river night king city garden stone light "
+         "ocean mind machine code signal power music house winter fire road "
+         "secret empire science data theory island world dream iron glass").split()
+SUBJECTS = ["fiction", "history", "science", "computer_science", "mathematics",
+            "philosophy", "economics", "data_science", "signal_processing"]
+
+
+class FakeBook:
+    __slots__ = ("title", "author", "subject")
+
+    def __init__(self, rng):
+        self.title = " ".join(rng.choices(WORDS, k=rng.randint(2, 5)))
+        self.author = f"author{rng.randrange(50000)}"
+        self.subject = rng.choice(SUBJECTS)
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--books", type=int, default=1_000_000)
+    parser.add_argument("--dim", type=int,
+                        default=int(os.environ.get("RECOMMENDER_DIM", DEFAULT_DIM)))
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--loans", type=int, default=100_000,
+                        help="loans to record, spread over --borrowers")
+    parser.add_argument("--borrowers", type=int, default=1000)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    books = ((str(i), FakeBook(rng)) for i in range(args.books))
+    rec = Recommender(dim=args.dim)
+    start = time.perf_counter()
+    rec.rebuild(books)
+    print(f"build: {args.books} books x {args.dim} dims in {time.perf_counter() - start:.1f}s, "
+          f"matrix {rec.matrix.nbytes / (1 << 20):.0f} MiB")
+
+    start = time.perf_counter()
+    for _ in range(args.loans):
+        rec.borrow(str(rng.randrange(args.books)), f"reader{rng.randrange(args.borrowers)}")
+    elapsed = time.perf_counter() - start
+    print(f"borrow: {args.loans} loans over {args.borrowers} borrowers in {elapsed:.1f}s "
+          f"({elapsed * 1e6 / max(args.loans, 1):.0f} us/loan)")
+
+    texts = [" ".join(rng.choices(WORDS, k=3)) for _ in range(args.queries)]
+    latencies = []
+    for text in texts:
+        start = time.perf_counter()
+        rec.query(text, args.k)
+        latencies.append((time.perf_counter() - start) * 1000)
+    print(f"query: p50 {percentile(latencies, 50):.1f} ms, "
+          f"p95 {percentile(latencies, 95):.1f} ms, max {max(latencies):.1f} ms")
+
+    start = time.perf_counter()
+    rec.query_many(texts, args.k)
+    elapsed = time.perf_counter() - start
+    print(f"batch: {len(texts)} queries in {elapsed * 1000:.0f} ms "
+          f"({elapsed * 1000 / len(texts):.2f} ms/query)")
+
+    start = time.perf_counter()
+    for i in range(min(args.queries, args.books)):
+        rec.similar(str(i), args.k)
+    elapsed = time.perf_counter() - start
+    print(f"similar: {elapsed * 1000 / min(args.queries, args.books):.1f} ms/book")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""LMS startup time: CSV cold load vs. database load vs. snapshot load.
+
+    python benchmarks/bench_startup.py --books 200000
+
+Runs in a scratch directory (books.csv, library.db and the snapshot are
+created there) and prints the wall time of each way of starting up, plus
+the first search, which pays for the deferred search index.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from catalog import Book, load_books, write_books  # noqa: E402
+from main import LMS  # noqa: E402
+
+WORDS = ("history space war love river night king city garden stone light "
+         "ocean mind machine code signal power music house winter fire road "
+         "secret empire science data theory island world dream iron glass").split()
+
+
+class BenchLMS(LMS):
+    SNAPSHOT_INTERVAL = 0
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    print(f"{label:<32}{time.perf_counter() - start:8.3f} s")
+    return result
+
+
+def start(issue=0):
+    lms = BenchLMS("books.csv", "Bench Library")
+    for book_id, _ in lms.books()[:issue]:
+        lms.issue(book_id, "Bench Reader")
+    return lms
+
+
+def stop(lms, snapshot=False):
+    if not snapshot:
+        lms._closed.set()
+    lms.close()
+    lms.storage.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--books", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="lms-bench-")
+    os.chdir(workdir)
+    try:
+        write_books("books.csv", (
+            Book(" ".join(rng.choices(WORDS, k=4)), f"author{rng.randrange(50000)}",
+                 rng.choice(["fiction", "history", "science"]), rng.randrange(50, 900),
+                 f"publisher{rng.randrange(200)}")
+            for _ in range(args.books)))
+        print(f"{args.books} books in {workdir}")
+        timed("parse books.csv", lambda: sum(1 for _ in load_books("books.csv")))
+        lms = timed("cold start (CSV -> new db)", lambda: start(issue=1000))
+        stop(lms)
+        lms = timed("warm start (db, no snapshot)", start)
+        stop(lms, snapshot=True)
+        lms = timed("warm start (snapshot)", start)
+        timed("first search (builds index)", lambda: lms.search("river king"))
+        timed("second search", lambda: lms.search("river king"))
+        stop(lms)
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
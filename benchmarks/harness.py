@@ -0,0 +1,131 @@
+"""Shared helpers for the benchmark scripts: timing, summaries and JSON
+result files that can be compared between commits.
+
+    python benchmarks/harness.py old.json new.json
+
+prints each benchmark's p50 and throughput side by side, flagging
+changes beyond --threshold (default 10%).
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def summarize(samples, elapsed=None):
+    """ Latency summary (milliseconds) of a list of durations in seconds.
+    Throughput uses `elapsed` wall time when given (concurrent runs),
+    otherwise the sum of the samples. """
+    if not samples:
+        return {"n": 0}
+    total = elapsed if elapsed is not None else sum(samples)
+    return {
+        "n": len(samples),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 4),
+        "p50_ms": round(percentile(samples, 50) * 1000, 4),
+        "p95_ms": round(percentile(samples, 95) * 1000, 4),
+        "p99_ms": round(percentile(samples, 99) * 1000, 4),
+        "max_ms": round(max(samples) * 1000, 4),
+        "ops_per_s": round(len(samples) / total, 2) if total else None,
+    }
+
+
+def measure(fn, repeat=100, warmup=1):
+    """ Calls fn() warmup + repeat times; returns the timed durations. """
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def once(fn):
+    """ (result, seconds) of a single call. """
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def report(name, summary):
+    if summary.get("n", 0) > 1:
+        print(f"{name:<34}{summary['p50_ms']:10.3f} ms p50 {summary['p95_ms']:10.3f} ms p95"
+              f"{summary['ops_per_s'] or 0:12.1f}/s")
+    else:
+        print(f"{name:<34}{summary.get('mean_ms', 0):10.3f} ms")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path, suite, params, results):
+    """ Writes one run's results with enough context (commit, Python,
+    machine, parameters) to tell whether two files are comparable. """
+    doc = {
+        "suite": suite,
+        "commit": git_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "params": params,
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(doc, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"results written to {path}")
+
+
+def compare(old, new, threshold=0.10):
+    """ Rows of (name, old p50, new p50, change) for benchmarks present in
+    both result documents; change > threshold is a slowdown. """
+    rows = []
+    for name, after in sorted(new["results"].items()):
+        before = old["results"].get(name)
+        if not before or "p50_ms" not in before or "p50_ms" not in after:
+            continue
+        change = (after["p50_ms"] - before["p50_ms"]) / before["p50_ms"] if before["p50_ms"] else 0.0
+        flag = "SLOWER" if change > threshold else "faster" if change < -threshold else ""
+        rows.append((name, before["p50_ms"], after["p50_ms"], change, flag))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args()
+    with open(args.old, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+    slower = 0
+    for name, before, after, change, flag in compare(old, new, args.threshold):
+        print(f"{name:<34}{before:10.3f} ->{after:10.3f} ms p50 {change:+8.1%} {flag}")
+        slower += flag == "SLOWER"
+    sys.exit(1 if slower else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""HTTP load generator for server.py.
+
+    python benchmarks/loadgen.py --books 50000 --concurrency 16 --duration 20
+    python benchmarks/loadgen.py --gunicorn 4 --concurrency 64 --json load.json
+    python benchmarks/loadgen.py --url http://127.0.0.1:5000 --concurrency 32
+
+By default the server runs in this process through the Flask test client
+(one client per thread), on a synthetic catalog in a scratch directory.
+--gunicorn N starts a local gunicorn with N workers on that catalog
+instead, and --url drives a server that is already running. Each thread
+loops over a weighted mix of catalog pages, searches, chat, history,
+stats and issue+return pairs. Afterwards the stats are verified, which
+catches lost updates under concurrency.
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter, defaultdict
+
+from harness import ROOT, summarize, write_results
+from synth import fake_queries, write_catalog
+
+CHAT = ["sherlock holmes", "dinosaurs", "anything on economics", "war novels",
+        "books about signal processing", "magic and wizards"]
+
+
+class TestClient:
+    """ Requests against the in-process Flask app. """
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None):
+        response = self.client.open(path, method=method, json=body)
+        data = response.get_data()
+        return response.status_code, data
+
+
+class HTTPClient:
+    """ Requests against a running server over HTTP, one connection per
+    request. """
+
+    def __init__(self, base):
+        self.base = base.rstrip("/")
+
+    def request(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base + path, data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=30) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+        except OSError:
+            return 0, b""
+
+
+def scenarios(rng, book_ids, queries, reader):
+    """ (weight, name, make) for each kind of request in the mix; make()
+    returns the [(method, path, body), ...] to send in order. """
+    def issue_return():
+        book_id = rng.choice(book_ids)
+        return [("POST", "/api/issue", {"book_id": book_id, "user_name": reader}),
+                ("POST", "/api/return", {"book_id": book_id})]
+
+    return [
+        (30, "GET /api/books?limit=50",
+         lambda: [("GET", f"/api/books?limit=50&offset={rng.randrange(len(book_ids))}", None)]),
+        (20, "GET /api/books?q=", lambda: [("GET", f"/api/books?q={rng.choice(queries)}&limit=20", None)]),
+        (10, "POST /api/chat", lambda: [("POST", "/api/chat", {"message": rng.choice(CHAT + queries)})]),
+        (10, "GET /api/history", lambda: [("GET", "/api/history?limit=50", None)]),
+        (10, "GET /api/stats", lambda: [("GET", "/api/stats", None)]),
+        (20, "issue+return", issue_return),
+    ]
+
+
+def worker(client, seed, args, book_ids, queries, deadline, out, lock):
+    rng = random.Random(seed)
+    mix = scenarios(rng, book_ids, queries, f"Load Reader {seed}")
+    weights = [w for w, _, _ in mix]
+    latencies, statuses = defaultdict(list), defaultdict(Counter)
+    done = 0
+    while time.perf_counter() < deadline and (not args.requests or done < args.requests):
+        _, name, make = rng.choices(mix, weights)[0]
+        for method, path, body in make():
+            start = time.perf_counter()
+            status, _ = client.request(method, path, body)
+            latencies[name].append(time.perf_counter() - start)
+            statuses[name][status] += 1
+            done += 1
+            if path == "/api/issue" and status != 200:
+                break       # someone else holds it; don't return their loan
+    with lock:
+        for name, samples in latencies.items():
+            out["latencies"][name].extend(samples)
+            out["statuses"][name].update(statuses[name])
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(workers, workdir):
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "server:app", "-w", str(workers), "--threads", "4",
+         "-b", f"127.0.0.1:{port}", "--pythonpath", ROOT, "--chdir", workdir],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(600):
+        if proc.poll() is not None:
+            sys.exit("gunicorn exited during startup (is it installed?)")
+        if HTTPClient(base).request("GET", "/api/stats")[0] == 200:
+            return proc, base
+        time.sleep(0.1)
+    proc.terminate()
+    sys.exit("gunicorn did not come up")
+
+
+def run(args, make_client):
+    probe = make_client()
+    status, body = probe.request("GET", "/api/books?status=available&limit=1000")
+    if status != 200:
+        sys.exit(f"server answered {status} to the catalog probe")
+    book_ids = [row["id"] for row in json.loads(body)]
+    queries = fake_queries(200, args.seed)
+    out = {"latencies": defaultdict(list), "statuses": defaultdict(Counter)}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+    threads = [threading.Thread(target=worker, args=(make_client(), args.seed + i, args, book_ids,
+                                                     queries, deadline, out, lock))
+               for i in range(args.concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    results = {}
+    total = 0
+    for name in sorted(out["latencies"]):
+        samples = out["latencies"][name]
+        total += len(samples)
+        results[name] = dict(summarize(samples, elapsed), statuses=dict(out["statuses"][name]))
+        print(f"{name:<26}{len(samples):8d} req {results[name]['p50_ms']:9.2f} ms p50 "
+              f"{results[name]['p99_ms']:9.2f} ms p99  {dict(out['statuses'][name])}")
+    _, body = probe.request("GET", "/api/stats?verify=1")
+    stats = json.loads(body)
+    results["total"] = {"requests": total, "seconds": round(elapsed, 3),
+                        "requests_per_s": round(total / elapsed, 1),
+                        "stats_consistent": stats.get("consistent")}
+    print(f"{total} requests in {elapsed:.1f}s = {total / elapsed:.0f} req/s at concurrency "
+          f"{args.concurrency}; stats consistent: {stats.get('consistent')}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--books", type=int, default=50_000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--requests", type=int, default=0, help="per thread (0 = until --duration)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--gunicorn", type=int, metavar="WORKERS", default=0)
+    parser.add_argument("--url", help="drive an already running server")
+    parser.add_argument("--json", metavar="PATH", help="write results to PATH")
+    args = parser.parse_args()
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    if args.url:
+        results = run(args, lambda: HTTPClient(args.url))
+    else:
+        workdir = tempfile.mkdtemp(prefix="lms-load-")
+        proc = None
+        try:
+            write_catalog(os.path.join(workdir, "books.csv"), args.books, args.seed)
+            if args.gunicorn:
+                proc, base = start_gunicorn(args.gunicorn, workdir)
+                results = run(args, lambda: HTTPClient(base))
+            else:
+                os.chdir(workdir)
+                sys.path.insert(0, ROOT)
+                import server
+                results = run(args, lambda: TestClient(server.app))
+                server.lms._closed.set()
+        finally:
+            if proc is not None:
+                proc.terminate()
+                proc.wait()
+            os.chdir(ROOT)
+            shutil.rmtree(workdir, ignore_errors=True)
+    if json_path:
+        write_results(json_path, "load", vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Synthetic catalogs and loan histories for benchmarks.
+
+    python benchmarks/synth.py --books 1000000 --loans 100000 --dir /tmp/lms-data
+
+writes books.csv (and, with --loans, library.db, events.jsonl and
+issued_books.csv) into --dir. Titles repeat as several copies, subjects
+and publishers come from small vocabularies like the real catalog, and
+everything is derived from --seed, so two runs produce the same data.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from catalog import Book, write_books  # noqa: E402
+
+WORDS = ("history space war love river night king city garden stone light "
+         "ocean mind machine code signal power music house winter fire road "
+         "secret empire science data theory island world dream iron glass").split()
+SUBJECTS = ["fiction", "history", "science", "computer_science", "mathematics",
+            "philosophy", "economics", "data_science", "signal_processing"]
+FIRST_NAMES = ("asha ravi meera arjun kavya rohan nisha vikram priya dev "
+               "sara omar lena tomas yuki ana li mateo zara noah").split()
+
+LOAN_BATCH = 2000
+
+
+def fake_books(n, seed=1, max_copies=4):
+    """ Yields `n` Books; each title comes in 1..max_copies copies. """
+    rng = random.Random(seed)
+    made = 0
+    while made < n:
+        book = (" ".join(rng.choices(WORDS, k=rng.randint(2, 5))).title(),
+                f"Author{rng.randrange(50000)}", rng.choice(SUBJECTS),
+                rng.randrange(50, 900), f"Publisher{rng.randrange(200)}")
+        for _ in range(min(rng.randint(1, max_copies), n - made)):
+            yield Book(*book)
+            made += 1
+
+
+def fake_readers(n, seed=1):
+    rng = random.Random(seed)
+    return [f"{rng.choice(FIRST_NAMES).title()} {rng.choice(FIRST_NAMES).title()}{i}"
+            for i in range(n)]
+
+
+def write_catalog(path, n, seed=1):
+    write_books(path, fake_books(n, seed))
+
+
+def fake_queries(n, seed=1):
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(WORDS, k=rng.randint(1, 3))) for _ in range(n)]
+
+
+def seed_loans(lms, loans, readers=1000, returned=0.7, seed=1):
+    """ Issues `loans` random books through LMS (in batches, so the event
+    log, ledgers and database all fill the way production would) and
+    returns about `returned` of them, leaving the rest on loan. Readers
+    stay under the loan limit. Returns the IDs still on loan. """
+    rng = random.Random(seed)
+    names = fake_readers(readers, seed)
+    ids = [book_id for book_id, _ in lms.books()]
+    out = []
+    for start in range(0, loans, LOAN_BATCH):
+        picks = rng.sample(ids, min(LOAN_BATCH, loans - start, len(ids)))
+        results = lms.issue_many((book_id, rng.choice(names)) for book_id in picks)
+        issued = [r.book_id for r in results if r.ok]
+        back = [book_id for book_id in issued if rng.random() < returned]
+        lms.return_many(back)
+        kept = set(back)
+        out.extend(book_id for book_id in issued if book_id not in kept)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--books", type=int, default=100_000)
+    parser.add_argument("--loans", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--dir", default=".")
+    args = parser.parse_args()
+
+    os.makedirs(args.dir, exist_ok=True)
+    os.chdir(args.dir)
+    start = time.perf_counter()
+    write_catalog("books.csv", args.books, args.seed)
+    print(f"{args.books} books written to {os.path.abspath('books.csv')} "
+          f"in {time.perf_counter() - start:.1f}s")
+    if args.loans:
+        from loans import LoanPolicy
+        from main import LMS
+
+        # Lift the per-member limit so the history can be as long as asked.
+        lms = LMS("books.csv", "Synthetic Library", policy=LoanPolicy(max_loans=10 ** 9))
+        start = time.perf_counter()
+        on_loan = seed_loans(lms, args.loans, seed=args.seed)
+        print(f"{args.loans} loans ({len(on_loan)} still out) in {time.perf_counter() - start:.1f}s")
+        lms.close()
+
+
+if __name__ == "__main__":
+    main()
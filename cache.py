@@ -0,0 +1,192 @@
+# Small thread-safe caches used by the web API.
+
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def approx_size(value):
+    """ Rough byte size of a cached value: exact for str/bytes, summed
+    over tuples and lists, sys.getsizeof for anything else. """
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sum(approx_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """ A bounded mapping that evicts the least recently used entry.
+    Keys are expected to embed the catalog version they were computed
+    at, so stale entries are never hit and simply age out.
+
+    Optionally entries also expire `ttl` seconds after being stored (for
+    data no version counter covers), and the total `approx_size` of the
+    values is kept under `maxbytes`. Hits, misses and evictions are
+    counted for stats(). """
+
+    shared = False
+
+    def __init__(self, maxsize=128, ttl=None, maxbytes=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.hits = self.misses = self.evictions = 0
+        self.bytes = 0
+        self._data = OrderedDict()      # key -> (value, expires, size)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            value, expires, size = self._data[key]
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                self.bytes -= size
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = approx_size(value) if self.maxbytes else 0
+        if self.maxbytes and size > self.maxbytes:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+            self._data[key] = (value, expires, size)
+            self.bytes += size
+            while len(self._data) > self.maxsize or (self.maxbytes and self.bytes > self.maxbytes):
+                _, (_, _, evicted) = self._data.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": "memory",
+                "entries": len(self._data),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCache:
+    """ The LRUCache interface over a SQLite file, so the gunicorn workers
+    of one host share what any of them computed. Keys are stored by
+    repr() and values pickled; keys must therefore embed a version that
+    means the same in every process (see server.cache_version).
+
+    Eviction is by least recently *written* (a hit doesn't write), and
+    runs every PRUNE_EVERY puts rather than on each one. Hit and miss
+    counts are per process. """
+
+    shared = True
+    PRUNE_EVERY = 200
+
+    def __init__(self, path="response_cache.db", maxsize=10000, ttl=None):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = self.misses = self.evictions = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=5, isolation_level=None,
+                                    check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS cache ("
+                          "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                          "expires REAL, written REAL NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS cache_written ON cache(written)")
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                row = self.conn.execute("SELECT value, expires FROM cache WHERE key = ?",
+                                        (repr(key),)).fetchone()
+            except sqlite3.OperationalError:     # busy: treat as a miss
+                row = None
+            if row is None or (row[1] is not None and row[1] <= time.time()):
+                self.misses += 1
+                return default
+            self.hits += 1
+        return pickle.loads(row[0])
+
+    def put(self, key, value):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        with self._lock:
+            try:
+                self.conn.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                                  (repr(key), blob, now + self.ttl if self.ttl else None, now))
+                self._puts += 1
+                if self._puts % self.PRUNE_EVERY == 0:
+                    self._prune(now)
+            except sqlite3.OperationalError:
+                pass    # another worker holds the write lock; caching is best effort
+
+    def _prune(self, now):
+        cur = self.conn.execute("DELETE FROM cache WHERE expires <= ?", (now,))
+        self.evictions += cur.rowcount
+        cur = self.conn.execute(
+            "DELETE FROM cache WHERE written < (SELECT written FROM cache "
+            "ORDER BY written DESC LIMIT 1 OFFSET ?)", (self.maxsize - 1,))
+        self.evictions += cur.rowcount
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM cache")
+
+    def stats(self):
+        with self._lock:
+            entries, size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM cache").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "backend": f"sqlite:{self.path}",
+                "entries": entries,
+                "bytes": size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+def make_cache(spec="", maxsize=1024, ttl=None, maxbytes=None):
+    """ A cache from a spec string: "" or "memory" for an LRUCache,
+    "sqlite:<path>" for a SQLiteCache shared between processes. """
+    if spec.startswith("sqlite:"):
+        return SQLiteCache(os.path.expanduser(spec[len("sqlite:"):]) or "response_cache.db",
+                           maxsize=maxsize, ttl=ttl)
+    if spec not in ("", "memory"):
+        raise ValueError(f"unknown cache backend {spec!r}")
+    return LRUCache(maxsize, ttl=ttl, maxbytes=maxbytes)
@@ -0,0 +1,115 @@
+# Compact book records and the streaming books.csv loader used by LMS.
+
+import csv
+import sys
+
+AVAILABLE = "Available"
+ISSUED = "Already Issued"
+
+CSV_HEADER = ["Title", "Author", "Subject", "Extent", "Publisher"]
+
+
+class Book:
+    """ One physical book in the catalog. Uses __slots__ so a large catalog
+    doesn't pay for a per-book __dict__; the repetitive Subject, Publisher
+    and Status strings are interned and shared between records. """
+
+    __slots__ = ("title", "author", "subject", "extent", "publisher",
+                 "lender_name", "issue_date", "status", "due_date", "member_id")
+
+    def __init__(self, title, author="", subject="", extent=None, publisher="",
+                 lender_name="", issue_date="", status=AVAILABLE, due_date="",
+                 member_id=""):
+        self.title = title
+        self.author = author
+        self.subject = sys.intern(subject)
+        self.extent = extent
+        self.publisher = sys.intern(publisher)
+        self.lender_name = lender_name
+        self.issue_date = issue_date
+        self.status = sys.intern(status)
+        self.due_date = due_date
+        self.member_id = member_id
+
+    @classmethod
+    def from_row(cls, row):
+        """ Builds a Book from a [Title, Author, Subject, Extent, Publisher] row. """
+        row = list(row)
+        row += [""] * (5 - len(row))
+        title, author, subject, extent, publisher = (v.strip() for v in row[:5])
+        return cls(title, author, subject, int(extent) if extent.isdigit() else None, publisher)
+
+    def to_row(self):
+        return [self.title, self.author, self.subject,
+                "" if self.extent is None else self.extent, self.publisher]
+
+    def search_text(self):
+        """ Text the search index matches queries against. """
+        return f"{self.title} {self.author}"
+
+    def to_dict(self):
+        """ JSON shape used by the web API (keeps the legacy key names). """
+        return {
+            "books_title": self.title,
+            "author": self.author,
+            "subject": self.subject,
+            "extent": self.extent,
+            "publisher": self.publisher,
+            "lender_name": self.lender_name,
+            "Issue_date": self.issue_date,
+            "Status": self.status,
+            "due_date": self.due_date,
+            "member_id": self.member_id,
+        }
+
+
+def load_books(path):
+    """ Streams Book records out of a catalog CSV file on disk. """
+    with open(path, newline="", encoding="utf-8") as f:
+        yield from read_books(f)
+
+
+def read_books(f):
+    """ Streams Book records out of an open text stream in catalog CSV
+    format, one row at a time. Columns are located by the header row when
+    present, so files with reordered or missing columns still load; blank
+    rows are skipped. """
+    reader = csv.reader(f)
+    first = next(reader, None)
+    if first is None:
+        return
+    names = [c.strip().lower() for c in first]
+    if "title" in names:
+        order = [names.index(c.lower()) if c.lower() in names else None
+                 for c in CSV_HEADER]
+    else:
+        order = list(range(len(CSV_HEADER)))
+        reader = _chain_row(first, reader)
+    for row in reader:
+        if not row or not any(row):
+            continue
+        yield Book.from_row([
+            row[i] if i is not None and i < len(row) else "" for i in order
+        ])
+
+
+def _chain_row(first, reader):
+    yield first
+    yield from reader
+
+
+def write_books(path, books):
+    """ Writes Book records back out as a catalog CSV with a header row. """
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        writer.writerows(book.to_row() for book in books)
+
+
+def append_book(path, book):
+    """ Appends one Book row to a catalog CSV, adding the header to a new file. """
+    with open(path, "a", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        if f.tell() == 0:
+            writer.writerow(CSV_HEADER)
+        writer.writerow(book.to_row())
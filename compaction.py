@@ -0,0 +1,370 @@
+# Rotation, compaction and archival of the append-only logs, meant to be
+# run periodically (cron, a scheduler dyno) like reminders.py.
+
+import argparse
+import datetime
+import gzip
+import json
+import os
+import shutil
+import threading
+import time
+from collections import Counter, namedtuple
+
+from events import DATE_FORMAT, to_timestamp
+from loans import LoanPolicy
+
+MANIFEST = "manifest.json"
+SUMMARY = "loan_summary.json"
+
+
+class CompactionPolicy(namedtuple("CompactionPolicy",
+                                  "max_bytes max_age_days keep_events segment_events retain_days")):
+    """ When to rotate and how long to keep what was rotated out.
+
+    Events older than max_age_days leave the live log, and so do the oldest
+    ones while the log is over max_bytes (down to half of it), but the
+    newest keep_events always stay. They are archived as gzip segments of
+    up to segment_events each. Ledgers rotate on the same size and age.
+    Segments older than retain_days are deleted (None keeps them forever);
+    the loans in them are already counted in the loan summary. """
+
+    def __new__(cls, max_bytes=64 << 20, max_age_days=90, keep_events=1000,
+                segment_events=20_000, retain_days=None):
+        return super().__new__(cls, max_bytes, max_age_days, keep_events,
+                               segment_events, retain_days)
+
+
+def _new_summary():
+    return {"through_seq": -1, "closed_loans": 0, "loan_days": 0.0,
+            "by_month": {}, "by_book": {}, "by_user": {}, "open": {}}
+
+
+def fold_loans(summary, event):
+    """ Counts the loan `event` closes into `summary`. Issues are held in
+    summary["open"] until their return is folded too, so a loan that is
+    still running (or whose return is still in the live log) isn't counted
+    yet. """
+    if event["seq"] <= summary["through_seq"]:
+        return
+    summary["through_seq"] = event["seq"]
+    book = event["book_id"] or event["book"]
+    if event["action"] == "issued":
+        summary["open"][book] = [event["user"], event["date"]]
+    elif event["action"] == "returned" and book in summary["open"]:
+        user, issued = summary["open"].pop(book)
+        summary["closed_loans"] += 1
+        summary["loan_days"] += max(to_timestamp(event["date"]) - to_timestamp(issued), 0) / 86400
+        for counts, key in ((summary["by_month"], issued[:7]), (summary["by_book"], book),
+                            (summary["by_user"], user.strip().lower())):
+            counts[key] = counts.get(key, 0) + 1
+
+
+def _write_json(path, data):
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+class EventArchive:
+    """ Gzip segments of rotated-out events and ledger lines in one
+    directory, listed in manifest.json with their sequence and time ranges,
+    so a history query only opens the segments its range overlaps. Closed
+    loans from archived events are folded into loan_summary.json as they
+    are archived.
+
+    Readers in other processes see a new segment once the manifest naming
+    it is replaced; the manifest is reread only when its mtime changes. """
+
+    def __init__(self, directory="archive"):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._manifest = None
+        self._mtime = None
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def manifest(self):
+        """ {"segments": [...], "ledgers": [...]}; segments are ordered by
+        sequence number, each {file, first_seq, last_seq, first_ts, last_ts,
+        count, bytes}. """
+        with self._lock:
+            try:
+                mtime = os.stat(self._path(MANIFEST)).st_mtime_ns
+            except FileNotFoundError:
+                return {"segments": [], "ledgers": []}
+            if mtime != self._mtime:
+                with open(self._path(MANIFEST), encoding="utf-8") as f:
+                    self._manifest = json.load(f)
+                self._mtime = mtime
+            return self._manifest
+
+    def _save(self, manifest):
+        os.makedirs(self.directory, exist_ok=True)
+        _write_json(self._path(MANIFEST), manifest)
+
+    def summary(self):
+        try:
+            with open(self._path(SUMMARY), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return _new_summary()
+
+    def _segment_lines(self, segment, below):
+        with gzip.open(self._path(segment["file"]), "rb") as f:
+            for line in f:
+                event = json.loads(line)
+                if event["seq"] >= below:
+                    break
+                yield event
+
+    def query(self, limit, below, user=None, book_id=None, since=None, until=None):
+        """ Newest-first archived events with seq < `below`, filtered like
+        EventLog.query. Segments outside the seq and time range are skipped
+        without being opened. """
+        events = []
+        want_user = user.strip().lower() if user else None
+        for segment in reversed(self.manifest()["segments"]):
+            if len(events) >= limit:
+                break
+            if segment["first_seq"] >= below:
+                continue
+            if (since is not None and segment["last_ts"] < since) or \
+                    (until is not None and segment["first_ts"] >= until):
+                continue
+            matches = []
+            for event in self._segment_lines(segment, below):
+                if book_id and event["book_id"] != str(book_id):
+                    continue
+                if want_user and event["user"].strip().lower() != want_user:
+                    continue
+                if since is not None or until is not None:
+                    ts = to_timestamp(event["date"])
+                    if (since is not None and ts < since) or (until is not None and ts >= until):
+                        continue
+                matches.append(event)
+            events.extend(reversed(matches[-(limit - len(events)):]))
+        return events
+
+    def range(self, first, below, limit):
+        """ Archived events with first <= seq < below, oldest first. """
+        events = []
+        for segment in self.manifest()["segments"]:
+            if len(events) >= limit:
+                break
+            if segment["last_seq"] < first or segment["first_seq"] >= below:
+                continue
+            for event in self._segment_lines(segment, below):
+                if event["seq"] >= first:
+                    events.append(event)
+                    if len(events) >= limit:
+                        break
+        return events
+
+    def store_events(self, items, per_segment):
+        """ EventLog.rotate sink: writes (seq, ts, line) items as segments
+        of up to `per_segment` events, folds their closed loans into the
+        summary and lists the segments in the manifest. Returns the new
+        manifest entries. """
+        os.makedirs(self.directory, exist_ok=True)
+        summary = self.summary()
+        added, chunk = [], []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= per_segment:
+                added.append(self._write_segment(chunk, summary))
+                chunk = []
+        if chunk:
+            added.append(self._write_segment(chunk, summary))
+        # The summary first: if we stop before the manifest, the same events
+        # are archived again next time and through_seq keeps them from being
+        # counted twice.
+        _write_json(self._path(SUMMARY), summary)
+        manifest = dict(self.manifest())
+        names = {segment["file"] for segment in added}
+        manifest["segments"] = [s for s in manifest["segments"] if s["file"] not in names] + added
+        self._save(manifest)
+        return added
+
+    def _write_segment(self, chunk, summary):
+        first, last = chunk[0][0], chunk[-1][0]
+        name = f"events-{first:010d}-{last:010d}.jsonl.gz"
+        stamps = []
+        with gzip.open(self._path(name + ".tmp"), "wb") as out:
+            for _, _, line in chunk:
+                out.write(line)
+                event = json.loads(line)
+                stamps.append(to_timestamp(event["date"]))
+                fold_loans(summary, event)
+        os.replace(self._path(name + ".tmp"), self._path(name))
+        return {"file": name, "first_seq": first, "last_seq": last,
+                "first_ts": min(stamps), "last_ts": max(stamps), "count": len(chunk),
+                "bytes": os.path.getsize(self._path(name))}
+
+    def store_ledger(self, path, kind):
+        """ Compresses a rotated-out ledger file into the archive, lists it
+        in the manifest and removes the original. """
+        with open(path, "rb") as f:
+            lines = f.read().splitlines()
+        if not lines:
+            os.remove(path)
+            return None
+        first, last = (self._ledger_date(lines[0]), self._ledger_date(lines[-1]))
+        stamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        stem, ext = os.path.splitext(kind)
+        name = f"{stem}-{stamp}{ext}.gz"
+        os.makedirs(self.directory, exist_ok=True)
+        with open(path, "rb") as src, gzip.open(self._path(name + ".tmp"), "wb") as out:
+            shutil.copyfileobj(src, out)
+        os.replace(self._path(name + ".tmp"), self._path(name))
+        entry = {"file": name, "kind": kind, "first_date": first, "last_date": last,
+                 "lines": len(lines), "bytes": os.path.getsize(self._path(name))}
+        manifest = dict(self.manifest())
+        manifest["ledgers"] = manifest["ledgers"] + [entry]
+        self._save(manifest)
+        os.remove(path)
+        return entry
+
+    @staticmethod
+    def _ledger_date(line):
+        """ The date ending an issued_books.csv line or an issue_log.txt
+        entry ("... on <date>"), or "" if it has none. """
+        text = line.decode("utf-8", "replace").strip()
+        date = text.rpartition(",")[2].strip() if "," in text else ""
+        if len(date) != 19:
+            date = text.rpartition(" on ")[2].strip()
+        return date if len(date) == 19 else ""
+
+    def prune(self, older_than):
+        """ Deletes segments and ledgers whose newest entry is before the
+        timestamp `older_than`. Returns how many files went. """
+        manifest = dict(self.manifest())
+        cutoff = datetime.datetime.fromtimestamp(older_than).strftime(DATE_FORMAT)
+        # Only events already folded into the summary may go.
+        folded = self.summary()["through_seq"]
+        keep_segments = [s for s in manifest["segments"]
+                         if s["last_ts"] >= older_than or s["last_seq"] > folded]
+        keep_ledgers = [l for l in manifest["ledgers"] if not l["last_date"] or l["last_date"] >= cutoff]
+        gone = [s["file"] for s in manifest["segments"] if s not in keep_segments] + \
+               [l["file"] for l in manifest["ledgers"] if l not in keep_ledgers]
+        if gone:
+            manifest["segments"], manifest["ledgers"] = keep_segments, keep_ledgers
+            self._save(manifest)
+            for name in gone:
+                try:
+                    os.remove(self._path(name))
+                except FileNotFoundError:
+                    pass
+        return len(gone)
+
+    def stats(self):
+        manifest = self.manifest()
+        return {
+            "segments": len(manifest["segments"]),
+            "archived_events": sum(s["count"] for s in manifest["segments"]),
+            "ledgers": len(manifest["ledgers"]),
+            "bytes": sum(s["bytes"] for s in manifest["segments"])
+                     + sum(l["bytes"] for l in manifest["ledgers"]),
+        }
+
+
+def _ledger_due(path, policy, keep_since):
+    """ Whether a ledger is over the size limit or starts before `keep_since`. """
+    try:
+        size = os.path.getsize(path)
+    except FileNotFoundError:
+        return False
+    if not size:
+        return False
+    if policy.max_bytes and size > policy.max_bytes:
+        return True
+    with open(path, "rb") as f:
+        first = EventArchive._ledger_date(f.readline())
+    return bool(first) and keep_since is not None and to_timestamp(first) < keep_since
+
+
+def compact(lms, policy=None, now=None):
+    """ One compaction pass over an LMS's logs: rotates old events into the
+    archive, rotates issued_books.csv when it is too big or too old, moves
+    the legacy issue_log.txt away once it has been imported, and applies
+    the retention period. Returns a report of what was done. """
+    policy = policy or CompactionPolicy()
+    archive = lms.archive
+    now = now if now is not None else time.time()
+    keep_since = now - policy.max_age_days * 86400 if policy.max_age_days else None
+    report = {"events_archived": 0, "segments": [], "ledgers": [], "pruned": 0}
+
+    def sink(items):
+        report["segments"] = archive.store_events(items, policy.segment_events)
+
+    report["events_archived"] = lms.events.rotate(keep_since, policy.max_bytes,
+                                                  policy.keep_events, sink)
+
+    # A ".rotating" file is one a previous pass renamed but didn't finish.
+    ledger = lms.issued_file
+    if os.path.exists(ledger + ".rotating") or (
+            _ledger_due(ledger, policy, keep_since) and lms.writer.rotate(ledger, ledger + ".rotating")):
+        report["ledgers"].append(archive.store_ledger(ledger + ".rotating", "issued_books.csv"))
+    if len(lms.events) and os.path.exists(lms.log_file) and os.path.getsize(lms.log_file):
+        os.replace(lms.log_file, lms.log_file + ".rotating")
+        report["ledgers"].append(archive.store_ledger(lms.log_file + ".rotating", "issue_log.txt"))
+
+    if policy.retain_days:
+        report["pruned"] = archive.prune(now - policy.retain_days * 86400)
+    report["live_events"] = len(lms.events) - lms.events.base
+    report["live_bytes"] = os.path.getsize(lms.events.path)
+    report["archive"] = archive.stats()
+    return report
+
+
+def loan_summary(archive):
+    """ The archived loan summary for display: the open-loan bookkeeping is
+    dropped, the busiest books and borrowers are cut to the top ten and the
+    average loan length is worked out. """
+    summary = archive.summary()
+    closed = summary["closed_loans"]
+    return {
+        "closed_loans": closed,
+        "average_loan_days": round(summary["loan_days"] / closed, 2) if closed else None,
+        "by_month": summary["by_month"],
+        "top_books": Counter(summary["by_book"]).most_common(10),
+        "top_borrowers": Counter(summary["by_user"]).most_common(10),
+        "through_seq": summary["through_seq"],
+    }
+
+
+def main():
+    from main import LMS
+
+    parser = argparse.ArgumentParser(description="Rotate and archive the LMS logs.")
+    defaults = CompactionPolicy()
+    parser.add_argument("--max-mb", type=float, default=defaults.max_bytes / (1 << 20),
+                        help="rotate the live logs above this size")
+    parser.add_argument("--max-age-days", type=int, default=defaults.max_age_days,
+                        help="archive events older than this")
+    parser.add_argument("--keep-events", type=int, default=defaults.keep_events)
+    parser.add_argument("--segment-events", type=int, default=defaults.segment_events)
+    parser.add_argument("--retain-days", type=int, default=None,
+                        help="delete archive segments older than this (default: keep)")
+    parser.add_argument("--loop", type=int, default=0, metavar="SECONDS",
+                        help="keep running, compacting every SECONDS")
+    args = parser.parse_args()
+    policy = CompactionPolicy(int(args.max_mb * (1 << 20)), args.max_age_days, args.keep_events,
+                              args.segment_events, args.retain_days)
+    lms = LMS("books.csv", "Central Library UOH", policy=LoanPolicy.from_env())
+    while True:
+        report = compact(lms, policy)
+        print(f"{report['events_archived']} event(s) archived into {len(report['segments'])} "
+              f"segment(s), {len(report['ledgers'])} ledger(s) rotated, {report['pruned']} "
+              f"file(s) pruned; live log {report['live_events']} events, "
+              f"{report['live_bytes'] / 1024:.0f} KiB; archive {report['archive']['bytes'] / 1024:.0f} KiB.")
+        if not args.loop:
+            break
+        time.sleep(args.loop)
+
+
+if __name__ == "__main__":
+    main()
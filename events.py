@@ -0,0 +1,353 @@
+# Append-only event log (JSON Lines) with a fixed-width offset index.
+
+import bisect
+import contextlib
+import csv
+import datetime
+import json
+import os
+import re
+import shutil
+import struct
+import threading
+import zlib
+from array import array
+
+from writer import WRITE_SECONDS
+
+try:
+    import fcntl
+except ImportError:     # Windows: single-process CLI use only
+    fcntl = None
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+LEGACY_LINE = re.compile(r"(.*?) (issued|returned) '(.*?)' on (.*)")
+
+
+def user_key(user):
+    return zlib.crc32(user.strip().lower().encode("utf-8"))
+
+
+def to_timestamp(date):
+    return datetime.datetime.strptime(date, DATE_FORMAT).timestamp()
+
+
+class EventLog:
+    """ Records issue/return/add/delete events, one JSON object per line.
+
+    Alongside the log, `<path>.idx` holds one fixed-width record per event
+    (byte offset, timestamp, book ID, user hash). The index is small enough
+    to keep in memory, so queries filter and page through it newest-first
+    and only read the matching lines; new events written by other
+    processes are picked up by reading just the tail of the index.
+
+    Sequence numbers count every event ever written. rotate() moves the
+    oldest ones out to an `archive` (see compaction.EventArchive), after
+    which record i of the live index holds event `base + i`; queries that
+    reach further back than the live log continue into the archive. """
+
+    RECORD = struct.Struct("<QdII")
+
+    def __init__(self, path="events.jsonl", archive=None):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.lock_path = path + ".lock"
+        self.rotate_lock_path = path + ".rotate"
+        self.swap_lock_path = path + ".swap"
+        self.archive = archive
+        self._lock = threading.Lock()           # held while appending or rotating
+        self._swap_lock = threading.Lock()      # without fcntl: reading or swapping files
+        self._index_lock = threading.Lock()     # held while growing the arrays
+        self._rotate_lock = threading.Lock()    # held for a whole rotate()
+        self._reset()
+        for file in (self.path, self.index_path):
+            if not os.path.exists(file):
+                open(file, "ab").close()
+        # The first load runs under the append lock, so repairing a
+        # half-written index can't race another process's append.
+        with self._exclusive():
+            pass
+
+    def __len__(self):
+        """ Events written so far, archived ones included (the next seq). """
+        with self._shared():
+            self._refresh()
+            return self.base + len(self._offsets)
+
+    def _reset(self):
+        self.base = 0
+        self._inode = None
+        self._offsets = array("Q")
+        self._times = array("d")
+        self._books = array("I")
+        self._users = array("I")
+
+    @contextlib.contextmanager
+    def _flock(self, mode, path=None):
+        # A fresh descriptor each time: flock() locks belong to the open
+        # file, so threads sharing one descriptor wouldn't exclude each other.
+        with open(path or self.lock_path, "ab") as f:
+            fcntl.flock(f, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @contextlib.contextmanager
+    def _exclusive(self):
+        """ Serializes appends and rotation between threads and, where
+        supported, between processes sharing the same log. """
+        with self._lock, (self._flock(fcntl.LOCK_EX) if fcntl else contextlib.nullcontext()):
+            self._refresh()
+            with open(self.index_path, "ab") as index:
+                yield index
+
+    def _shared(self):
+        """ Held while reading, so a rotation never swaps the files between
+        reading the index and the lines it points to. It is a different
+        lock from the one appends take, so appends never wait for readers;
+        only the swap at the end of rotate() does. """
+        if fcntl:
+            return self._flock(fcntl.LOCK_SH, self.swap_lock_path)
+        return self._swap_lock
+
+    def _swapping(self):
+        """ Excludes readers while rotate() replaces the files. """
+        if fcntl:
+            return self._flock(fcntl.LOCK_EX, self.swap_lock_path)
+        return self._swap_lock
+
+    def _refresh(self):
+        with self._index_lock:
+            stat = os.stat(self.index_path)
+            reload = stat.st_ino != self._inode
+            if reload:
+                # First load, or another process rotated the log.
+                self._reset()
+                self._inode = stat.st_ino
+                self.base = self._first_seq()
+            known = len(self._offsets) * self.RECORD.size
+            if stat.st_size > known:
+                with open(self.index_path, "rb") as f:
+                    f.seek(known)
+                    data = f.read()
+                usable = len(data) - len(data) % self.RECORD.size
+                for offset, ts, book, user in self.RECORD.iter_unpack(data[:usable]):
+                    self._offsets.append(offset)
+                    self._times.append(ts)
+                    self._books.append(book)
+                    self._users.append(user)
+            if reload and not self._consistent():
+                self._rebuild_index()
+
+    def _first_seq(self):
+        with open(self.path, "rb") as f:
+            line = f.readline()
+        return json.loads(line)["seq"] if line.strip() else 0
+
+    def _consistent(self):
+        """ Whether the index matches the log; it won't if a rotation was
+        interrupted between replacing the one and the other, or a crash
+        cut the first append short. """
+        n = len(self._offsets)
+        if not n:
+            return os.path.getsize(self.path) == 0 and os.path.getsize(self.index_path) == 0
+        if self._offsets[0] != 0 or self._offsets[-1] >= os.path.getsize(self.path):
+            return False
+        with open(self.path, "rb") as f:
+            f.seek(self._offsets[-1])
+            try:
+                return json.loads(f.readline())["seq"] == self.base + n - 1
+            except ValueError:
+                return False
+
+    def _rebuild_index(self):
+        records, offset, last = [], 0, 0.0
+        with open(self.path, "rb") as f:
+            for line in f:
+                event = json.loads(line)
+                last = max(to_timestamp(event["date"]), last)
+                records.append(self.RECORD.pack(
+                    offset, last, int(event["book_id"] or 0), user_key(event["user"])))
+                offset += len(line)
+        with open(self.index_path + ".tmp", "wb") as out:
+            out.write(b"".join(records))
+        os.replace(self.index_path + ".tmp", self.index_path)
+        self._reset()
+        self._inode = os.stat(self.index_path).st_ino
+        self.base = self._first_seq()
+        for offset, ts, book, user in self.RECORD.iter_unpack(b"".join(records)):
+            self._offsets.append(offset)
+            self._times.append(ts)
+            self._books.append(book)
+            self._users.append(user)
+
+    def append(self, action, book_id, title, user="", date=None):
+        return self.append_many([(action, book_id, title, user, date)])[-1]
+
+    def append_many(self, items):
+        """ Appends (action, book_id, title, user, date) tuples as one write
+        to the log and one to the index. Returns the stored events. """
+        with WRITE_SECONDS.labels(os.path.basename(self.path)).time(), \
+                self._exclusive() as index:
+            return self._append(index, items)
+
+    def _append(self, index, items):
+        with open(self.path, "ab") as log:
+            seq = self.base + len(self._offsets)
+            offset = log.tell()
+            last = self._times[-1] if self._times else 0.0
+            lines, records, events = [], [], []
+            for action, book_id, title, user, date in items:
+                date = date or datetime.datetime.now().strftime(DATE_FORMAT)
+                # Index timestamps never go backwards, so date ranges can
+                # be found by bisection.
+                last = max(to_timestamp(date), last)
+                event = {"seq": seq, "action": action, "user": user,
+                         "book_id": str(book_id or ""), "book": title, "date": date}
+                line = (json.dumps(event, separators=(",", ":")) + "\n").encode("utf-8")
+                records.append(self.RECORD.pack(
+                    offset, last, int(book_id or 0), user_key(user)))
+                lines.append(line)
+                events.append(event)
+                offset += len(line)
+                seq += 1
+            log.write(b"".join(lines))
+            log.flush()
+            index.write(b"".join(records))
+            index.flush()
+        self._refresh()
+        return events
+
+    def import_legacy(self, path):
+        """ Converts an old free-text issue_log.txt into events, once. """
+        if not os.path.exists(path):
+            return
+        with self._exclusive() as index:
+            if self.base or len(self._offsets):
+                return
+            items = []
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    match = LEGACY_LINE.match(line.strip())
+                    if match:
+                        user, action, title, date = match.groups()
+                        try:
+                            to_timestamp(date.strip())
+                        except ValueError:
+                            continue
+                        # Old entries quoted the whole raw CSV row; keep its Title.
+                        title = next(csv.reader([title]), [title])[0] or title
+                        items.append((action, None, title, user, date.strip()))
+            if items:
+                self._append(index, items)
+
+    def _read(self, positions):
+        events = []
+        with open(self.path, "rb") as f:
+            for i in positions:
+                f.seek(self._offsets[i])
+                events.append(json.loads(f.readline()))
+        return events
+
+    def query(self, limit=50, before=None, user=None, book_id=None,
+              since=None, until=None, archived=True):
+        """ Newest-first events, optionally only those with seq < `before`,
+        for one user or book, or within [since, until) timestamps. Pages
+        that run past the start of the live log continue into the archive
+        unless `archived` is False. """
+        with self._shared():
+            self._refresh()
+            base = self.base
+            hi = len(self._offsets)
+            if before is not None:
+                hi = min(max(before - base, 0), hi)
+            lo = 0
+            if until is not None:
+                hi = min(hi, bisect.bisect_left(self._times, until))
+            if since is not None:
+                lo = bisect.bisect_left(self._times, since)
+            want_user = user_key(user) if user else None
+            want_book = int(book_id) if book_id else None
+            positions = []
+            for i in range(hi - 1, lo - 1, -1):
+                if want_book is not None and self._books[i] != want_book:
+                    continue
+                if want_user is not None and self._users[i] != want_user:
+                    continue
+                positions.append(i)
+                if len(positions) >= limit:
+                    break
+            events = self._read(positions)
+        if user:
+            # The index stores a hash; drop the rare collision here.
+            events = [e for e in events if e["user"].strip().lower() == user.strip().lower()]
+        if (archived and self.archive is not None and base and len(positions) < limit
+                and (since is None or lo == 0)):
+            events += self.archive.query(limit - len(events), base if before is None else min(before, base),
+                                         user=user, book_id=book_id, since=since, until=until)
+        return events
+
+    def tail(self, after=-1, limit=100):
+        """ Events with seq > `after`, oldest first. """
+        with self._shared():
+            self._refresh()
+            start = max(after + 1, 0)
+            events = []
+            if start < self.base and self.archive is not None:
+                events = self.archive.range(start, self.base, limit)
+                start = self.base
+            first = start - self.base
+            return events + self._read(range(first, min(first + limit - len(events), len(self._offsets))))
+
+    def rotate(self, keep_since, max_bytes, keep_events, sink):
+        """ Moves the oldest events out of the live log: every event stamped
+        before the timestamp `keep_since`, then more until the log is under
+        half of `max_bytes`, but never the newest `keep_events` (at least
+        one stays, so the log still knows its base). The moved lines are
+        passed to sink(events) as an iterator of (seq, timestamp, raw JSON
+        line), oldest first, before the live files are replaced; if sink
+        raises, nothing changes. Returns the number of events moved.
+
+        Rotations are serialized by their own lock, and the lines being
+        moved never change, so sink runs while appends and reads carry on.
+        Appends wait while the survivors are copied, reads only while the
+        files are swapped. """
+        with self._rotate_lock, (self._flock(fcntl.LOCK_EX, self.rotate_lock_path)
+                                 if fcntl else contextlib.nullcontext()):
+            with self._shared():
+                self._refresh()
+                n = len(self._offsets)
+                size = os.path.getsize(self.path)
+                cut = bisect.bisect_left(self._times, keep_since) if keep_since is not None else 0
+                if max_bytes and size > max_bytes:
+                    cut = max(cut, bisect.bisect_left(self._offsets, size - max_bytes // 2))
+                cut = min(cut, n - max(keep_events, 1))
+                if cut <= 0:
+                    return 0
+                base, start = self.base, self._offsets[cut]
+                times = self._times[:cut]
+            with open(self.path, "rb") as log:
+                sink((base + i, times[i], log.readline()) for i in range(cut))
+            with self._exclusive():
+                # Rewrite the survivors (including anything appended while
+                # sink ran), rebased to offset 0, then swap the files in:
+                # the index last, as its inode marks the rotation.
+                n = len(self._offsets)
+                with open(self.path, "rb") as log, open(self.path + ".tmp", "wb") as out:
+                    log.seek(start)
+                    shutil.copyfileobj(log, out)
+                    out.flush()
+                    os.fsync(out.fileno())
+                with open(self.index_path + ".tmp", "wb") as out:
+                    out.write(b"".join(
+                        self.RECORD.pack(self._offsets[i] - start, self._times[i],
+                                         self._books[i], self._users[i])
+                        for i in range(cut, n)))
+                    out.flush()
+                    os.fsync(out.fileno())
+                with self._swapping():
+                    os.replace(self.path + ".tmp", self.path)
+                    os.replace(self.index_path + ".tmp", self.index_path)
+                self._refresh()
+        return cut
@@ -0,0 +1,80 @@
+# In-process publish/subscribe for catalog changes, with a bounded replay
+# buffer so reconnecting clients get what they missed.
+
+import json
+import threading
+from collections import deque
+
+
+class ChangeFeed:
+    """ Numbered, pre-encoded change messages kept in a ring of the last
+    `size`. Publishing appends and wakes waiting subscribers; a subscriber
+    remembers the last sequence number it saw and asks for everything
+    after it. If that number has already dropped out of the ring (or
+    belongs to another process, see `instance`), since() reports a gap
+    and the client must refetch instead of applying deltas.
+
+    Messages are encoded once when published, so the cost of a change
+    doesn't grow with the number of subscribers beyond writing the bytes. """
+
+    def __init__(self, size=1024, instance=""):
+        self.instance = instance
+        self._ring = deque(maxlen=size)
+        self._cond = threading.Condition()
+        self.seq = 0
+        self.subscribers = 0
+
+    def publish(self, kind, data):
+        """ Appends a message and returns its sequence number. Quick enough
+        to call from an LMS listener. """
+        with self._cond:
+            self.seq += 1
+            payload = json.dumps(dict(data, seq=self.seq), separators=(",", ":"))
+            self._ring.append((self.seq, kind, payload))
+            self._cond.notify_all()
+            return self.seq
+
+    def event_id(self, seq):
+        return f"{self.instance}-{seq}"
+
+    def parse_id(self, event_id):
+        """ The sequence number in an event ID from this feed, else None. """
+        instance, _, seq = (event_id or "").rpartition("-")
+        if instance != self.instance or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def since(self, after):
+        """ (messages after `after`, gap): messages are (seq, kind, payload)
+        tuples, oldest first. gap is True when some of them are gone. """
+        with self._cond:
+            return self._since(after)
+
+    def _since(self, after):
+        if after > self.seq:
+            return [], True
+        if not self._ring or after >= self._ring[-1][0]:
+            return [], False
+        first = self._ring[0][0]
+        if after < first - 1:
+            return [], True
+        return list(self._ring)[after - first + 1:], False
+
+    def wait(self, after, timeout):
+        """ Like since(), but blocks up to `timeout` seconds for a message
+        newer than `after`. """
+        with self._cond:
+            self._cond.wait_for(lambda: self.seq > after, timeout)
+            return self._since(after)
+
+    def subscribe(self, limit):
+        """ Counts a subscriber in; False if `limit` are already connected. """
+        with self._cond:
+            if self.subscribers >= limit:
+                return False
+            self.subscribers += 1
+            return True
+
+    def unsubscribe(self):
+        with self._cond:
+            self.subscribers -= 1
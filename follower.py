@@ -0,0 +1,69 @@
+# Base class for structures derived from the LMS catalog and kept in step with it.
+
+
+class CatalogFollower:
+    """ Mirrors an LMS catalog through its change listener, building the
+    mirror only when it is first used.
+
+    attach() just registers the listener, so a worker can start serving
+    before, say, the recommender has seen a single book. The first call to
+    fit() reads the catalog and builds from it; changes that land while
+    that read is in progress are queued and replayed afterwards, and a
+    "reloaded" notification marks the mirror stale again. Subclasses set
+    self._lock (an RLock) and implement _build(data), where data comes
+    from _read(lms) (the book list unless overridden), and
+    _apply(action, book_id, book). """
+
+    _lms = None         # the LMS followed
+    _stale = False      # needs a full build before use
+    _backlog = None     # changes seen while a build is reading the catalog
+
+    def attach(self, lms):
+        """ Follows `lms` from now on; the first fit() builds from it. """
+        def on_change(action, book_id, book):
+            with self._lock:
+                if self._backlog is not None:
+                    self._backlog.append((action, book_id, book))
+                elif action == "reloaded":
+                    self._stale = True
+                elif not self._stale:
+                    self._apply(action, book_id, book)
+        with self._lock:
+            self._lms = lms
+            self._stale = True
+        lms.add_listener(on_change)
+        return self
+
+    def fit(self):
+        """ Builds from the followed catalog if that hasn't happened since
+        it was attached or reloaded. Another thread already building is
+        not waited for; callers just see the previous state. """
+        with self._lock:
+            if not self._stale or self._backlog is not None:
+                return
+            self._backlog = []
+        try:
+            # Read the catalog without holding our lock: LMS calls the
+            # listener (which takes it) while holding its own locks.
+            data = self._read(self._lms)
+            with self._lock:
+                self._build(data)
+                backlog, self._backlog = self._backlog, None
+                self._stale = False
+                for action, book_id, book in backlog:
+                    if action == "reloaded":
+                        self._stale = True
+                    elif not self._stale:
+                        self._apply(action, book_id, book)
+        finally:
+            with self._lock:
+                self._backlog = None
+
+    def _read(self, lms):
+        return lms.books()
+
+    def _build(self, data):
+        raise NotImplementedError
+
+    def _apply(self, action, book_id, book):
+        raise NotImplementedError
@@ -0,0 +1,181 @@
+# Chat knowledge base and the precompiled matchers built from it.
+
+import threading
+from collections import deque
+from follower import CatalogFollower
+from search_index import tokenize
+
+# In-Memory Knowledge Base for "Semantic" Search
+# Maps keywords/concepts -> Book Title or ID hints
+KNOWLEDGE_BASE = {
+    "sherlock": ["Sherlock Holmes", "detective", "mystery", "client", "watson"],
+    "holmes": ["Sherlock Holmes", "detective", "mystery", "client", "watson"],
+    "watson": ["Sherlock Holmes"],
+    "detective": ["Sherlock Holmes", "Case of the Lame Canary", "Agatha Christie"],
+    "dinosaur": ["Jurassic Park"],
+    "jurassic": ["Jurassic Park"],
+    "langdon": ["Angels & Demons"],
+    "illuminati": ["Angels & Demons"],
+    "vatican": ["Angels & Demons"],
+    "raskolnikov": ["Crime and Punishment"],
+    "murder": ["Crime and Punishment", "Sherlock Holmes"],
+    "napoleon": ["Animal Farm"],
+    "pig": ["Animal Farm"],
+    "communis": ["Animal Farm", "Karl Marx"],
+    "big brother": ["1984" , "Animal Farm"], # 1984 might not be in csv, but good for chat
+    "wizard": ["Harry Potter"], # If in CSV
+    "magic": ["Harry Potter", "The Amulet of Samarkand"],
+    "hobbit": ["Lord of the Rings"],
+    "ring": ["Lord of the Rings"],
+    "economics": ["Wealth of Nations", "Freakonomics", "Superfreakonomics"],
+    "freak": ["Freakonomics"],
+    "physics": ["Physics & Philosophy", "Tao of Physics", "Feynman"],
+    "feynman": ["Surely You're Joking Mr Feynman"],
+    "joking": ["Surely You're Joking Mr Feynman"],
+    "wavelet": ["Fundamentals of Wavelets"],
+    "signal": ["Fundamentals of Wavelets", "Signals and Systems"],
+    "india": ["Discovery of India", "Integration of the Indian States", "India from Midnight to Milennium"],
+    "nehru": ["Discovery of India"],
+    "gandhi": ["My Experiments with Truth"],
+    "hitler": ["Mein Kampf"],
+    "war": ["Mein Kampf", "War and Peace", "Farewell to Arms", "Once There Was a War"],
+    "hemingway": ["Farewell to Arms"],
+    "steinbeck": ["Grapes of Wrath", "Russian Journal", "Moon is Down"],
+    "grapes": ["Grapes of Wrath"],
+    "monk": ["The Monk Who Sold His Ferrari"],
+    "ferrari": ["The Monk Who Sold His Ferrari"],
+    "kalam": ["Wings of Fire"],
+    "fire": ["Wings of Fire", "Harry Potter", "Girl who played with Fire"],
+    "girl": ["Girl with the Dragon Tattoo", "Girl who played with Fire"],
+    "dragon": ["Girl with the Dragon Tattoo"],
+    "tattoo": ["Girl with the Dragon Tattoo"],
+    "vampire": ["Twilight", "Dracula"],
+    "potter": ["Harry Potter"],
+}
+
+
+class AhoCorasick:
+    """ Aho-Corasick automaton: finds every occurrence of a fixed set of
+    patterns in one left-to-right pass over the text, however many
+    patterns there are. Patterns may contain spaces. """
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [()]
+        for pattern in patterns:
+            self._insert(pattern)
+        self._link()
+
+    def _insert(self, pattern):
+        state = 0
+        for char in pattern:
+            nxt = self.goto[state].get(char)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][char] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append(())
+            state = nxt
+        self.out[state] = self.out[state] + (pattern,)
+
+    def _link(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self.goto[state].items():
+                queue.append(nxt)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[nxt] = target if target != nxt else 0
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def find(self, text):
+        """ Matched patterns, in the order their matches end in `text`. """
+        found = []
+        state = 0
+        goto, fail, out = self.goto, self.fail, self.out
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found.extend(out[state])
+        return found
+
+
+class ChatKnowledge(CatalogFollower):
+    """ The knowledge base compiled for chat lookups.
+
+    Keys are matched against the whole message with one automaton, so
+    multi-word keys like "big brother" work. Each related concept is
+    mapped to the books whose title/author contain all of its words
+    (the same rule as a catalog search). That map is kept up to date
+    from LMS change notifications: a new book is run once through an
+    automaton of concept words, so answering a chat message never looks
+    at the catalog. The map itself is built on first use (see
+    CatalogFollower). """
+
+    def __init__(self, knowledge_base=KNOWLEDGE_BASE):
+        self.knowledge_base = {key.lower(): values for key, values in knowledge_base.items()}
+        self.keys = AhoCorasick(self.knowledge_base)
+        concepts = {c for values in self.knowledge_base.values() for c in values}
+        self.concept_words = {c: frozenset(tokenize(c)) for c in concepts}
+        self.word_concepts = {}
+        for concept, words in self.concept_words.items():
+            for word in words:
+                self.word_concepts.setdefault(word, []).append(concept)
+        self.words = AhoCorasick(self.word_concepts)
+        self.concept_books = {c: set() for c in concepts}
+        self.book_concepts = {}
+        self._lock = threading.RLock()
+
+    def related(self, message):
+        """ Concepts related to any key found in `message`, first seen first. """
+        related = {}
+        for key in self.keys.find(message.lower()):
+            for concept in self.knowledge_base[key]:
+                related.setdefault(concept, None)
+        return list(related)
+
+    def books_for(self, concept):
+        self.fit()
+        with self._lock:
+            return sorted(self.concept_books.get(concept, ()), key=int)
+
+    def _concepts_in(self, text):
+        words = set(self.words.find(" ".join(tokenize(text))))
+        candidates = {c for word in words for c in self.word_concepts[word]}
+        return {c for c in candidates if self.concept_words[c] <= words}
+
+    def _add(self, book_id, book):
+        self._remove(book_id)
+        concepts = self._concepts_in(book.search_text())
+        if concepts:
+            self.book_concepts[book_id] = concepts
+            for concept in concepts:
+                self.concept_books[concept].add(book_id)
+
+    def _remove(self, book_id):
+        for concept in self.book_concepts.pop(book_id, ()):
+            self.concept_books[concept].discard(book_id)
+
+    def rebuild(self, books):
+        with self._lock:
+            for ids in self.concept_books.values():
+                ids.clear()
+            self.book_concepts.clear()
+            for book_id, book in books:
+                self._add(book_id, book)
+
+    def _build(self, books):
+        self.rebuild(books)
+
+    def _apply(self, action, book_id, book):
+        if action == "deleted":
+            self._remove(book_id)
+        elif action in ("added", "updated"):
+            self._add(book_id, book)
@@ -0,0 +1,146 @@
+# Loan policy and the in-memory index of active loans (due dates, per-member counts).
+
+import datetime
+import heapq
+import itertools
+import math
+import os
+import threading
+from collections import namedtuple
+
+from events import DATE_FORMAT, to_timestamp
+
+
+class LoanPolicy(namedtuple("LoanPolicy", "loan_days max_renewals fine_per_day max_loans")):
+    """ How long a book may be kept, how often a loan may be renewed, the
+    fine per started day overdue and how many books one member may hold. """
+
+    __slots__ = ()
+
+    def __new__(cls, loan_days=14, max_renewals=2, fine_per_day=1.0, max_loans=5):
+        return super().__new__(cls, loan_days, max_renewals, fine_per_day, max_loans)
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        """ The policy configured by LOAN_DAYS, MAX_RENEWALS, FINE_PER_DAY
+        and MAX_LOANS, defaulting field by field. Every entry point (the
+        web app, the CLI, reminders, compaction) builds its policy here so
+        they agree on due dates and fines. """
+        default = cls()
+        return cls(int(environ.get("LOAN_DAYS", default.loan_days)),
+                   int(environ.get("MAX_RENEWALS", default.max_renewals)),
+                   float(environ.get("FINE_PER_DAY", default.fine_per_day)),
+                   int(environ.get("MAX_LOANS", default.max_loans)))
+
+    def due_date(self, date):
+        """ Due date (string) of a loan made or renewed at `date` (string). """
+        start = datetime.datetime.strptime(date, DATE_FORMAT)
+        return (start + datetime.timedelta(days=self.loan_days)).strftime(DATE_FORMAT)
+
+    def days_overdue(self, due_date, now):
+        """ Started days past `due_date` at `now` (both strings); 0 if not late. """
+        if not due_date:
+            return 0
+        late = to_timestamp(now) - to_timestamp(due_date)
+        return max(0, math.ceil(late / 86400))
+
+    def fine(self, due_date, now):
+        return round(self.days_overdue(due_date, now) * self.fine_per_day, 2)
+
+
+def member_key(name, member_id=""):
+    """ Who a loan counts against: the registered member if there is one,
+    otherwise the borrower's name, compared case-insensitively. """
+    return member_id or name.strip().lower()
+
+
+class LoanIndex:
+    """ Active loans ordered by due date, plus the books each member holds
+    (keyed by member_key).
+
+    Due dates live in a binary heap of (due timestamp, token, book ID),
+    the token being unique per loan. Deletion is lazy: returning or
+    renewing a loan only updates `due`, and the old heap entry is skipped
+    (and eventually compacted away).
+    Listing overdue loans walks the heap from the root and stops at any
+    entry not yet due, since everything below it is due later still, so
+    it visits only the k overdue entries and their direct children
+    rather than every loan. """
+
+    def __init__(self, loans=()):
+        self._lock = threading.Lock()
+        self.due = {}           # book ID -> (due timestamp, member key, token)
+        self.members = {}       # member key -> set of book IDs on loan
+        self._heap = []
+        self._tokens = itertools.count()
+        for book_id, member, due_date in loans:
+            self._add(book_id, member, due_date)
+        heapq.heapify(self._heap)
+
+    @classmethod
+    def from_books(cls, books):
+        """ Builds the index from (book_id, Book) pairs; issued books count. """
+        return cls((book_id, member_key(book.lender_name, book.member_id), book.due_date)
+                   for book_id, book in books if book.lender_name)
+
+    def _add(self, book_id, member, due_date, push=list.append):
+        self._remove(book_id)
+        due = to_timestamp(due_date) if due_date else math.inf
+        token = next(self._tokens)
+        self.due[book_id] = (due, member, token)
+        self.members.setdefault(member, set()).add(book_id)
+        push(self._heap, (due, token, book_id))
+
+    def _remove(self, book_id):
+        entry = self.due.pop(book_id, None)
+        if entry is None:
+            return
+        held = self.members[entry[1]]
+        held.discard(book_id)
+        if not held:
+            del self.members[entry[1]]
+        # Compact once stale entries outnumber live ones.
+        if len(self._heap) > 2 * len(self.due) + 64:
+            self._heap = [(due, token, bid) for bid, (due, _, token) in self.due.items()]
+            heapq.heapify(self._heap)
+
+    def add(self, book_id, member, due_date):
+        """ Records a loan of `book_id` to the member_key `member`. """
+        with self._lock:
+            self._add(book_id, member, due_date, push=heapq.heappush)
+
+    def remove(self, book_id):
+        with self._lock:
+            self._remove(book_id)
+
+    def count(self, member):
+        """ Number of books on loan to the member_key `member`. """
+        with self._lock:
+            return len(self.members.get(member, ()))
+
+    def books_of(self, member):
+        """ IDs of the books on loan to the member_key `member`. """
+        with self._lock:
+            return sorted(self.members.get(member, ()), key=int)
+
+    def overdue(self, now, limit=None):
+        """ (due timestamp, book_id) of loans due before `now` (a timestamp),
+        most overdue first. """
+        found = []
+        with self._lock:
+            heap, due = self._heap, self.due
+            stack = [0] if heap else []
+            while stack:
+                i = stack.pop()
+                ts, token, book_id = heap[i]
+                if ts >= now:
+                    continue
+                entry = due.get(book_id)
+                if entry is not None and entry[2] == token:
+                    found.append((ts, book_id))
+                stack.extend(c for c in (2 * i + 1, 2 * i + 2) if c < len(heap))
+        found.sort()
+        return found[:limit] if limit is not None else found
+
+    def __len__(self):
+        return len(self.due)
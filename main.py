@@ -2,202 +2,848 @@
 # Author : Sunil Mandloi 
 # Email : sunilnarayan419@gmail.com 
 
+import atexit
+import contextlib
+import copy
 import datetime
 import os
+import threading
+from collections import Counter
+from catalog import Book, AVAILABLE, ISSUED
+from compaction import EventArchive, compact
+from events import EventLog, to_timestamp
+from loans import LoanIndex, LoanPolicy, member_key
+from metrics import REGISTRY, timed
+from reports import gzipped, render, write_report
+from results import Outcome, Result
+from search_index import SearchIndex
+from snapshot import Snapshot, write_snapshot
+from stats import CatalogStats
+from storage import SQLiteStorage
+from titles import TitleIndex
+from writer import AppendWriter
+
+OPERATION_SECONDS = REGISTRY.histogram(
+    "lms_operation_seconds", "Time spent in LMS operations, including waits for locks.", ("op",))
+
 
 class LMS:
     """ This class is used to keep record of book library.
     It has total six module: "Display Books", "Search Books", "Issue Books" ,
-    "Add Books", "Delete Books", "Return Books" """
+    "Add Books", "Delete Books", "Return Books"
+
+    An LMS can be shared between threads. Issue/return only take the
+    striped lock of the book involved; anything that changes which books
+    exist (add, delete, sync) also takes the catalog lock, always before
+    any stripe. New IDs are allocated by the storage inside its write
+    transaction, so concurrent adds never collide. """
 
-    def __init__(self, list_of_books, library_name):
-        self.list_of_books = "books.csv"
+    LOCK_STRIPES = 64
+    # Seconds between snapshot writes (only when something changed); 0 or
+    # None leaves it to close(), which also runs at interpreter exit.
+    SNAPSHOT_INTERVAL = 300
+    SNAPSHOT_FIELDS = ("title", "author", "subject", "extent", "publisher",
+                       "lender_name", "issue_date", "status", "due_date", "member_id")
+
+    def __init__(self, list_of_books, library_name, storage=None, policy=None):
+        self.list_of_books = list_of_books
         self.issued_file = "issued_books.csv"
+        # Legacy free-text log; only read once to seed the event log.
         self.log_file = "issue_log.txt"
         self.library_name = library_name
-        self.books_dict = {}
-
-        Id = 101
+        # The database holds the real catalog and loan state; books.csv only
+        # seeds a brand new database and is kept as an import/export format.
+        self.storage = storage or SQLiteStorage("library.db")
+        self.policy = policy or LoanPolicy()
+        self.writer = AppendWriter()
+        self._catalog_lock = threading.RLock()
+        self._stripes = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+        # Bumped after every change to the in-memory catalog, so readers
+        # can key caches on it. Only meaningful within this process.
+        self.version = 0
+        self._version_lock = threading.Lock()
+        self.listeners = []
 
-        for file in [self.list_of_books, self.issued_file, self.log_file]:
+        for file in [self.list_of_books, self.issued_file]:
             if not os.path.exists(file):
                 open(file, "w").close()
 
-        with open(self.list_of_books) as bk:
-            for line in bk.readlines():
-                self.books_dict[str(Id)] = {
-                    "books_title": line.strip(),
-                    "lender_name": "",
-                    "Issue_date": "",
-                    "Status": "Available"
-                }
-                Id += 1
+        self.storage.seed_from_csv(self.list_of_books)
+        # Old events are rotated out into the archive by compact().
+        self.archive = EventArchive("archive")
+        self.events = EventLog("events.jsonl", archive=self.archive)
+        self.events.import_legacy(self.log_file)
+
+        # Startup prefers the binary snapshot plus the journal tail written
+        # after it; the search index is only built when first searched.
+        self.snapshot_path = "library.snapshot"
+        self._snapshot_version = None
+        if not self._restore():
+            self._load()
+        # Copies grouped by title, built on first use like the search index.
+        self.titles = TitleIndex().attach(self)
+        self._closed = threading.Event()
+        if self.SNAPSHOT_INTERVAL:
+            threading.Thread(target=self._autosave, daemon=True).start()
+        atexit.register(self.close)
+
+    def _lock_for(self, book_id):
+        return self._stripes[hash(book_id) % self.LOCK_STRIPES]
+
+    @contextlib.contextmanager
+    def _locks_for(self, book_ids):
+        """ Holds the stripes of several books, taken in stripe order like
+        _load() does, so batches can't deadlock against each other. """
+        stripes = sorted({hash(book_id) % self.LOCK_STRIPES for book_id in book_ids})
+        with contextlib.ExitStack() as stack:
+            for stripe in stripes:
+                stack.enter_context(self._stripes[stripe])
+            yield
+
+    @property
+    def index(self):
+        """ The search index, built from the catalog on first use. """
+        index = self._index
+        if index is None:
+            with self._catalog_lock:
+                if self._index is None:
+                    index = SearchIndex()
+                    for book_id, book in self.books_dict.items():
+                        index.add(book_id, book.search_text())
+                    self._index = index
+                index = self._index
+        return index
+
+    def _reindex(self, book_id, book=None):
+        """ Updates (or, without a book, drops) one entry of the search
+        index if it has been built. Called with the catalog lock held. """
+        if self._index is None:
+            return
+        if book is None:
+            self._index.remove(book_id)
+        else:
+            self._index.add(book_id, book.search_text())
+
+    def add_listener(self, listener):
+        """ Registers listener(action, book_id, book), called after each
+        change to the in-memory catalog with action one of "added",
+        "deleted", "issued", "returned", "updated" or "reloaded" (the
+        whole catalog was replaced; book_id and book are None). Listeners
+        run while LMS holds its locks, so they must be quick and must not
+        call back into mutating LMS methods. """
+        self.listeners.append(listener)
+        return listener
+
+    def _touch(self):
+        """ Bumps `version` without notifying listeners, for changes that
+        aren't to the catalog itself (e.g. a new member). """
+        with self._version_lock:
+            self.version += 1
+
+    def _changed(self, action, book_id=None, book=None):
+        self._touch()
+        for listener in self.listeners:
+            listener(action, book_id, book)
+
+    def _load(self):
+        with self._catalog_lock, contextlib.ExitStack() as stack:
+            for stripe in self._stripes:
+                stack.enter_context(stripe)
+            # Take the journal position first: anything committed while
+            # loading is replayed by the next sync(), which is harmless.
+            self.seq = self.storage.changes_since(None)[0]
+            self.books_dict = dict(self.storage.load_books())
+            self._index = None
+            self.stats = CatalogStats(self.books_dict.values())
+            self.loans = LoanIndex.from_books(self.books_dict.items())
+            self._changed("reloaded")
+
+    # SNAPSHOT
+    def _restore(self):
+        """ Loads the catalog and loan state from the snapshot file, then
+        replays the change journal written since. Returns False if there
+        is no snapshot of this database to start from. """
+        snapshot = Snapshot.open(self.snapshot_path)
+        if snapshot is None:
+            return False
+        with snapshot:
+            meta = snapshot.meta
+            if (self.storage.instance_id is None
+                    or meta.get("instance_id") != self.storage.instance_id):
+                return False
+            columns = snapshot.load("books")
+            stats = snapshot.load("stats")
+        with self._catalog_lock, contextlib.ExitStack() as stack:
+            for stripe in self._stripes:
+                stack.enter_context(stripe)
+            self.seq = meta["seq"]
+            self.books_dict = dict(zip(columns[0], map(Book, *columns[1:])))
+            self._index = None
+            self.stats = stats
+            self.loans = LoanIndex.from_books(self.books_dict.items())
+            self._changed("reloaded")
+        # Falls back to a full _load() if the journal no longer reaches
+        # back to the snapshot.
+        self.sync()
+        self._snapshot_version = self.version
+        return True
+
+    @timed(OPERATION_SECONDS, "save_snapshot")
+    def save_snapshot(self):
+        """ Writes the catalog and loan state to the snapshot file. """
+        if self.storage.instance_id is None:
+            return
+        with self._catalog_lock, contextlib.ExitStack() as stack:
+            for stripe in self._stripes:
+                stack.enter_context(stripe)
+            version = self.version
+            books = self.books_dict.values()
+            columns = [list(self.books_dict)] + [
+                [getattr(book, field) for book in books] for field in self.SNAPSHOT_FIELDS]
+            stats = copy.deepcopy(self.stats)
+            meta = {"instance_id": self.storage.instance_id, "seq": self.seq,
+                    "books": len(self.books_dict)}
+        # Pickling and writing happen outside the locks.
+        write_snapshot(self.snapshot_path, meta, {"books": columns, "stats": stats})
+        self._snapshot_version = version
+
+    def _autosave(self):
+        while not self._closed.wait(self.SNAPSHOT_INTERVAL):
+            if self.version != self._snapshot_version:
+                try:
+                    self.save_snapshot()
+                except OSError as e:
+                    print("Snapshot failed:", e)
+
+    def close(self):
+        """ Stops the periodic snapshots and writes a final one. """
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        if self.version != self._snapshot_version:
+            self.save_snapshot()
+
+    # SYNC
+    @timed(OPERATION_SECONDS, "sync")
+    def sync(self):
+        """ Catches up with changes other processes (e.g. other gunicorn
+        workers) committed to the shared storage since the last call. """
+        with self._catalog_lock:
+            seq, changed = self.storage.changes_since(self.seq)
+            if changed is None:
+                self._load()
+                return
+            for book_id in changed:
+                with self._lock_for(book_id):
+                    # Read under the stripe: a local issue/return commits
+                    # and applies itself while holding it, so the row can't
+                    # be older than what books_dict already has.
+                    book = self.storage.get_book(book_id)
+                    current = self.books_dict.get(book_id)
+                    if current is not None:
+                        self.stats.book_removed(current)
+                    self.loans.remove(book_id)
+                    if book is not None and book.lender_name:
+                        self.loans.add(book_id, member_key(book.lender_name, book.member_id),
+                                       book.due_date)
+                    if book is None:
+                        if current is not None:
+                            del self.books_dict[book_id]
+                            self._reindex(book_id)
+                            self._changed("deleted", book_id, current)
+                        continue
+                    if current is None or current.search_text() != book.search_text():
+                        self._reindex(book_id, book)
+                    self.books_dict[book_id] = book
+                    self.stats.book_added(book)
+                    if current is None:
+                        action = "added"
+                    elif current.status == AVAILABLE and book.status != AVAILABLE:
+                        action = "issued"
+                    elif current.status != AVAILABLE and book.status == AVAILABLE:
+                        action = "returned"
+                    elif current.to_dict() != book.to_dict():
+                        action = "updated"
+                    else:
+                        continue    # our own write, already applied
+                    self._changed(action, book_id, book)
+            self.seq = seq
+
+    def books(self):
+        """ A consistent (book_id, Book) list, safe to iterate while other
+        threads add or delete books. """
+        with self._catalog_lock:
+            return list(self.books_dict.items())
 
     # DISPLAY
     def display_books(self, sort_by_title=False):
         books = sorted(
-            self.books_dict.items(),
-            key=lambda x: x[1]["books_title"]
-        ) if sort_by_title else self.books_dict.items()
+            self.books(),
+            key=lambda x: x[1].title
+        ) if sort_by_title else self.books()
         print("\nID\tTitle\t\t\tStatus")
         print("-" * 45)
         for key, value in books:
-            print(key, value["books_title"], "[", value["Status"], "]")
+            print(key, value.title, "[", value.status, "]")
 
     # SEARCH
+    @timed(OPERATION_SECONDS, "search")
+    def search(self, query, limit=None):
+        """ Returns matching book IDs, best match first. An exact book ID
+        always comes first, followed by title matches from the index. """
+        query = query.strip()
+        with self._catalog_lock:
+            ids = self.index.search(query, limit)
+        if query in self.books_dict:
+            ids = [query] + [i for i in ids if i != query]
+        return ids[:limit] if limit is not None else ids
+
     def search_books(self):
         query = input("Enter Book ID or Title keyword: ").lower()
-        found = False
-        for key, value in self.books_dict.items():
-            if query == key or query in value["books_title"].lower():
-                print(key, value["books_title"], "[", value["Status"], "]")
-                found = True
+        found = self.search(query)
+        for key in found:
+            value = self.books_dict.get(key)
+            if value is not None:
+                print(key, value.title, "[", value.status, "]")
         if not found:
             print("No matching book found.")
 
     # ISSUE
+    def _check_issue(self, book_id):
+        book = self.books_dict.get(book_id)
+        if book is None:
+            return Result(Outcome.INVALID_ID, "Invalid Book ID", book_id)
+        if book.status != AVAILABLE:
+            return Result(Outcome.ALREADY_ISSUED, "Book already issued!", book_id)
+        return None
+
+    def _borrower(self, book_id, name, member_id=None):
+        """ Resolves who a loan is for. Returns (name, member_id, failed):
+        an explicit member ID must exist (its name is used if none is
+        given); otherwise a name matching exactly one registered member
+        is linked to that member, and any other name is a walk-in
+        borrower with no member ID. """
+        name = name.strip()
+        if member_id:
+            member = self.storage.get_member(member_id)
+            if member is None:
+                return name, "", Result(Outcome.UNKNOWN_MEMBER, "Unknown member ID", book_id)
+            return name or member.name, member.id, None
+        if not name:
+            return name, "", Result(Outcome.MISSING_NAME, "Name is required", book_id)
+        members = self.storage.find_members(name)
+        return name, members[0].id if len(members) == 1 else "", None
+
+    def _check_member(self, book_id, member, pending=0):
+        """ Refuses a loan to a member_key already holding the maximum number
+        of books (`pending` counts loans of theirs earlier in a batch). Only
+        an early answer from this process's view: the storage enforces the
+        limit again in the issuing transaction. """
+        if self.loans.count(member) + pending >= self.policy.max_loans:
+            return self._refused(Outcome.LOAN_LIMIT, book_id)
+        return None
+
+    def _refused(self, outcome, book_id):
+        """ The Result for an issue the storage turned down. """
+        if outcome is Outcome.LOAN_LIMIT:
+            return Result(Outcome.LOAN_LIMIT,
+                          f"Loan limit reached ({self.policy.max_loans} books)", book_id)
+        return Result(Outcome.ALREADY_ISSUED, "Book already issued!", book_id)
+
+    def _issued(self, book_id, name, member_id, date, due_date):
+        """ Applies a committed issue to the in-memory state. """
+        book = self.books_dict[book_id]
+        book.lender_name = name
+        book.member_id = member_id
+        book.issue_date = date
+        book.due_date = due_date
+        book.status = ISSUED
+        self.stats.book_issued(book)
+        self.loans.add(book_id, member_key(name, member_id), due_date)
+        self._changed("issued", book_id, book)
+        return book
+
+    @timed(OPERATION_SECONDS, "issue")
+    def issue(self, book_id, name, member_id=None):
+        """ Issues a book to `name` (or to a registered member) and returns
+        a Result. """
+        failed = self._check_issue(book_id)
+        if failed:
+            return failed
+        name, member_id, failed = self._borrower(book_id, name, member_id)
+        if failed:
+            return failed
+        with self._lock_for(book_id):
+            failed = (self._check_issue(book_id)
+                      or self._check_member(book_id, member_key(name, member_id)))
+            if failed:
+                return failed
+            date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            due_date = self.policy.due_date(date)
+            issued = self.storage.issue_book(book_id, name, date, due_date, member_id,
+                                             self.policy.max_loans)
+            if issued is Outcome.OK:
+                book = self._issued(book_id, name, member_id, date, due_date)
+        if issued is not Outcome.OK:
+            # Another thread or process got there first: it took the book,
+            # or another loan to this borrower used up their limit.
+            self.sync()
+            return self._refused(issued, book_id)
+        self.writer.write(self.issued_file, f"{book_id},{name},{date}\n")
+        self.events.append("issued", book_id, book.title, name, date)
+        return Result(Outcome.OK, f"Book issued successfully on {date}, due back {due_date}",
+                      book_id, date, due_date)
+
+    @timed(OPERATION_SECONDS, "issue_title")
+    def issue_title(self, title_id, name, member_id=None):
+        """ Issues any available copy of a title (see TitleIndex) and
+        returns the Result of issuing it. A copy that another thread or
+        worker takes first leaves the free list as that loan is applied,
+        so the next attempt picks a different one. """
+        book_id, copies = self.titles.free_copy(title_id)
+        if copies is None:
+            return Result(Outcome.UNKNOWN_TITLE, "Unknown title")
+        for _ in range(copies):
+            if book_id is None:
+                break
+            result = self.issue(book_id, name, member_id)
+            if result.outcome is not Outcome.ALREADY_ISSUED:
+                return result
+            book_id, _ = self.titles.free_copy(title_id)
+        return Result(Outcome.NO_COPY_AVAILABLE, "No copy of this title is available")
+
     def Issue_books(self):
         book_id = input("Enter book ID: ")
-        if book_id not in self.books_dict:
-            print("Invalid Book ID")
-            return
-        if self.books_dict[book_id]["Status"] != "Available":
-            print("Book already issued!")
+        failed = self._check_issue(book_id)
+        if failed:
+            print(failed.message)
             return
         name = input("Enter your name: ")
-        date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self.books_dict[book_id]["lender_name"] = name
-        self.books_dict[book_id]["Issue_date"] = date
-        self.books_dict[book_id]["Status"] = "Already Issued"
-        with open(self.issued_file, "a") as f:
-            f.write(f"{book_id},{name},{date}\n")
-        with open(self.log_file, "a") as log:
-            log.write(
-                f"{name} issued '{self.books_dict[book_id]['books_title']}' on {date}\n"
-            )
-        print(f"Book issued successfully on {date}")
+        print(self.issue(book_id, name).message)
 
     # ADD
-    def add_books(self):
-        title = input("Enter book title: ").strip()
+    @timed(OPERATION_SECONDS, "add")
+    def add(self, title, author="", subject="", extent=None, publisher=""):
+        """ Adds a new book and returns a Result carrying its ID. """
+        title = title.strip()
         if not title:
-            print("Empty title not allowed")
-            return
-        new_id = str(int(max(self.books_dict.keys(), default="100")) + 1)
-        self.books_dict[new_id] = {
-            "books_title": title,
-            "lender_name": "",
-            "Issue_date": "",
-            "Status": "Available"
-        }
-        with open(self.list_of_books, "a") as f:
-            f.write(title + "\n")
-        print("Book added successfully!")
+            return Result(Outcome.EMPTY_TITLE, "Empty title not allowed")
+        book = Book(title, author.strip(), subject.strip(), extent, publisher.strip())
+        with self._catalog_lock:
+            new_id = self.storage.add_book(book)
+            self.books_dict[new_id] = book
+            self._reindex(new_id, book)
+            self.stats.book_added(book)
+            self._changed("added", new_id, book)
+        self.events.append("added", new_id, book.title)
+        return Result(Outcome.OK, "Book added successfully!", new_id)
+
+    def add_books(self):
+        title = input("Enter book title: ")
+        print(self.add(title).message)
 
     # DELETE
+    def _check_delete(self, book_id):
+        if book_id not in self.books_dict:
+            return Result(Outcome.INVALID_ID, "Book ID not found", book_id)
+        if self.books_dict[book_id].status != AVAILABLE:
+            return Result(Outcome.BOOK_ISSUED, "Cannot delete issued book!", book_id)
+        return None
+
+    @timed(OPERATION_SECONDS, "delete")
+    def delete(self, book_id):
+        """ Deletes an available book and returns a Result. """
+        with self._catalog_lock, self._lock_for(book_id):
+            failed = self._check_delete(book_id)
+            if failed:
+                return failed
+            deleted = self.storage.delete_book(book_id)
+            if deleted:
+                book = self.books_dict.pop(book_id)
+                self.stats.book_removed(book)
+                self._reindex(book_id)
+                self._changed("deleted", book_id, book)
+        if not deleted:
+            self.sync()
+            return Result(Outcome.BOOK_ISSUED, "Cannot delete issued book!", book_id)
+        self.events.append("deleted", book_id, book.title)
+        return Result(Outcome.OK, "Book deleted successfully!", book_id)
+
     def delete_books(self):
         book_id = input("Enter book ID to delete: ")
-        if book_id not in self.books_dict:
-            print("Book ID not found")
-            return
-        if self.books_dict[book_id]["Status"] != "Available":
-            print("Cannot delete issued book!")
+        failed = self._check_delete(book_id)
+        if failed:
+            print(failed.message)
             return
         confirm = input("Are you sure? (y/n): ").lower()
         if confirm != "y":
             print("Delete cancelled")
             return
-        del self.books_dict[book_id]
-        with open(self.list_of_books, "w") as f:
-            for v in self.books_dict.values():
-                f.write(v["books_title"] + "\n")
-        print("Book deleted successfully!")
+        print(self.delete(book_id).message)
 
     # RETURN
+    def _returned(self, book_id):
+        """ Applies a committed return to the in-memory state. """
+        book = self.books_dict[book_id]
+        book.status = AVAILABLE
+        book.lender_name = ""
+        book.issue_date = ""
+        book.due_date = ""
+        book.member_id = ""
+        self.stats.book_returned(book)
+        self.loans.remove(book_id)
+        self._changed("returned", book_id, book)
+        return book
+
+    def _return_result(self, book_id, date, due_date, fine):
+        message = f"Book returned successfully on {date}"
+        if fine:
+            days = self.policy.days_overdue(due_date, date)
+            message += f" ({days} day(s) overdue, fine {fine:.2f})"
+        return Result(Outcome.OK, message, book_id, date, fine=fine)
+
+    @timed(OPERATION_SECONDS, "return_book")
+    def return_book(self, book_id):
+        """ Returns an issued book and returns a Result, charging the
+        policy's fine if it is overdue. """
+        date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock_for(book_id):
+            book = self.books_dict.get(book_id)
+            if book is None:
+                return Result(Outcome.INVALID_ID, "Invalid Book ID", book_id)
+            name, due_date = book.lender_name, book.due_date
+            fine = self.policy.fine(due_date, date)
+            returned = self.storage.return_book(book_id, date, fine)
+            if returned:
+                self._returned(book_id)
+        if not returned:
+            self.sync()
+            return Result(Outcome.NOT_ISSUED, "Book is not issued!", book_id)
+        self.events.append("returned", book_id, book.title, name, date)
+        return self._return_result(book_id, date, due_date, fine)
+
     def return_books(self):
         book_id = input("Enter book ID: ")
+        print(self.return_book(book_id).message)
+
+    # RENEW
+    @timed(OPERATION_SECONDS, "renew")
+    def renew(self, book_id):
+        """ Extends a loan by another loan period (counted from today),
+        up to the policy's number of renewals. Overdue loans can't be
+        renewed. """
         date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        if book_id not in self.books_dict:
-            print("Invalid Book ID")
-            return
-        self.books_dict[book_id]["Status"] = "Available"
-        self.books_dict[book_id]["lender_name"] = ""
-        self.books_dict[book_id]["Issue_date"] = ""
-        print(f"Book returned successfully on {date}")
+        with self._lock_for(book_id):
+            book = self.books_dict.get(book_id)
+            if book is None:
+                return Result(Outcome.INVALID_ID, "Invalid Book ID", book_id)
+            if book.status == AVAILABLE:
+                return Result(Outcome.NOT_ISSUED, "Book is not issued!", book_id)
+            if self.policy.days_overdue(book.due_date, date):
+                return Result(Outcome.OVERDUE, "Overdue books must be returned", book_id)
+            due_date = max(self.policy.due_date(date), book.due_date)
+            renewed = self.storage.renew_book(book_id, due_date, self.policy.max_renewals)
+            if renewed:
+                book.due_date = due_date
+                self.loans.add(book_id, member_key(book.lender_name, book.member_id), due_date)
+                self._changed("updated", book_id, book)
+        if not renewed:
+            self.sync()
+            if self.books_dict.get(book_id, book).status == AVAILABLE:
+                return Result(Outcome.NOT_ISSUED, "Book is not issued!", book_id)
+            return Result(Outcome.RENEWAL_LIMIT,
+                          f"Renewal limit reached ({self.policy.max_renewals})", book_id)
+        self.events.append("renewed", book_id, book.title, book.lender_name, date)
+        return Result(Outcome.OK, f"Loan renewed, now due back {due_date}",
+                      book_id, date, due_date)
+
+    def renew_books(self):
+        book_id = input("Enter book ID: ")
+        print(self.renew(book_id).message)
+
+    # OVERDUE
+    @timed(OPERATION_SECONDS, "overdue")
+    def overdue(self, now=None, limit=None):
+        """ (book_id, Book, days overdue, fine so far) for loans past their
+        due date, most overdue first. Only overdue loans are looked at. """
+        now = now or datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        found = []
+        for _, book_id in self.loans.overdue(to_timestamp(now), limit):
+            book = self.books_dict.get(book_id)
+            if book is not None and book.due_date:
+                found.append((book_id, book, self.policy.days_overdue(book.due_date, now),
+                              self.policy.fine(book.due_date, now)))
+        return found
+
+    def show_overdue(self):
+        found = self.overdue()
+        for book_id, book, days, fine in found:
+            print(f"{book_id} {book.title} - {book.lender_name}, "
+                  f"due {book.due_date} ({days} day(s), fine {fine:.2f})")
+        if not found:
+            print("No overdue loans.")
+
+    # BATCHES
+    # Each batch is validated item by item, then every valid item is
+    # written in one storage transaction, one append to issued_books.csv
+    # and one append to the event log. Results come back in input order.
+    @timed(OPERATION_SECONDS, "issue_many")
+    def issue_many(self, loans):
+        """ Issues each (book_id, name) or (book_id, name, member_id) loan;
+        returns a list of Results. """
+        loans, requested = [], list(loans)
+        results = [None] * len(requested)
+        for i, (book_id, name, *member_id) in enumerate(requested):
+            book_id = str(book_id)
+            results[i] = self._check_issue(book_id)
+            if not results[i]:
+                name, member, results[i] = self._borrower(book_id, name, *member_id)
+                loans.append((book_id, name, member))
+            else:
+                loans.append((book_id, name, ""))
+        date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        due_date = self.policy.due_date(date)
+        raced = False
+        with self._locks_for(book_id for book_id, _, _ in loans):
+            todo, seen, pending = [], set(), Counter()
+            for i, (book_id, name, member_id) in enumerate(loans):
+                if results[i]:
+                    continue
+                member = member_key(name, member_id)
+                failed = self._check_issue(book_id)
+                if not failed and book_id in seen:
+                    failed = Result(Outcome.ALREADY_ISSUED, "Book already issued!", book_id)
+                if not failed:
+                    failed = self._check_member(book_id, member, pending[member])
+                if failed:
+                    results[i] = failed
+                else:
+                    seen.add(book_id)
+                    pending[member] += 1
+                    todo.append(i)
+            issued = self.storage.issue_books([loans[i] for i in todo], date, due_date,
+                                              self.policy.max_loans)
+            done = []
+            for i, outcome in zip(todo, issued):
+                book_id, name, member_id = loans[i]
+                if outcome is not Outcome.OK:
+                    # Another thread or process got there first.
+                    raced = True
+                    results[i] = self._refused(outcome, book_id)
+                    continue
+                book = self._issued(book_id, name, member_id, date, due_date)
+                done.append((book_id, name, book.title))
+                results[i] = Result(
+                    Outcome.OK, f"Book issued successfully on {date}, due back {due_date}",
+                    book_id, date, due_date)
+        if raced:
+            self.sync()
+        if done:
+            self.writer.write(self.issued_file, "".join(
+                f"{book_id},{name},{date}\n" for book_id, name, _ in done))
+            self.events.append_many(
+                ("issued", book_id, title, name, date) for book_id, name, title in done)
+        return results
+
+    @timed(OPERATION_SECONDS, "return_many")
+    def return_many(self, book_ids):
+        """ Returns each book in `book_ids`; returns a list of Results. """
+        book_ids = [str(book_id) for book_id in book_ids]
+        results = [None] * len(book_ids)
+        date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        raced = False
+        with self._locks_for(book_ids):
+            todo, seen = [], set()
+            for i, book_id in enumerate(book_ids):
+                book = self.books_dict.get(book_id)
+                if book is None:
+                    results[i] = Result(Outcome.INVALID_ID, "Invalid Book ID", book_id)
+                elif book.status == AVAILABLE or book_id in seen:
+                    results[i] = Result(Outcome.NOT_ISSUED, "Book is not issued!", book_id)
+                else:
+                    seen.add(book_id)
+                    todo.append(i)
+            due_dates = [self.books_dict[book_ids[i]].due_date for i in todo]
+            fines = [self.policy.fine(due_date, date) for due_date in due_dates]
+            returned = self.storage.return_books(
+                [(book_ids[i], fine) for i, fine in zip(todo, fines)], date)
+            done = []
+            for i, ok, due_date, fine in zip(todo, returned, due_dates, fines):
+                book_id = book_ids[i]
+                if not ok:
+                    raced = True
+                    results[i] = Result(Outcome.NOT_ISSUED, "Book is not issued!", book_id)
+                    continue
+                name = self.books_dict[book_id].lender_name
+                book = self._returned(book_id)
+                done.append((book_id, name, book.title))
+                results[i] = self._return_result(book_id, date, due_date, fine)
+        if raced:
+            self.sync()
+        if done:
+            self.events.append_many(
+                ("returned", book_id, title, name, date) for book_id, name, title in done)
+        return results
+
+    @timed(OPERATION_SECONDS, "add_many")
+    def add_many(self, books):
+        """ Adds Book records (e.g. from catalog.read_books); returns a list
+        of Results carrying the new IDs. """
+        results, valid = [], []
+        for book in books:
+            book.title = book.title.strip()
+            if book.title:
+                valid.append((len(results), book))
+                results.append(None)
+            else:
+                results.append(Result(Outcome.EMPTY_TITLE, "Empty title not allowed"))
+        if not valid:
+            return results
+        with self._catalog_lock:
+            new_ids = self.storage.add_books(book for _, book in valid)
+            for (i, book), new_id in zip(valid, new_ids):
+                self.books_dict[new_id] = book
+                self._reindex(new_id, book)
+                self.stats.book_added(book)
+                self._changed("added", new_id, book)
+                results[i] = Result(Outcome.OK, "Book added successfully!", new_id)
+        self.events.append_many(
+            ("added", new_id, book.title, "", None) for (_, book), new_id in zip(valid, new_ids))
+        return results
+
+    # MEMBERS
+    @timed(OPERATION_SECONDS, "register_member")
+    def register_member(self, name, email, mobile="", role="student"):
+        """ Registers a member (or returns the existing one for `email`). """
+        joined = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        member = self.storage.add_member(name.strip(), email, mobile, role, joined)
+        if member.joined == joined:
+            self._touch()
+        return member
+
+    @timed(OPERATION_SECONDS, "member_loans")
+    def member_loans(self, member_id, history=50):
+        """ (Member, [(book_id, Book)] on loan now, recent loan history) for
+        a member ID, or None if there is no such member. Current loans come
+        from the in-memory loan index, history from the indexed loans
+        table, so neither walks the catalog or the logs. """
+        member = self.storage.get_member(member_id)
+        if member is None:
+            return None
+        active = [(book_id, self.books_dict[book_id])
+                  for book_id in self.loans.books_of(member.id) if book_id in self.books_dict]
+        return member, active, self.storage.member_loans(member.id, history) if history else []
+
+    # COMPACTION
+    @timed(OPERATION_SECONDS, "compact")
+    def compact(self, policy=None, now=None):
+        """ Rotates old events and ledger lines into the archive; see
+        compaction.compact. """
+        return compact(self, policy, now)
 
     # SUMMARY
     def show_summary(self):
-        total = len(self.books_dict)
-        issued = sum(
-            1 for b in self.books_dict.values()
-            if b["Status"] != "Available"
-        )
+        total, issued = self.stats.total, self.stats.issued
         print(f"Total: {total} | Issued: {issued} | Available: {total - issued}")
 
+    def check_stats(self):
+        """ Recomputes the stats counters from the catalog. Returns True if
+        they were consistent; otherwise replaces them and returns False. """
+        with self._catalog_lock, contextlib.ExitStack() as stack:
+            for stripe in self._stripes:
+                stack.enter_context(stripe)
+            consistent, fresh = self.stats.verify(self.books_dict.values())
+            if not consistent:
+                self.stats = fresh
+            return consistent
+
     # REPORT
-    def export_report(self):
-        with open("library_report.txt", "w") as r:
-            r.write("Library Report\n")
-            r.write("=" * 20 + "\n")
-            for k, v in self.books_dict.items():
-                r.write(f"{k} - {v['books_title']} [{v['Status']}]\n")
+    def report(self, fmt="txt", status=None, subject=None, compress=False):
+        """ Yields a catalog report as byte chunks (see reports.py), read
+        straight from storage so it never holds LMS locks. """
+        chunks = render(self.storage.iter_books(status, subject), fmt)
+        return gzipped(chunks) if compress else chunks
+
+    def export_report(self, path="library_report.txt", fmt="txt", status=None,
+                      subject=None, compress=False):
+        write_report(path, self.storage.iter_books(status, subject), fmt, compress)
         print("Report exported!")
 
+    # EXPORT
+    def export_catalog(self, path=None):
+        """ Writes the current catalog back out in books.csv format. """
+        self.storage.export_csv(path or self.list_of_books)
+        print("Catalog exported!")
+
 
 # MAIN
-try:
-    lms = LMS("books.csv", "Central Library UOH")
-    ADMIN_PASSWORD = "admin123"
-
-    while True:
-        try:
-            print(f"\nWelcome to {lms.library_name}")
-            print("""
+def main():
+    try:
+        lms = LMS("books.csv", "Central Library UOH", policy=LoanPolicy.from_env())
+        ADMIN_PASSWORD = "admin123"
+
+        while True:
+            try:
+                print(f"\nWelcome to {lms.library_name}")
+                print("""
 D - Display Books
 S - Search Books
 I - Issue Book
 A - Add Book (Admin)
 B - Delete Book (Admin)
 R - Return Book
+N - Renew Book
+O - Overdue Loans
 C - Summary
 E - Export Report
+X - Export Catalog (CSV)
 Q - Quit
 """)
 
-            choice = input("Enter choice: ").lower()
+                choice = input("Enter choice: ").lower()
 
-            if choice == "a" or choice == "b":
-                pwd = input("Enter admin password: ")
-                if pwd != ADMIN_PASSWORD:
-                    print("Wrong password!")
-                    continue
+                if choice == "a" or choice == "b":
+                    pwd = input("Enter admin password: ")
+                    if pwd != ADMIN_PASSWORD:
+                        print("Wrong password!")
+                        continue
 
-            if choice == "d":
-                lms.display_books()
-            elif choice == "s":
-                lms.search_books()
-            elif choice == "i":
-                lms.Issue_books()
-            elif choice == "a":
-                lms.add_books()
-            elif choice == "b":
-                lms.delete_books()
-            elif choice == "r":
-                lms.return_books()
-            elif choice == "c":
-                lms.show_summary()
-            elif choice == "e":
-                lms.export_report()
-            elif choice == "q":
-                print("Thank you!")
-                break
-            else:
-                input("Press Enter to continue...")
+                if choice == "d":
+                    lms.display_books()
+                elif choice == "s":
+                    lms.search_books()
+                elif choice == "i":
+                    lms.Issue_books()
+                elif choice == "a":
+                    lms.add_books()
+                elif choice == "b":
+                    lms.delete_books()
+                elif choice == "r":
+                    lms.return_books()
+                elif choice == "n":
+                    lms.renew_books()
+                elif choice == "o":
+                    lms.show_overdue()
+                elif choice == "c":
+                    lms.show_summary()
+                elif choice == "e":
+                    lms.export_report()
+                elif choice == "x":
+                    lms.export_catalog()
+                elif choice == "q":
+                    print("Thank you!")
+                    break
+                else:
+                    input("Press Enter to continue...")
+
+            except Exception as e:
+                print("Something went wrong. Please check your input!!")
+                print("Error details:", e)
+
+    except Exception as e:
+        print("Something went wrong. Please check your input!!")
+        print("Error details:", e)
 
-        except Exception as e:
-            print("Something went wrong. Please check your input!!")
-            print("Error details:", e)
 
-except Exception as e:
-    print("Something went wrong. Please check your input!!")
-    print("Error details:", e)
+if __name__ == "__main__":
+    main()
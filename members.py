@@ -0,0 +1,13 @@
+# Registered library members.
+
+from collections import namedtuple
+
+ID_PREFIX = "STD-"
+
+Member = namedtuple("Member", "id name email mobile role joined")
+
+
+def member_dict(member):
+    """ JSON shape used by the web API; the mobile number stays private. """
+    return {"id": member.id, "name": member.name, "email": member.email,
+            "role": member.role, "joined": member.joined}
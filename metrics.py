@@ -0,0 +1,210 @@
+# In-process counters, gauges and latency histograms, rendered in the
+# Prometheus text exposition format for /metrics.
+
+import bisect
+import functools
+import threading
+import time
+
+# Seconds; wide enough for a cache hit and for a cold index build.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Value:
+    """ One labelled counter or gauge. """
+
+    __slots__ = ("_lock", "value")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class _Histogram:
+    """ One labelled histogram: a count per bucket plus sum and count.
+    observe() is a bisect plus a few additions under a lock. """
+
+    __slots__ = ("_lock", "buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        """ Context manager observing the duration of its block. """
+        return _Timer(self)
+
+    def samples(self, name, labels):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative = 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            cumulative += n
+            yield name + "_bucket", labels + (("le", _format(bound)),), cumulative
+        yield name + "_sum", labels, total
+        yield name + "_count", labels, count
+
+
+class _Timer:
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Metric:
+    """ A named family of values, one per combination of label values.
+    labels(*values) returns the child to update; callers on a hot path
+    should look it up once and keep it. """
+
+    def __init__(self, kind, name, help, labelnames=(), buckets=DEFAULT_BUCKETS, fn=None):
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.fn = fn
+        self._lock = threading.Lock()
+        self._children = {}
+
+    def labels(self, *values):
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = _Histogram(self.buckets) if self.kind == "histogram" else _Value()
+                    self._children[values] = child
+        return child
+
+    # Unlabelled metrics can be used directly.
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        if self.fn is not None:
+            lines.append(f"{self.name} {_format(self.fn())}")
+            return lines
+        with self._lock:
+            children = sorted(self._children.items())
+        for values, child in children:
+            for name, labels, value in child.samples(self.name, tuple(zip(self.labelnames, values))):
+                label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+                lines.append(f"{name}{{{label_text}}} {_format(value)}" if label_text
+                             else f"{name} {_format(value)}")
+        return lines
+
+
+class Registry:
+    """ The metrics of one process. Each gunicorn worker has its own, so a
+    scrape sees the worker that answered it; label series by instance (or
+    use one worker per container) when aggregating. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _register(self, kind, name, help, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = Metric(kind, name, help, **kwargs)
+            return metric
+
+    def counter(self, name, help, labelnames=(), fn=None):
+        """ A counter; with `fn`, its value is fn() read at scrape time
+        (for totals something else already keeps). """
+        return self._register("counter", name, help, labelnames=labelnames, fn=fn)
+
+    def gauge(self, name, help, labelnames=(), fn=None):
+        """ A gauge; with `fn`, its value is fn() read at scrape time. """
+        return self._register("gauge", name, help, labelnames=labelnames, fn=fn)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register("histogram", name, help, labelnames=labelnames, buckets=buckets)
+
+    def render(self):
+        """ Every metric in the Prometheus text format (version 0.0.4). """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def timed(metric, *labels):
+    """ Decorator observing each call's duration in the histogram `metric`
+    (with the given label values), whether it returns or raises. """
+    child = metric.labels(*labels)
+
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - start)
+        return wrapper
+    return decorate
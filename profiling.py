@@ -0,0 +1,65 @@
+# Opt-in cProfile sampling: profiles a fraction of requests and keeps the
+# pstats dumps of the ones that turn out slow.
+
+import cProfile
+import os
+import random
+import re
+import threading
+import time
+
+
+class SlowRequestProfiler:
+    """ Runs cProfile on a random `sample_rate` fraction of requests and
+    writes the stats of those taking at least `slow_ms` to `directory` as
+    <time>-<name>-<ms>ms.pstats (load them with pstats or snakeviz),
+    keeping the newest `keep` files. At most one request is profiled at a
+    time, so the overhead stays bounded whatever the traffic; with a
+    sample rate of 0 (the default) it costs one comparison per request. """
+
+    def __init__(self, sample_rate=0.0, slow_ms=500, directory="profiles", keep=50):
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.directory = directory
+        self.keep = keep
+        self.dumped = 0
+        self._busy = threading.Lock()
+
+    def start(self):
+        """ A running profiler for this request, or None if not sampled. """
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        if not self._busy.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:      # another profiler or debugger is active
+            self._busy.release()
+            return None
+        return profile
+
+    def finish(self, profile, name, seconds):
+        """ Stops `profile` and dumps it if the request was slow. Returns
+        the path written, or None. """
+        profile.disable()
+        self._busy.release()
+        ms = seconds * 1000
+        if ms < self.slow_ms:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_") or "request"
+        path = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{slug}-{ms:.0f}ms.pstats")
+        profile.dump_stats(path)
+        self.dumped += 1
+        self._prune()
+        return path
+
+    def _prune(self):
+        dumps = sorted((entry.stat().st_mtime, entry.path) for entry in os.scandir(self.directory)
+                       if entry.name.endswith(".pstats"))
+        for _, path in dumps[:-self.keep or None]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
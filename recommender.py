@@ -0,0 +1,238 @@
+# Offline recommendation engine: hashed TF-IDF vectors plus co-borrowing.
+
+import math
+import threading
+import zlib
+from collections import Counter, deque
+import numpy as np
+from follower import CatalogFollower
+from search_index import tokenize
+
+
+# Words that say nothing about a book, mostly from chat phrasing.
+STOPWORDS = frozenset(
+    "a about an and any are book books by can do for from give have i in is it "
+    "like me my of on or please recommend show some something tell the to want "
+    "what which who with you".split())
+
+
+# Features seen in the catalog are remembered in a bitmap keyed by the top
+# 32 - SEEN_SHIFT bits of their hash (4M entries, 4 MB).
+SEEN_SHIFT = 10
+
+# Hashed vector width. The matrix costs books * DEFAULT_DIM * 4 bytes per
+# process (2 GB at a million books); server.py reads RECOMMENDER_DIM.
+DEFAULT_DIM = 512
+
+# A loan is paired with the borrower's last CO_WINDOW distinct books only,
+# so recording one costs O(CO_WINDOW) however long their history is.
+CO_WINDOW = 50
+
+
+def features(text):
+    """ Words plus adjacent word pairs; underscores split (e.g. subjects). """
+    words = [w for w in tokenize(text.replace("_", " ")) if w not in STOPWORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class Recommender(CatalogFollower):
+    """ Content and co-borrowing recommendations, entirely in-process.
+
+    Each book's title, author and subject are turned into a signed,
+    hashed bag of words and word pairs, weighted by IDF and L2
+    normalized into one row of a float32 NumPy matrix. A query is a
+    single matrix-vector product followed by argpartition, and several
+    queries can be scored together as one matrix product. Rows are
+    weighted with the IDF known when they are added, and document
+    frequencies count every book seen since the last `rebuild`, which
+    refits everything. A book re-added with unchanged text (e.g. after a
+    renewal) is left alone. Co-borrowing counts come from the loan
+    history, grouped by borrower, and are updated as books are issued.
+    When attached to an LMS, the first query fits on it (see
+    CatalogFollower). """
+
+    def __init__(self, dim=DEFAULT_DIM, co_weight=0.5):
+        self.dim = dim
+        self.co_weight = co_weight
+        self._lock = threading.RLock()
+        self._reset(0)
+
+    def _reset(self, capacity):
+        self.matrix = np.zeros((max(capacity, 64), self.dim), dtype=np.float32)
+        self.digests = np.zeros(len(self.matrix), dtype=np.uint32)     # row -> crc32 of its text
+        self.ids = []               # row -> book ID (None once deleted)
+        self.rows = {}              # book ID -> row
+        self.free = []              # rows of deleted books, for reuse
+        self.df = np.zeros(self.dim, dtype=np.float64)
+        self.seen = np.zeros(1 << (32 - SEEN_SHIFT), dtype=bool)
+        self.n_docs = 0
+        self.borrowed = {}          # borrower -> deque of their last CO_WINDOW book IDs
+        self.co = {}                # book ID -> Counter of co-borrowed IDs
+
+    def _hashed(self, text, learn=False):
+        """ The signed hashed vector of `text`. Book text (`learn`) marks
+        its features as seen; for queries, features no book has ever had
+        are dropped, since they could only match through collisions. """
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for feature in features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            if learn:
+                self.seen[h >> SEEN_SHIFT] = True
+            elif not self.seen[h >> SEEN_SHIFT]:
+                continue
+            vec[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        return vec
+
+    def _idf(self):
+        return np.log((self.n_docs + 1.0) / (self.df + 1.0)).astype(np.float32) + 1.0
+
+    def _weigh(self, vec):
+        vec = vec * self._idf()
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm else vec
+
+    @staticmethod
+    def book_text(book):
+        return f"{book.title} {book.author} {book.subject}"
+
+    # Catalog maintenance
+    def add(self, book_id, book):
+        text = self.book_text(book)
+        digest = zlib.crc32(text.encode("utf-8"))
+        with self._lock:
+            row = self.rows.get(book_id)
+            if row is not None and self.digests[row] == digest:
+                return
+            self.remove(book_id)
+            raw = self._hashed(text, learn=True)
+            self.df += raw != 0
+            self.n_docs += 1
+            if self.free:
+                row = self.free.pop()
+                self.ids[row] = book_id
+            else:
+                row = len(self.ids)
+                if row == len(self.matrix):
+                    grown = np.zeros((row * 2, self.dim), dtype=np.float32)
+                    grown[:row] = self.matrix
+                    self.matrix = grown
+                    self.digests = np.resize(self.digests, row * 2)
+                self.ids.append(book_id)
+            self.rows[book_id] = row
+            self.digests[row] = digest
+            self.matrix[row] = self._weigh(raw)
+
+    def remove(self, book_id):
+        with self._lock:
+            row = self.rows.pop(book_id, None)
+            if row is None:
+                return
+            self.matrix[row] = 0.0
+            self.ids[row] = None
+            self.free.append(row)
+
+    def rebuild(self, books, loans=()):
+        """ Refits from (book_id, Book) pairs and (book_id, borrower) loans. """
+        books = list(books)
+        with self._lock:
+            self._reset(len(books))
+            raws = np.zeros((len(books), self.dim), dtype=np.float32)
+            for i, (book_id, book) in enumerate(books):
+                text = self.book_text(book)
+                raws[i] = self._hashed(text, learn=True)
+                self.digests[i] = zlib.crc32(text.encode("utf-8"))
+            self.df = (raws != 0).sum(axis=0).astype(np.float64)
+            self.n_docs = len(books)
+            raws *= self._idf()
+            norms = np.linalg.norm(raws, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self.matrix[:len(books)] = raws / norms
+            self.ids = [book_id for book_id, _ in books]
+            self.rows = {book_id: i for i, book_id in enumerate(self.ids)}
+            for book_id, borrower in loans:
+                self.borrow(book_id, borrower)
+
+    def borrow(self, book_id, borrower):
+        """ Records that `borrower` took out `book_id`. """
+        borrower = borrower.strip().lower()
+        if not borrower:
+            return
+        with self._lock:
+            recent = self.borrowed.get(borrower)
+            if recent is None:
+                recent = self.borrowed[borrower] = deque(maxlen=CO_WINDOW)
+            elif book_id in recent:
+                return
+            for other in recent:
+                self.co.setdefault(book_id, Counter())[other] += 1
+                self.co.setdefault(other, Counter())[book_id] += 1
+            recent.append(book_id)
+
+    # Queries
+    def _top(self, scores, k, exclude=(), offset=0):
+        """ Best (book_id, score) pairs from a vector of row scores, where
+        scores[i] belongs to row offset + i. """
+        if not len(scores):
+            return []
+        k_wide = min(len(scores), k + len(exclude))
+        top = np.argpartition(-scores, k_wide - 1)[:k_wide]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        found = []
+        for i in top:
+            book_id = self.ids[offset + i]
+            if book_id is None or book_id in exclude or scores[i] <= 0:
+                continue
+            found.append((book_id, float(scores[i])))
+            if len(found) == k:
+                break
+        return found
+
+    def query(self, text, k=5):
+        """ Top-k (book_id, score) by cosine similarity to free text. """
+        return self.query_many([text], k)[0]
+
+    def query_many(self, texts, k=5, chunk=65536):
+        """ Scores a batch of queries with one matrix product per chunk of
+        rows (bounding the temporary score matrix), returning a top-k list
+        per query. """
+        self.fit()
+        with self._lock:
+            queries = np.stack([self._weigh(self._hashed(t)) for t in texts], axis=1)
+            n = len(self.ids)
+            best = [[] for _ in texts]
+            for start in range(0, n, chunk):
+                scores = self.matrix[start:min(start + chunk, n)] @ queries
+                for q, found in enumerate(best):
+                    found.extend(self._top(scores[:, q], k, offset=start))
+            return [sorted(found, key=lambda x: -x[1])[:k] for found in best]
+
+    def similar(self, book_id, k=5):
+        """ Books like `book_id`: content cosine plus a co-borrowing bonus. """
+        self.fit()
+        with self._lock:
+            row = self.rows.get(book_id)
+            if row is None:
+                return []
+            scores = self.matrix[:len(self.ids)] @ self.matrix[row]
+            co = self.co.get(book_id)
+            if co:
+                peak = max(co.values())
+                for other, count in co.items():
+                    other_row = self.rows.get(other)
+                    if other_row is not None:
+                        scores[other_row] += self.co_weight * math.sqrt(count / peak)
+            return self._top(scores, k, exclude={book_id})
+
+    def _read(self, lms):
+        return lms.books(), list(lms.storage.loan_history())
+
+    def _build(self, data):
+        self.rebuild(*data)
+
+    def _apply(self, action, book_id, book):
+        if action == "deleted":
+            self.remove(book_id)
+        elif action in ("added", "updated"):
+            self.add(book_id, book)
+        elif action == "issued":
+            self.borrow(book_id, book.lender_name)
@@ -0,0 +1,67 @@
+# Overdue-loan reminders, meant to be run periodically (cron, a scheduler dyno).
+
+import argparse
+import datetime
+import time
+
+from events import DATE_FORMAT
+from loans import LoanPolicy
+
+REMIND_EVERY = datetime.timedelta(days=1)
+
+
+def last_reminder(lms, book_id, user, issue_date):
+    """ Date of the newest reminder sent to `user` for their current loan
+    of `book_id`, or None. Walks that book's events newest first and stops
+    at the loan's own issue event; the archive isn't searched, as a loan
+    whose events were already archived is long overdue anyway. """
+    for event in lms.events.query(limit=50, book_id=book_id, archived=False):
+        if event["date"] < issue_date or event["action"] == "issued":
+            return None
+        if event["action"] == "reminded" and event["user"] == user:
+            return event["date"]
+    return None
+
+
+def send_reminders(lms, notify=print, now=None, every=REMIND_EVERY):
+    """ Calls notify(user, book_id, book, days_overdue, fine) for each
+    overdue loan whose borrower hasn't been reminded within `every`, and
+    records a "reminded" event for it. Only overdue loans are visited
+    (see LMS.overdue). Returns the number of reminders sent. """
+    now = now or datetime.datetime.now().strftime(DATE_FORMAT)
+    cutoff = (datetime.datetime.strptime(now, DATE_FORMAT) - every).strftime(DATE_FORMAT)
+    sent = []
+    for book_id, book, days, fine in lms.overdue(now):
+        last = last_reminder(lms, book_id, book.lender_name, book.issue_date)
+        if last is not None and last > cutoff:
+            continue
+        notify(book.lender_name, book_id, book, days, fine)
+        sent.append(("reminded", book_id, book.title, book.lender_name, now))
+    if sent:
+        lms.events.append_many(sent)
+    return len(sent)
+
+
+def print_reminder(user, book_id, book, days, fine):
+    print(f"Reminder to {user}: '{book.title}' (#{book_id}) was due {book.due_date}, "
+          f"{days} day(s) ago. Fine so far: {fine:.2f}")
+
+
+def main():
+    from main import LMS
+
+    parser = argparse.ArgumentParser(description="Send overdue-loan reminders.")
+    parser.add_argument("--loop", type=int, default=0, metavar="SECONDS",
+                        help="keep running, checking every SECONDS")
+    args = parser.parse_args()
+    lms = LMS("books.csv", "Central Library UOH", policy=LoanPolicy.from_env())
+    while True:
+        lms.sync()
+        print(f"{send_reminders(lms, print_reminder)} reminder(s) sent.")
+        if not args.loop:
+            break
+        time.sleep(args.loop)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# Streaming catalog reports: rows -> formatted text chunks -> (optionally) gzip.
+
+import csv
+import io
+import json
+import zlib
+
+CHUNK_SIZE = 64 * 1024
+
+REPORT_COLUMNS = ["id", "title", "author", "subject", "extent", "publisher",
+                  "status", "lender_name", "issue_date"]
+
+
+def _csv_lines(rows):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(REPORT_COLUMNS)
+    for book_id, book in rows:
+        writer.writerow([book_id, book.title, book.author, book.subject,
+                         "" if book.extent is None else book.extent,
+                         book.publisher, book.status, book.lender_name, book.issue_date])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+
+def _jsonl_lines(rows):
+    for book_id, book in rows:
+        yield json.dumps({"id": book_id, **book.to_dict()}, separators=(",", ":")) + "\n"
+
+
+def _txt_lines(rows, title="Library Report"):
+    yield f"{title}\n" + "=" * 20 + "\n"
+    for book_id, book in rows:
+        yield f"{book_id} - {book.title} [{book.status}]\n"
+
+
+# format -> (line generator, content type, file extension)
+FORMATS = {
+    "csv": (_csv_lines, "text/csv", "csv"),
+    "jsonl": (_jsonl_lines, "application/x-ndjson", "jsonl"),
+    "txt": (_txt_lines, "text/plain", "txt"),
+}
+
+
+def render(rows, fmt="txt"):
+    """ Formats (book_id, Book) rows as UTF-8 byte chunks of roughly
+    CHUNK_SIZE, pulling rows only as chunks are consumed. """
+    lines, _, _ = FORMATS[fmt]
+    pending, size = [], 0
+    for line in lines(rows):
+        pending.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield "".join(pending).encode("utf-8")
+            pending, size = [], 0
+    if pending:
+        yield "".join(pending).encode("utf-8")
+
+
+def gzipped(chunks, level=6):
+    """ Compresses a stream of byte chunks into a gzip stream. """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def write_report(path, rows, fmt="txt", compress=False):
+    """ Streams a report to a file; memory use doesn't grow with the catalog. """
+    chunks = render(rows, fmt)
+    if compress:
+        chunks = gzipped(chunks)
+    with open(path, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
@@ -0,0 +1,35 @@
+# Typed outcomes returned by the LMS service methods.
+
+import enum
+from collections import namedtuple
+
+
+class Outcome(enum.Enum):
+    OK = "ok"
+    INVALID_ID = "invalid_id"
+    ALREADY_ISSUED = "already_issued"
+    NOT_ISSUED = "not_issued"
+    BOOK_ISSUED = "book_issued"
+    EMPTY_TITLE = "empty_title"
+    MISSING_NAME = "missing_name"
+    LOAN_LIMIT = "loan_limit"
+    RENEWAL_LIMIT = "renewal_limit"
+    OVERDUE = "overdue"
+    UNKNOWN_MEMBER = "unknown_member"
+    UNKNOWN_TITLE = "unknown_title"
+    NO_COPY_AVAILABLE = "no_copy_available"
+
+
+class Result(namedtuple("Result", "outcome message book_id date due_date fine")):
+    """ What an LMS operation did. `message` is the text the CLI prints;
+    callers should branch on `outcome` rather than parse it. Issues and
+    renewals carry the loan's `due_date`; returns carry any `fine`. """
+
+    __slots__ = ()
+
+    def __new__(cls, outcome, message, book_id=None, date=None, due_date=None, fine=None):
+        return super().__new__(cls, outcome, message, book_id, date, due_date, fine)
+
+    @property
+    def ok(self):
+        return self.outcome is Outcome.OK
@@ -0,0 +1,113 @@
+# In-memory inverted index used by LMS for title searches.
+
+import re
+
+TOKEN_RE = re.compile(r"\w+")
+
+# Match quality of a single query word against a single book.
+EXACT, PREFIX, INFIX = 3, 2, 1
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class SearchIndex:
+    """ Keeps token -> book IDs postings plus a trigram index over the
+    vocabulary, so partial words are resolved without scanning the catalog.
+    Books are added and removed incrementally as the catalog changes. """
+
+    def __init__(self):
+        self.postings = {}      # token -> set of book IDs
+        self.grams = {}         # trigram / short prefix -> set of tokens
+        self.doc_tokens = {}    # book ID -> set of tokens
+        self.doc_text = {}      # book ID -> lowercased indexed text
+
+    @staticmethod
+    def _grams(token):
+        keys = {"^" + token[:n] for n in (1, 2) if len(token) >= n}
+        keys.update(token[i:i + 3] for i in range(len(token) - 2))
+        return keys
+
+    def add(self, book_id, text):
+        if book_id in self.doc_tokens:
+            self.remove(book_id)
+        tokens = set(tokenize(text))
+        self.doc_tokens[book_id] = tokens
+        self.doc_text[book_id] = " ".join(tokenize(text))
+        for token in tokens:
+            ids = self.postings.get(token)
+            if ids is None:
+                ids = self.postings[token] = set()
+                for gram in self._grams(token):
+                    self.grams.setdefault(gram, set()).add(token)
+            ids.add(book_id)
+
+    def remove(self, book_id):
+        tokens = self.doc_tokens.pop(book_id, ())
+        self.doc_text.pop(book_id, None)
+        for token in tokens:
+            ids = self.postings[token]
+            ids.discard(book_id)
+            if ids:
+                continue
+            del self.postings[token]
+            for gram in self._grams(token):
+                vocab = self.grams[gram]
+                vocab.discard(token)
+                if not vocab:
+                    del self.grams[gram]
+
+    def _candidate_tokens(self, word):
+        """ Vocabulary tokens that contain `word`, found via the gram index. """
+        if len(word) < 3:
+            return self.grams.get("^" + word, set())
+        found = None
+        for gram in self._grams(word):
+            if gram.startswith("^"):
+                continue
+            vocab = self.grams.get(gram)
+            if not vocab:
+                return set()
+            found = set(vocab) if found is None else found & vocab
+        return {t for t in found if word in t}
+
+    def _match_word(self, word):
+        """ Returns {book ID: match quality} for one query word. """
+        scores = {}
+        for token in self._candidate_tokens(word):
+            quality = EXACT if token == word else PREFIX if token.startswith(word) else INFIX
+            for book_id in self.postings[token]:
+                if scores.get(book_id, 0) < quality:
+                    scores[book_id] = quality
+        return scores
+
+    def search(self, query, limit=None):
+        """ Returns book IDs matching every word of `query`, best matches first.
+        Exact words rank above prefixes, prefixes above infixes, and titles
+        containing the whole query as a phrase rank above the rest. """
+        words = tokenize(query)
+        if not words:
+            return []
+        scores = None
+        # Resolve the rarest-looking (longest) words first to shrink the set early.
+        for word in sorted(set(words), key=len, reverse=True):
+            matches = self._match_word(word)
+            if scores is None:
+                scores = matches
+            else:
+                scores = {b: s + matches[b] for b, s in scores.items() if b in matches}
+            if not scores:
+                return []
+        phrase = " ".join(words)
+        ranked = []
+        for book_id, score in scores.items():
+            text = self.doc_text[book_id]
+            if text == phrase:
+                score += 10
+            elif phrase in text:
+                score += 5
+            ranked.append((-score, text, book_id))
+        ranked.sort()
+        ids = [book_id for _, _, book_id in ranked]
+        return ids[:limit] if limit is not None else ids
@@ -1,128 +1,390 @@
-import ast
-import sys
+import datetime
 import io
-import contextlib
-from flask import Flask, jsonify, request
+import json
+import os
+import threading
+import time
+import uuid
+import zlib
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
-import builtins
-from unittest.mock import patch
-
-# --- 1. Safe Loader for LMS Class ---
-def load_lms_class(file_path):
-    """
-    Reads main.py, extracts the LMS class definition, and executes it
-    so we can use the class without running the main loop.
-    """
-    with open(file_path, 'r') as f:
-        tree = ast.parse(f.read())
-    
-    # Filter for only Import/ImportFrom and ClassDef nodes
-    # We strictly want the class and necessary imports
-    body_nodes = []
-    for node in tree.body:
-        if isinstance(node, (ast.Import, ast.ImportFrom, ast.ClassDef)):
-            body_nodes.append(node)
-    
-    # Create a new module with just these nodes
-    module_ast = ast.Module(body=body_nodes, type_ignores=[])
-    
-    # Execute in a new namespace
-    namespace = {}
-    code = compile(module_ast, filename=file_path, mode='exec')
-    exec(code, namespace)
-    
-    return namespace['LMS']
-
-# Load the class
-try:
-    LMS = load_lms_class('main.py')
-    print("Successfully loaded LMS class from main.py")
-except Exception as e:
-    print(f"Error loading LMS class: {e}")
-    sys.exit(1)
-
-# Initialize App and LMS
+from cache import LRUCache, make_cache
+from catalog import AVAILABLE, read_books
+from compaction import loan_summary
+from feed import ChangeFeed
+from knowledge import ChatKnowledge
+from loans import LoanPolicy
+from main import LMS
+from members import member_dict
+from metrics import REGISTRY
+from profiling import SlowRequestProfiler
+from reports import FORMATS as REPORT_FORMATS
+from recommender import DEFAULT_DIM, Recommender
+from results import Outcome
+
+# --- 1. Initialize App and LMS ---
 app = Flask(__name__)
 CORS(app) # Enable CORS for frontend
 
-# We maintain a single instance, matching the logic in main.py
-lms = LMS("books.csv", "Central Library UOH")
-
-# --- 2. Helper to Run Interactive Methods ---
-def run_interactive_method(method, inputs):
-    """
-    Runs an interactive LMS method by mocking input() and capturing print() output.
-    """
-    input_iterator = iter(inputs)
-    
-    def side_effect(prompt=""):
-        try:
-            val = next(input_iterator)
-            return val
-        except StopIteration:
-            raise ValueError("Not enough inputs provided for this operation")
-
-    captured_output = io.StringIO()
-    
-    try:
-        with patch('builtins.input', side_effect=side_effect):
-            with contextlib.redirect_stdout(captured_output):
-                method()
-    except Exception as e:
-        return False, str(e), captured_output.getvalue()
+# We maintain a single instance per process, matching the logic in main.py.
+# Every gunicorn worker opens the same SQLite (WAL) database, which arbitrates
+# issue/return with check-and-set updates; before each request the worker
+# replays whatever the other workers committed since it last looked.
+lms = LMS("books.csv", "Central Library UOH", policy=LoanPolicy.from_env())
+
+# --- 1b. Instrumentation ---
+# Per-route latency and in-flight requests, alongside the LMS operation,
+# database and file timings recorded by main.py, storage.py and
+# writer.py; all of it is served on /metrics. The hooks are registered
+# before sync_state so the catch-up replay counts towards the request.
+REQUEST_SECONDS = REGISTRY.histogram(
+    "lms_http_request_seconds", "Time to handle a request, by route.", ("route", "method", "status"))
+IN_FLIGHT = REGISTRY.gauge("lms_http_requests_in_flight", "Requests this worker is handling.")
+CHAT_STAGE_SECONDS = REGISTRY.histogram(
+    "lms_chat_stage_seconds", "Time spent in each step of a chat reply.", ("stage",))
+REGISTRY.gauge("lms_catalog_books", "Books in the catalog.", fn=lambda: lms.stats.total)
+REGISTRY.gauge("lms_catalog_issued_books", "Books out on loan.", fn=lambda: lms.stats.issued)
+REGISTRY.gauge("lms_events", "Entries in the event log.", fn=lambda: len(lms.events))
+REGISTRY.gauge("lms_events_live", "Events not yet archived.",
+               fn=lambda: len(lms.events) - lms.events.base)
+REGISTRY.gauge("lms_archive_bytes", "Size of the log archive.", fn=lambda: lms.archive.stats()["bytes"])
+
+# Off unless PROFILE_SAMPLE_RATE is set (or turned on via
+# /api/admin/profiling); see profiling.py.
+profiler = SlowRequestProfiler(
+    sample_rate=float(os.environ.get("PROFILE_SAMPLE_RATE", 0)),
+    slow_ms=float(os.environ.get("PROFILE_SLOW_MS", 500)),
+    directory=os.environ.get("PROFILE_DIR", "profiles"),
+)
+
+@app.before_request
+def start_request():
+    g.request_start = time.perf_counter()
+    g.profile = profiler.start()
+    IN_FLIGHT.inc()
+
+@app.after_request
+def record_status(response):
+    g.status = response.status_code
+    return response
+
+@app.teardown_request
+def finish_request(exc):
+    start = g.pop('request_start', None)
+    if start is None:
+        return
+    IN_FLIGHT.dec()
+    elapsed = time.perf_counter() - start
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUEST_SECONDS.labels(route, request.method, g.get('status', 500)).observe(elapsed)
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profiler.finish(profile, f"{request.method} {route}", elapsed)
+
+@app.before_request
+def sync_state():
+    lms.sync()
+
+# --- 2. Mapping LMS Results to HTTP Responses ---
+HTTP_STATUS = {
+    Outcome.OK: 200,
+    Outcome.INVALID_ID: 404,
+    Outcome.ALREADY_ISSUED: 409,
+    Outcome.NOT_ISSUED: 409,
+    Outcome.BOOK_ISSUED: 409,
+    Outcome.EMPTY_TITLE: 400,
+    Outcome.MISSING_NAME: 400,
+    Outcome.LOAN_LIMIT: 403,
+    Outcome.RENEWAL_LIMIT: 409,
+    Outcome.OVERDUE: 409,
+    Outcome.UNKNOWN_MEMBER: 404,
+    Outcome.UNKNOWN_TITLE: 404,
+    Outcome.NO_COPY_AVAILABLE: 409,
+}
 
-    return True, "Success", captured_output.getvalue()
+def result_body(result):
+    """The JSON object the frontend expects for an LMS Result."""
+    body = {
+        "success": result.ok,
+        "message": result.message,
+        "outcome": result.outcome.value,
+        "book_id": result.book_id,
+    }
+    if result.date:
+        body["date"] = result.date
+    if result.due_date:
+        body["due_date"] = result.due_date
+    if result.fine is not None:
+        body["fine"] = result.fine
+    return body
+
+def result_response(result):
+    """Turns an LMS Result into a JSON response with a matching status code."""
+    return jsonify(result_body(result)), HTTP_STATUS[result.outcome]
+
+def batch_response(results):
+    """Per-item results of a batch call. The batch itself always succeeds
+    (200); each item carries its own success flag and outcome."""
+    bodies = [result_body(result) for result in results]
+    succeeded = sum(body["success"] for body in bodies)
+    return jsonify({
+        "success": succeeded == len(bodies),
+        "succeeded": succeeded,
+        "failed": len(bodies) - succeeded,
+        "results": bodies,
+    })
 
 
 # --- 3. API Endpoints ---
 
+# --- 3.0 Catalog Listing ---
+# Filtered/sorted ID lists and serialized pages are cached per catalog
+# version, so repeated reads of an unchanged catalog cost one dict lookup.
+# ETags carry a per-process token because LMS.version is only meaningful
+# inside one worker.
+INSTANCE_TAG = uuid.uuid4().hex[:8]
+MAX_PAGE_SIZE = 1000
+BOOK_SORTS = ('id', '-id', 'title', '-title', 'relevance')
+book_views = LRUCache(32)
+
+# Serialized response bodies of /api/books, /api/stats, /api/history and
+# /api/chat, keyed by the data version they were computed at. By default
+# each worker keeps its own; RESPONSE_CACHE=sqlite:<path> shares one
+# store between the workers of a host (see cache.py).
+responses = make_cache(
+    os.environ.get("RESPONSE_CACHE", ""),
+    maxsize=int(os.environ.get("RESPONSE_CACHE_SIZE", 1024)),
+    ttl=float(os.environ.get("RESPONSE_CACHE_TTL", 300)) or None,
+    maxbytes=int(os.environ.get("RESPONSE_CACHE_BYTES", 64 * 1024 * 1024)),
+)
+REGISTRY.counter("lms_response_cache_hits_total", "Response cache hits in this worker.",
+                 fn=lambda: responses.hits)
+REGISTRY.counter("lms_response_cache_misses_total", "Response cache misses in this worker.",
+                 fn=lambda: responses.misses)
+REGISTRY.counter("lms_response_cache_evictions_total", "Response cache entries evicted.",
+                 fn=lambda: responses.evictions)
+
+def cache_version():
+    """The data version response-cache keys embed. LMS.version moves on
+    every change this worker applies (its own writes, other workers'
+    replayed by sync, new members); it only means something inside one
+    process, so a shared store keys on the storage journal position
+    instead, which every worker sees the same after sync(). New members
+    don't move that one, so shared stats may lag by up to the TTL."""
+    return lms.seq if responses.shared else lms.version
+
+def book_view(version, status, subject, query, sort):
+    """Ordered (book ID, Book) pairs matching the filters at a catalog
+    version. Filtering works on a snapshot of the catalog, so books
+    deleted meanwhile (here or replayed by sync) just drop out."""
+    key = (version, status, subject, query, sort)
+    pairs = book_views.get(key)
+    if pairs is not None:
+        return pairs
+    pairs = lms.books()
+    if query:
+        books = dict(pairs)
+        pairs = [(bid, books[bid]) for bid in lms.search(query) if bid in books]
+    if status == 'available':
+        pairs = [(bid, book) for bid, book in pairs if book.status == AVAILABLE]
+    elif status == 'issued':
+        pairs = [(bid, book) for bid, book in pairs if book.status != AVAILABLE]
+    if subject:
+        pairs = [(bid, book) for bid, book in pairs if book.subject.lower() == subject]
+    if sort in ('title', '-title'):
+        pairs.sort(key=lambda pair: pair[1].title.lower(), reverse=sort == '-title')
+    elif sort in ('id', '-id'):
+        pairs.sort(key=lambda pair: int(pair[0]), reverse=sort == '-id')
+    book_views.put(key, pairs)
+    return pairs
+
+def title_view(version, status, subject, query, sort):
+    """The titles of book_view's copies, in the same order, each with its
+    copy and availability counts."""
+    key = ('title', version, status, subject, query, sort)
+    titles = book_views.get(key)
+    if titles is None:
+        pairs = book_view(version, status, subject, query, sort)
+        titles = lms.titles.grouped(bid for bid, _ in pairs)
+        book_views.put(key, titles)
+    return titles
+
 @app.route('/api/books', methods=['GET'])
 def get_books():
-    """Returns the books dictionary directly."""
-    # Convert internal dict to list for easier frontend consumption
-    # Structure: {id: {details...}}
-    books_list = []
-    for book_id, details in lms.books_dict.items():
-        books_list.append({
-            "id": book_id,
-            **details
-        })
-    return jsonify(books_list)
+    """Returns the catalog as a JSON list of books.
+
+    Optional query parameters:
+      status=available|issued, subject=<name>, q=<title/author keywords>,
+      sort=id|-id|title|-title (default id, or relevance when q is given),
+      limit=<n> with offset=<n> or cursor=<last id of the previous page>,
+      group=title for one row per title (title_id, copies, available,
+      copy_ids) instead of one per copy; cursors are then title IDs.
+    Without limit the whole (filtered) catalog is returned, as before.
+    Paging info is sent in X-Total-Count / X-Next-Cursor headers so the
+    body stays a plain list.
+    """
+    args = request.args
+    status = args.get('status', '').lower()
+    subject = args.get('subject', '').lower()
+    query = args.get('q', '').strip()
+    sort = args.get('sort', 'relevance' if query else 'id')
+    if status not in ('', 'available', 'issued'):
+        return jsonify({"success": False, "message": "status must be available or issued"}), 400
+    if sort not in BOOK_SORTS:
+        return jsonify({"success": False,
+                        "message": f"sort must be one of {', '.join(BOOK_SORTS)}"}), 400
+    try:
+        limit = min(max(int(args['limit']), 1), MAX_PAGE_SIZE) if 'limit' in args else None
+        offset = max(int(args.get('offset', 0)), 0)
+    except ValueError:
+        return jsonify({"success": False, "message": "limit and offset must be integers"}), 400
+    cursor = args.get('cursor')
+    group = args.get('group', '')
+    if group not in ('', 'title'):
+        return jsonify({"success": False, "message": "group must be title"}), 400
+
+    version = lms.version
+    etag = f"{INSTANCE_TAG}-{version}-{zlib.crc32(request.query_string):08x}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        key = ('books', cache_version(), request.query_string)
+        page = responses.get(key)
+        if page is None:
+            if group:
+                titles = title_view(version, status, subject, query, sort)
+                ids = [title['title_id'] for title in titles]
+            else:
+                pairs = book_view(version, status, subject, query, sort)
+                ids = [bid for bid, _ in pairs]
+            if cursor:
+                try:
+                    offset = ids.index(cursor) + 1
+                except ValueError:
+                    return jsonify({"success": False, "message": "Unknown cursor"}), 400
+            end = len(ids) if limit is None else offset + limit
+            if group:
+                rows = titles[offset:end]
+            else:
+                rows = [{"id": bid, **book.to_dict()} for bid, book in pairs[offset:end]]
+            body = json.dumps(rows, separators=(',', ':'))
+            next_cursor = ids[end - 1] if end < len(ids) else None
+            page = (body, len(ids), next_cursor)
+            responses.put(key, page)
+        body, total, next_cursor = page
+        response = Response(body, mimetype='application/json')
+        response.headers['X-Total-Count'] = str(total)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/report', methods=['GET'])
+def get_report():
+    """Streams a catalog report as a download.
+
+    Query parameters: format=csv|jsonl|txt (default csv),
+    status=available|issued, subject=<name>, gzip=1 for a .gz file.
+    Clients sending Accept-Encoding: gzip get it compressed in transit.
+    Rows come from a storage cursor and are compressed chunk by chunk,
+    so memory use stays flat however large the catalog is.
+    """
+    fmt = request.args.get('format', 'csv').lower()
+    if fmt not in REPORT_FORMATS:
+        return jsonify({"success": False,
+                        "message": f"format must be one of {', '.join(REPORT_FORMATS)}"}), 400
+    status = request.args.get('status', '').lower() or None
+    if status not in (None, 'available', 'issued'):
+        return jsonify({"success": False, "message": "status must be available or issued"}), 400
+    as_file = request.args.get('gzip') in ('1', 'true')
+    in_transit = not as_file and 'gzip' in request.headers.get('Accept-Encoding', '')
+    chunks = lms.report(fmt, status, request.args.get('subject') or None,
+                        compress=as_file or in_transit)
+    _, mimetype, extension = REPORT_FORMATS[fmt]
+    filename = f"library_report.{extension}"
+    if as_file:
+        mimetype, filename = 'application/gzip', filename + '.gz'
+    response = Response(chunks, mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Vary'] = 'Accept-Encoding'
+    if in_transit:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """This worker's metrics in the Prometheus text format."""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/cache', methods=['GET'])
+def cache_stats():
+    """Hit/miss/size counters of this worker's caches."""
+    return jsonify({"responses": responses.stats(), "views": book_views.stats()})
+
+@app.route('/api/admin/profiling', methods=['GET', 'POST'])
+def profiling_settings():
+    """Shows or changes (admin only) the slow-request profiler settings:
+    {"sample_rate": 0..1, "slow_ms": n}. Applies to the worker that
+    answers, like the environment variables it overrides."""
+    if request.method == 'POST':
+        if request.headers.get('role') != 'admin':
+            return jsonify({"success": False, "message": "Unauthorized"}), 403
+        data = request.json or {}
+        try:
+            if 'sample_rate' in data:
+                profiler.sample_rate = min(max(float(data['sample_rate']), 0.0), 1.0)
+            if 'slow_ms' in data:
+                profiler.slow_ms = max(float(data['slow_ms']), 0.0)
+        except (TypeError, ValueError):
+            return jsonify({"success": False, "message": "sample_rate and slow_ms must be numbers"}), 400
+    return jsonify({"sample_rate": profiler.sample_rate, "slow_ms": profiler.slow_ms,
+                    "directory": profiler.directory, "dumped": profiler.dumped})
 
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
-    total = len(lms.books_dict)
-    issued = sum(1 for b in lms.books_dict.values() if b["Status"] != "Available")
-    return jsonify({
-        "total_books": total,
-        "issued_books": issued,
-        "available_books": total - issued,
-        "members": 150 # Mock value since member tracking isn't in backend
-    })
+    """Counters are maintained incrementally by LMS; ?verify=1 recomputes
+    them from the catalog and reports whether they had drifted."""
+    verify = request.args.get('verify')
+    key = ('stats', cache_version())
+    body = None if verify else responses.get(key)
+    if body is None:
+        consistent = lms.check_stats() if verify else None
+        stats = lms.stats.snapshot()
+        stats["members"] = lms.storage.count_members()
+        if consistent is not None:
+            stats["consistent"] = consistent
+        body = app.json.dumps(stats)
+        if not verify:
+            responses.put(key, body)
+    return Response(body, mimetype='application/json')
 
 @app.route('/api/issue', methods=['POST'])
 def issue_book():
+    """Body: {"book_id" or "title_id", "user_name" and/or "member_id"}.
+    With title_id, any available copy of that title is issued; the
+    response's book_id says which."""
     data = request.json
     book_id = data.get('book_id')
+    title_id = data.get('title_id')
     user_name = data.get('user_name')
+    member_id = data.get('member_id')
     
-    if not book_id or not user_name:
+    if not (book_id or title_id) or not (user_name or member_id):
         return jsonify({"success": False, "message": "Missing book_id or user_name"}), 400
 
-    # LMS.Issue_books asks for: Book ID, Name.
-    inputs = [str(book_id), str(user_name)]
-    
-    success, error, logs = run_interactive_method(lms.Issue_books, inputs)
-    
-    # Check if logic succeeded by parsing logs or checking state (simple naive check for now)
-    if "Book issued successfully" in logs:
-        return jsonify({"success": True, "message": "Book Issued", "logs": logs})
-    elif "Invalid Book ID" in logs:
-        return jsonify({"success": False, "message": "Invalid Book ID", "logs": logs}), 404
-    elif "Book already issued" in logs:
-        return jsonify({"success": False, "message": "Book Already Issued", "logs": logs}), 409
-    
-    return jsonify({"success": success, "message": "Operation completed", "logs": logs})
+    member_id = str(member_id) if member_id else None
+    if not book_id:
+        return result_response(lms.issue_title(str(title_id), str(user_name or ''), member_id))
+    return result_response(lms.issue(str(book_id), str(user_name or ''), member_id))
+
+@app.route('/api/titles/<title_id>', methods=['GET'])
+def get_title(title_id):
+    """One title with its copy IDs and how many are on the shelf."""
+    title = lms.titles.get(title_id)
+    if title is None:
+        return jsonify({"success": False, "message": "Unknown title"}), 404
+    return jsonify(title)
 
 @app.route('/api/return', methods=['POST'])
 def return_book():
@@ -132,15 +394,7 @@ def return_book():
     if not book_id:
         return jsonify({"success": False, "message": "Missing book_id"}), 400
 
-    # LMS.return_books asks for: Book ID
-    inputs = [str(book_id)]
-    
-    success, error, logs = run_interactive_method(lms.return_books, inputs)
-    
-    if "Book returned successfully" in logs:
-        return jsonify({"success": True, "message": "Book Returned", "logs": logs})
-    
-    return jsonify({"success": success, "message": "Operation completed", "logs": logs})
+    return result_response(lms.return_book(str(book_id)))
 
 @app.route('/api/add', methods=['POST'])
 def add_book():
@@ -150,12 +404,106 @@ def add_book():
     if not title:
         return jsonify({"success": False, "message": "Missing title"}), 400
 
-    # LMS.add_books asks for: Title
-    inputs = [str(title)]
-    
-    success, error, logs = run_interactive_method(lms.add_books, inputs)
-    
-    return jsonify({"success": True, "message": "Book Added", "logs": logs})
+    return result_response(lms.add(
+        str(title),
+        author=str(data.get('author', '')),
+        subject=str(data.get('subject', '')),
+        publisher=str(data.get('publisher', '')),
+    ))
+
+@app.route('/api/renew', methods=['POST'])
+def renew_book():
+    data = request.json
+    book_id = data.get('book_id')
+
+    if not book_id:
+        return jsonify({"success": False, "message": "Missing book_id"}), 400
+
+    return result_response(lms.renew(str(book_id)))
+
+@app.route('/api/members/<member_id>/loans', methods=['GET'])
+def get_member_loans(member_id):
+    """What a member has out now, plus their most recent loans
+    (?history=<n>, default 50, 0 to skip)."""
+    try:
+        history = min(max(int(request.args.get('history', 50)), 0), MAX_HISTORY_PAGE)
+    except ValueError:
+        return jsonify({"success": False, "message": "history must be a number"}), 400
+    found = lms.member_loans(member_id, history)
+    if found is None:
+        return jsonify({"success": False, "message": "Unknown member"}), 404
+    member, active, past = found
+    return jsonify({
+        "member": member_dict(member),
+        "active": [{"id": book_id, **book.to_dict()} for book_id, book in active],
+        "history": past,
+    })
+
+@app.route('/api/overdue', methods=['GET'])
+def get_overdue():
+    """Loans past their due date, most overdue first (?limit=<n>, default 100).
+    Served from LMS's due-date heap, so only overdue loans are visited."""
+    try:
+        limit = min(max(int(request.args.get('limit', 100)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"success": False, "message": "limit must be a number"}), 400
+    return jsonify([
+        {"id": book_id, **book.to_dict(), "days_overdue": days, "fine": fine}
+        for book_id, book, days, fine in lms.overdue(limit=limit)
+    ])
+
+# --- 3.1 Batch Endpoints ---
+# Semester-start checkouts and publisher imports go through these: the whole
+# batch is committed with one database transaction and one append per file.
+MAX_BATCH = 5000
+
+def batch_items(key):
+    """The list under `key` in the JSON body, or an error response."""
+    items = (request.get_json(silent=True) or {}).get(key)
+    if not isinstance(items, list) or not items:
+        return None, (jsonify({"success": False, "message": f"Missing {key} list"}), 400)
+    if len(items) > MAX_BATCH:
+        return None, (jsonify({"success": False,
+                               "message": f"At most {MAX_BATCH} items per batch"}), 413)
+    return items, None
+
+@app.route('/api/issue/batch', methods=['POST'])
+def issue_batch():
+    """Body: {"items": [{"book_id": ..., "user_name": ..., "member_id"?: ...}, ...]}."""
+    items, error = batch_items('items')
+    if error:
+        return error
+    loans = [(str(item.get('book_id', '')), str(item.get('user_name', '')),
+              str(item.get('member_id') or ''))
+             if isinstance(item, dict) else ('', '', '') for item in items]
+    return batch_response(lms.issue_many(loans))
+
+@app.route('/api/return/batch', methods=['POST'])
+def return_batch():
+    """Body: {"book_ids": [...]}."""
+    book_ids, error = batch_items('book_ids')
+    if error:
+        return error
+    return batch_response(lms.return_many(str(book_id) for book_id in book_ids))
+
+@app.route('/api/add/batch', methods=['POST'])
+def add_batch():
+    """Imports a catalog CSV (books.csv format, header optional), sent
+    either as the raw request body or as an uploaded "file" form field.
+    Rows are parsed as they stream in rather than buffered as text."""
+    if request.headers.get('role') != 'admin':
+        return jsonify({"success": False, "message": "Unauthorized"}), 403
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    books = []
+    for book in read_books(io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')):
+        books.append(book)
+        if len(books) > MAX_BATCH:
+            return jsonify({"success": False,
+                            "message": f"At most {MAX_BATCH} books per import"}), 413
+    if not books:
+        return jsonify({"success": False, "message": "No books in upload"}), 400
+    return batch_response(lms.add_many(books))
 
 @app.route('/api/delete', methods=['POST'])
 def delete_book():
@@ -170,13 +518,10 @@ def delete_book():
     if not book_id:
         return jsonify({"success": False, "message": "Missing book_id"}), 400
 
-    inputs = [str(book_id), str(confirm)]
-    success, error, logs = run_interactive_method(lms.delete_books, inputs)
-    
-    if "Book deleted successfully" in logs:
-        return jsonify({"success": True, "message": "Book Deleted", "logs": logs})
-        
-    return jsonify({"success": False, "message": "Delete Failed", "logs": logs})
+    if str(confirm).lower() != 'y':
+        return jsonify({"success": False, "message": "Delete cancelled"}), 400
+
+    return result_response(lms.delete(str(book_id)))
 
 @app.route('/api/login', methods=['POST'])
 def login():
@@ -225,12 +570,14 @@ def login():
         if not mobile.isdigit() or len(mobile) != 10:
              return jsonify({"success": False, "message": "Mobile must be 10 digits"}), 400
              
-        # Success - Return a student user object
-        # We derive a name from email for display
-        name = email.split('@')[0].title()
+        # Success - register the student on first login (the name is
+        # derived from the email) and return their stable member ID
+        member = lms.register_member(email.split('@')[0].title(), email, mobile)
+        if member.mobile != mobile:
+             return jsonify({"success": False, "message": "Mobile doesn't match this email"}), 401
         return jsonify({
             "success": True,
-            "user": {"name": name, "role": "student", "email": email, "id": f"STD-{mobile[-4:]}"}
+            "user": {"name": member.name, "role": "student", "email": member.email, "id": member.id}
         })
 
     return jsonify({"success": False, "message": "Invalid Role"}), 400
@@ -238,145 +585,269 @@ def login():
     return jsonify({"success": False, "message": "Invalid Role"}), 400
 
 # --- 3.1 History Endpoint ---
+MAX_HISTORY_PAGE = 1000
+
+def parse_date_arg(value, end=False):
+    """Accepts YYYY-MM-DD or YYYY-MM-DD HH:MM:SS; a bare date used as the
+    end of a range covers that whole day."""
+    moment = datetime.datetime.fromisoformat(value)
+    if end and len(value) == 10:
+        moment += datetime.timedelta(days=1)
+    return moment.timestamp()
+
 @app.route('/api/history', methods=['GET'])
 def get_history():
-    """Parses issue_log.txt to return structured history data."""
-    if not hasattr(lms, 'log_file'):
-        return jsonify([])
+    """Newest-first page of library events from the structured event log.
 
-    history = []
+    Optional query parameters: limit (default 100), before=<seq> to page
+    further back, user, book_id, since/until dates, or after=<seq> to tail
+    events newer than the last one seen (returned oldest first).
+    """
+    args = request.args
     try:
-        with open(lms.log_file, 'r') as f:
-            for line in f:
-                import re
-                match = re.match(r"(.*?) (issued|returned) \'(.*?)\' on (.*)", line.strip())
-                if match:
-                    history.append({
-                        "user": match.group(1),
-                        "action": match.group(2),
-                        "book": match.group(3),
-                        "date": match.group(4)
-                    })
-                # Fallback for simple lines
-                elif "issued" in line:
-                    history.append({"raw": line.strip(), "action": "issued"})
-    except FileNotFoundError:
-        pass
-    
-    return jsonify(history[::-1])
+        limit = min(max(int(args.get('limit', 100)), 1), MAX_HISTORY_PAGE)
+        if 'after' in args:
+            return jsonify(lms.events.tail(int(args['after']), limit))
+        before = int(args['before']) if 'before' in args else None
+        book_id = str(int(args['book_id'])) if args.get('book_id') else None
+        since = parse_date_arg(args['since']) if 'since' in args else None
+        until = parse_date_arg(args['until'], end=True) if 'until' in args else None
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid history query"}), 400
+
+    # The log only grows, so its length versions every page exactly, in
+    # every worker (they share the file).
+    key = ('history', len(lms.events), request.query_string)
+    page = responses.get(key)
+    if page is None:
+        events = lms.events.query(limit, before=before, user=args.get('user'),
+                                  book_id=book_id, since=since, until=until)
+        next_cursor = str(events[-1]["seq"]) if len(events) == limit else None
+        page = (app.json.dumps(events), next_cursor)
+        responses.put(key, page)
+    body, next_cursor = page
+    response = Response(body, mimetype='application/json')
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+@app.route('/api/history/summary', methods=['GET'])
+def history_summary():
+    """What compaction has archived so far: segment counts and sizes, and
+    the closed loans folded out of the archived events (per month, busiest
+    books and borrowers, average length)."""
+    return jsonify({
+        "events": len(lms.events),
+        "live_events": len(lms.events) - lms.events.base,
+        "archive": lms.archive.stats(),
+        "loans": loan_summary(lms.archive),
+    })
 
-# --- 4. AI Chatbot Logic ---
+# --- 3.2 Change Feed ---
+# Catalog changes are pushed to browsers over Server-Sent Events, so a
+# client keeps its copy of /api/books and /api/stats current by applying
+# deltas instead of refetching. Each worker publishes what its LMS
+# listener sees: its own writes, and other workers' writes as sync()
+# replays them (a poller keeps syncing while anyone is subscribed).
+# Event IDs carry the worker's INSTANCE_TAG, so a reconnect that lands on
+# another worker, or falls behind the replay buffer, gets a "resync"
+# event and refetches.
+feed = ChangeFeed(int(os.environ.get("FEED_SIZE", 1024)), INSTANCE_TAG)
+SSE_HEARTBEAT = 15
+SSE_MAX_SECONDS = int(os.environ.get("SSE_MAX_SECONDS", 300))
+SSE_MAX_SUBSCRIBERS = int(os.environ.get("SSE_MAX_SUBSCRIBERS", 100))
+# Under a threaded WSGI worker every open stream holds one of its THREADS
+# (see Procfile) for up to SSE_MAX_SECONDS, so by default only half of
+# them may stream and the rest stay free for ordinary requests. asgi.py
+# pulls streams on a pool of their own and marks its requests
+# lms.stream_pool, so only SSE_MAX_SUBSCRIBERS applies there.
+SSE_MAX_WSGI_SUBSCRIBERS = int(os.environ.get(
+    "SSE_MAX_WSGI_SUBSCRIBERS", max(int(os.environ.get("THREADS", 32)) // 2, 1)))
+FEED_POLL_SECONDS = 1.0
+REGISTRY.gauge("lms_feed_subscribers", "Open /api/events streams.", fn=lambda: feed.subscribers)
+
+def publish_change(action, book_id, book):
+    if action == "reloaded":
+        feed.publish("resync", {})
+        return
+    stats = lms.stats
+    feed.publish("change", {
+        "action": action,
+        "id": book_id,
+        "book": None if action == "deleted" else {"id": book_id, **book.to_dict()},
+        "stats": {"total_books": stats.total, "issued_books": stats.issued,
+                  "available_books": stats.total - stats.issued},
+    })
 
-# In-Memory Knowledge Base for "Semantic" Search
-# Maps keywords/concepts -> Book Title or ID hints
-KNOWLEDGE_BASE = {
-    "sherlock": ["Sherlock Holmes", "detective", "mystery", "client", "watson"],
-    "holmes": ["Sherlock Holmes", "detective", "mystery", "client", "watson"],
-    "watson": ["Sherlock Holmes"],
-    "detective": ["Sherlock Holmes", "Case of the Lame Canary", "Agatha Christie"],
-    "dinosaur": ["Jurassic Park"],
-    "jurassic": ["Jurassic Park"],
-    "langdon": ["Angels & Demons"],
-    "illuminati": ["Angels & Demons"],
-    "vatican": ["Angels & Demons"],
-    "raskolnikov": ["Crime and Punishment"],
-    "murder": ["Crime and Punishment", "Sherlock Holmes"],
-    "napoleon": ["Animal Farm"],
-    "pig": ["Animal Farm"],
-    "communis": ["Animal Farm", "Karl Marx"],
-    "big brother": ["1984" , "Animal Farm"], # 1984 might not be in csv, but good for chat
-    "wizard": ["Harry Potter"], # If in CSV
-    "magic": ["Harry Potter", "The Amulet of Samarkand"],
-    "hobbit": ["Lord of the Rings"],
-    "ring": ["Lord of the Rings"],
-    "economics": ["Wealth of Nations", "Freakonomics", "Superfreakonomics"],
-    "freak": ["Freakonomics"],
-    "physics": ["Physics & Philosophy", "Tao of Physics", "Feynman"],
-    "feynman": ["Surely You're Joking Mr Feynman"],
-    "joking": ["Surely You're Joking Mr Feynman"],
-    "wavelet": ["Fundamentals of Wavelets"],
-    "signal": ["Fundamentals of Wavelets", "Signals and Systems"],
-    "india": ["Discovery of India", "Integration of the Indian States", "India from Midnight to Milennium"],
-    "nehru": ["Discovery of India"],
-    "gandhi": ["My Experiments with Truth"],
-    "hitler": ["Mein Kampf"],
-    "war": ["Mein Kampf", "War and Peace", "Farewell to Arms", "Once There Was a War"],
-    "hemingway": ["Farewell to Arms"],
-    "steinbeck": ["Grapes of Wrath", "Russian Journal", "Moon is Down"],
-    "grapes": ["Grapes of Wrath"],
-    "monk": ["The Monk Who Sold His Ferrari"],
-    "ferrari": ["The Monk Who Sold His Ferrari"],
-    "kalam": ["Wings of Fire"],
-    "fire": ["Wings of Fire", "Harry Potter", "Girl who played with Fire"],
-    "girl": ["Girl with the Dragon Tattoo", "Girl who played with Fire"],
-    "dragon": ["Girl with the Dragon Tattoo"],
-    "tattoo": ["Girl with the Dragon Tattoo"],
-    "vampire": ["Twilight", "Dracula"],
-    "potter": ["Harry Potter"],
-}
+lms.add_listener(publish_change)
+
+_poller_lock = threading.Lock()
+_poller = None
+
+def follow_other_workers():
+    """Starts (once) the thread that syncs while streams are open."""
+    global _poller
+    with _poller_lock:
+        if _poller is not None:
+            return
+        def poll():
+            while True:
+                time.sleep(FEED_POLL_SECONDS)
+                if feed.subscribers:
+                    lms.sync()
+        _poller = threading.Thread(target=poll, daemon=True)
+        _poller.start()
+
+def sse(kind, seq, payload):
+    return f"id: {feed.event_id(seq)}\nevent: {kind}\ndata: {payload}\n\n"
+
+@app.route('/api/events', methods=['GET'])
+def change_events():
+    """text/event-stream of catalog changes.
+
+    "change" events carry {seq, action, id, book, stats}, where book is
+    the row as /api/books returns it (null once deleted) and stats the
+    new totals. "resync" means deltas were missed: refetch, then carry on.
+    Reconnects send Last-Event-ID (EventSource does this itself) to
+    replay what was missed. Streams end after SSE_MAX_SECONDS so worker
+    threads get recycled; EventSource reconnects transparently. Answers
+    503 under a single-threaded (sync) worker, and once the worker has
+    as many streams open as it may (see SSE_MAX_WSGI_SUBSCRIBERS).
+    """
+    if not request.environ.get('wsgi.multithread'):
+        # A stream would hold this worker's only thread for minutes; the
+        # browser gets an error, stops reconnecting and refetches instead.
+        return jsonify({"success": False,
+                        "message": "Live updates need a threaded worker (gthread or asgi)"}), 503
+    last = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    after = feed.parse_id(last) if last else feed.seq
+    limit = SSE_MAX_SUBSCRIBERS
+    if not request.environ.get('lms.stream_pool'):
+        limit = min(limit, SSE_MAX_WSGI_SUBSCRIBERS)
+    if not feed.subscribe(limit):
+        return jsonify({"success": False, "message": "Too many open event streams"}), 503, \
+            {"Retry-After": "5"}
+    follow_other_workers()
+
+    def stream(after):
+        try:
+            yield "retry: 3000\n\n"
+            deadline = time.monotonic() + SSE_MAX_SECONDS
+            while True:
+                if after is None:
+                    after = feed.seq
+                    yield sse("resync", after, "{}")
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                messages, gap = feed.wait(after, min(SSE_HEARTBEAT, remaining))
+                if gap:
+                    after = None
+                elif messages:
+                    yield "".join(sse(kind, seq, payload) for seq, kind, payload in messages)
+                    after = messages[-1][0]
+                else:
+                    yield ": ping\n\n"
+        finally:
+            feed.unsubscribe()
+
+    return Response(stream(after), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
-@app.route('/api/chat', methods=['POST'])
-def chat():
-    data = request.json
-    message = data.get('message', '').lower()
-    
-    if not message:
-        return jsonify({"response": "I'm listening! Ask me about any book, character, or topic."})
+# --- 4. AI Chatbot Logic ---
 
-    # 1. Direct Search in Books (Title/Author)
-    found_books = []
-    for bid, info in lms.books_dict.items():
-        if message in info['books_title'].lower() or message in info.get('author', '').lower():
-            found_books.append(f"{info['books_title']} (ID: {bid})")
+# The knowledge base (knowledge.py) is compiled once at startup and its
+# concept -> book map follows catalog changes through an LMS listener.
+knowledge = ChatKnowledge().attach(lms)
+
+# Local TF-IDF/co-borrowing engine (recommender.py) for questions the
+# knowledge base doesn't cover; also follows catalog changes.
+recommender = Recommender(int(os.environ.get("RECOMMENDER_DIM", DEFAULT_DIM))).attach(lms)
+MIN_RECOMMENDATION_SCORE = 0.25
+
+def book_labels(book_ids, template):
+    """Formats search hits for chat replies, skipping books deleted since the search ran."""
+    labels = []
+    for bid in book_ids:
+        book = lms.books_dict.get(bid)
+        if book is not None:
+            labels.append(template.format(title=book.title, id=bid))
+    return labels
+
+def normalize_message(message):
+    """Lowercased, whitespace collapsed and trailing punctuation dropped,
+    so trivially different phrasings share one cached answer."""
+    return " ".join(message.lower().split()).strip(" ?!.,;:")
+
+def chat_reply(message):
+    """The chatbot's answer to a normalized message."""
+    # 1. Direct Search in Books (Title/Author) via the inverted index
+    with CHAT_STAGE_SECONDS.labels('search').time():
+        found_ids = lms.search(message, limit=3)
+    found_books = book_labels(found_ids, "{title} (ID: {id})")
 
     # 2. Semantic Search in Knowledge Base
-    # Check if any keyword in message exists in our KB
-    related_concepts = []
-    
-    # Simple tokenization
-    import re
-    tokens = re.findall(r'\w+', message)
-    
-    for token in tokens:
-        # Check direct matches in KB keys
-        for key, values in KNOWLEDGE_BASE.items():
-            if key in token: # e.g. "dinosaurs" matches "dinosaur"
-                related_concepts.extend(values)
-        
-        # Check against mapped values (reverse lookup extremely simple)
-        # (Skip for now to keep it fast)
-
-    # Dedup
-    found_books = list(set(found_books))
-    related_concepts = list(set(related_concepts))
+    # One automaton pass over the whole message finds every KB key in it
+    # (e.g. "dinosaurs" matches "dinosaur", and "big brother" matches too).
+    with CHAT_STAGE_SECONDS.labels('knowledge').time():
+        related_concepts = knowledge.related(message)
     
     response_text = ""
     
     if found_books:
         response_text += f"I found these books matching '{message}': " + ", ".join(found_books[:3]) + ". "
     
+    valid_recommendations = []
     if related_concepts:
-        # Filter related concepts to see if they are actually in our library
-        # This implementation assumes the KB values are Titles.
-        # Let's find IDs for them.
-        valid_recommendations = []
+        # Filter related concepts to see if they are actually in our library,
+        # using the precomputed concept -> book IDs map.
         for concept in related_concepts:
-            # check if this concept title exists in books_dict values
-            for bid, info in lms.books_dict.items():
-                if concept.lower() in info['books_title'].lower():
-                    valid_recommendations.append(f"{info['books_title']} (#{bid})")
-        
-        valid_recommendations = list(set(valid_recommendations))
+            for rec in book_labels(knowledge.books_for(concept), "{title} (#{id})"):
+                if rec not in valid_recommendations:
+                    valid_recommendations.append(rec)
         
         if valid_recommendations:
             response_text += f"Based on your interest in '{message}', you might like: " + ", ".join(valid_recommendations[:3]) + "."
         elif not found_books:
             response_text += f"I think you're looking for something related to {', '.join(related_concepts[:2])}, but I don't see it in stock right now."
 
+    # 3. Vector recommendations when the knowledge base had nothing to offer
+    if not valid_recommendations:
+        with CHAT_STAGE_SECONDS.labels('recommender').time():
+            if found_ids:
+                similar = [bid for bid, score in recommender.similar(found_ids[0], k=3)
+                           if score >= MIN_RECOMMENDATION_SCORE]
+                labels = book_labels(similar, "{title} (#{id})")
+                if labels:
+                    response_text += "You may also like: " + ", ".join(labels) + "."
+            elif not related_concepts:
+                hits = [bid for bid, score in recommender.query(message, k=3)
+                        if score >= MIN_RECOMMENDATION_SCORE]
+                labels = book_labels(hits, "{title} (#{id})")
+                if labels:
+                    response_text += "You might like: " + ", ".join(labels) + "."
+
     if not response_text:
         response_text = "I'm not sure which book you mean. Try mentioning a character, genre, or title keyword!"
 
-    return jsonify({"response": response_text})
+    return response_text
+
+@app.route('/api/chat', methods=['POST'])
+def chat():
+    """Answers are cached per normalized message and catalog version,
+    since the same questions come up again and again."""
+    data = request.json
+    message = normalize_message(data.get('message', ''))
+    
+    if not message:
+        return jsonify({"response": "I'm listening! Ask me about any book, character, or topic."})
+
+    key = ('chat', cache_version(), message)
+    reply = responses.get(key)
+    if reply is None:
+        reply = chat_reply(message)
+        responses.put(key, reply)
+    return jsonify({"response": reply})
 
 @app.route('/')
 def index():
@@ -387,7 +858,6 @@ def index():
         return str(e)
 
 if __name__ == '__main__':
-    import os
     port = int(os.environ.get("PORT", 5000))
     print(f"Starting Flask Adapter on port {port}...")
     # Debug mode should be False in production, but keeping True for demo unless ENV set.
@@ -0,0 +1,81 @@
+# Binary snapshot files: named pickled sections behind a small JSON header.
+
+import json
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+
+MAGIC = b"LMSSNAP1"
+HEADER_SIZE = struct.Struct("<I")
+
+
+def write_snapshot(path, meta, sections):
+    """ Writes `sections` (name -> picklable object) plus a JSON-able `meta`
+    dict to `path`. The file is written beside the target and renamed over
+    it, so readers (including other processes) only ever see a complete
+    snapshot. """
+    blobs = {name: pickle.dumps(value, protocol=5) for name, value in sections.items()}
+    table, offset = {}, 0
+    for name, blob in blobs.items():
+        table[name] = [offset, len(blob)]
+        offset += len(blob)
+    header = json.dumps({"meta": meta, "sections": table}).encode("utf-8")
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                               prefix=os.path.basename(path) + ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC + HEADER_SIZE.pack(len(header)) + header)
+            for blob in blobs.values():
+                f.write(blob)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class Snapshot:
+    """ A snapshot file opened read-only through mmap. Only the header is
+    parsed up front; each section is unpickled straight from the mapping
+    the first time it is asked for, so parts that aren't needed are never
+    read from disk. """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        prefix = len(MAGIC) + HEADER_SIZE.size
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a snapshot file")
+        (size,) = HEADER_SIZE.unpack(self._map[len(MAGIC):prefix])
+        header = json.loads(self._map[prefix:prefix + size])
+        self.meta = header["meta"]
+        self._sections = header["sections"]
+        self._base = prefix + size
+
+    @classmethod
+    def open(cls, path):
+        """ Opens `path`, or returns None if it is missing or unreadable. """
+        try:
+            return cls(path)
+        except (OSError, ValueError, struct.error):
+            return None
+
+    def __contains__(self, name):
+        return name in self._sections
+
+    def load(self, name):
+        offset, length = self._sections[name]
+        start = self._base + offset
+        with memoryview(self._map) as view:
+            return pickle.loads(view[start:start + length])
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,4 +1,4 @@
-const { useState, useEffect, useContext, createContext } = React;
+const { useState, useEffect, useRef, useContext, createContext } = React;
 
 // --- 0. Context & Utils ---
 const API_BASE = '/api';
@@ -23,8 +23,12 @@ const useBooks = () => {
     const [loading, setLoading] = useState(true);
     const [stats, setStats] = useState(null);
     const [refreshTrigger, setRefreshTrigger] = useState(0);
+    const live = useRef(false);
 
-    const refresh = () => setRefreshTrigger(p => p + 1);
+    const resync = () => setRefreshTrigger(p => p + 1);
+    // While the change feed is connected our own writes come back as
+    // deltas too, so there is nothing to refetch.
+    const refresh = () => { if (!live.current) resync(); };
 
     useEffect(() => {
         fetch(`${API_BASE}/books`)
@@ -41,6 +45,31 @@ const useBooks = () => {
             .catch(err => console.error(err));
     }, [refreshTrigger]);
 
+    // Apply catalog changes pushed by the server (see /api/events);
+    // "resync" means some were missed, so fall back to a full fetch.
+    useEffect(() => {
+        if (!window.EventSource) return;
+        const source = new EventSource(`${API_BASE}/events`);
+        source.onopen = () => { live.current = true; };
+        // A 503 (e.g. a sync worker that can't stream) closes the source
+        // for good; we then just refetch after our own writes.
+        source.onerror = () => { live.current = false; };
+        source.addEventListener('change', e => {
+            const change = JSON.parse(e.data);
+            setBooks(prev => {
+                const i = prev.findIndex(b => String(b.id) === String(change.id));
+                if (!change.book) return i < 0 ? prev : prev.filter((_, j) => j !== i);
+                if (i < 0) return [...prev, change.book];    // new IDs sort last
+                const next = prev.slice();
+                next[i] = change.book;
+                return next;
+            });
+            setStats(prev => ({ ...prev, ...change.stats }));
+        });
+        source.addEventListener('resync', resync);
+        return () => source.close();
+    }, []);
+
     return { books, stats, loading, refresh };
 };
 
@@ -0,0 +1,77 @@
+# Incrementally maintained catalog counters for summaries and /api/stats.
+
+import threading
+from catalog import AVAILABLE
+
+
+class CatalogStats:
+    """ Total/issued counts for the whole catalog and per Subject and
+    Publisher. LMS updates them in O(1) on every add, delete, issue and
+    return, so reading them never walks the catalog. """
+
+    def __init__(self, books=()):
+        self._lock = threading.Lock()
+        self.total = 0
+        self.issued = 0
+        self.subjects = {}      # subject -> [total, issued]
+        self.publishers = {}    # publisher -> [total, issued]
+        for book in books:
+            self.book_added(book)
+
+    @staticmethod
+    def _bump(counts, key, total, issued):
+        row = counts.setdefault(key or "unknown", [0, 0])
+        row[0] += total
+        row[1] += issued
+        if row[0] == 0:
+            del counts[key or "unknown"]
+
+    def _change(self, book, total, issued):
+        with self._lock:
+            self.total += total
+            self.issued += issued
+            self._bump(self.subjects, book.subject, total, issued)
+            self._bump(self.publishers, book.publisher, total, issued)
+
+    def __getstate__(self):
+        with self._lock:
+            return self.total, self.issued, self.subjects, self.publishers
+
+    def __setstate__(self, state):
+        self._lock = threading.Lock()
+        self.total, self.issued, self.subjects, self.publishers = state
+
+    def book_added(self, book):
+        self._change(book, 1, int(book.status != AVAILABLE))
+
+    def book_removed(self, book):
+        self._change(book, -1, -int(book.status != AVAILABLE))
+
+    def book_issued(self, book):
+        self._change(book, 0, 1)
+
+    def book_returned(self, book):
+        self._change(book, 0, -1)
+
+    @staticmethod
+    def _breakdown(counts):
+        return {
+            key: {"total": total, "issued": issued, "available": total - issued}
+            for key, (total, issued) in sorted(counts.items())
+        }
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "total_books": self.total,
+                "issued_books": self.issued,
+                "available_books": self.total - self.issued,
+                "by_subject": self._breakdown(self.subjects),
+                "by_publisher": self._breakdown(self.publishers),
+            }
+
+    def verify(self, books):
+        """ Recomputes the counters from `books` and returns
+        (consistent, recomputed CatalogStats). """
+        fresh = CatalogStats(books)
+        return fresh.snapshot() == self.snapshot(), fresh
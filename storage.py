@@ -0,0 +1,518 @@
+# Persistence backends for LMS. The catalog CSV stays an import/export format.
+
+import contextlib
+import sqlite3
+import threading
+from catalog import Book, load_books, write_books, AVAILABLE, ISSUED
+from members import ID_PREFIX as MEMBER_ID_PREFIX, Member
+from metrics import REGISTRY
+from results import Outcome
+
+# The original loader numbered books.csv lines from 101, header row
+# included, so the first real book was 102. New databases keep that
+# numbering, so IDs in issued_books.csv, issue_log.txt and users'
+# bookmarks still name the same books.
+FIRST_BOOK_ID = 102
+
+# Applied in order; PRAGMA user_version records how many have run.
+MIGRATIONS = [
+    """
+    CREATE TABLE books (
+        id INTEGER PRIMARY KEY,
+        title TEXT NOT NULL,
+        author TEXT NOT NULL DEFAULT '',
+        subject TEXT NOT NULL DEFAULT '',
+        extent INTEGER,
+        publisher TEXT NOT NULL DEFAULT '',
+        status TEXT NOT NULL DEFAULT 'Available',
+        lender_name TEXT NOT NULL DEFAULT '',
+        issue_date TEXT NOT NULL DEFAULT ''
+    );
+    CREATE INDEX books_status ON books(status);
+    CREATE TABLE loans (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        book_id INTEGER NOT NULL,
+        lender_name TEXT NOT NULL,
+        issue_date TEXT NOT NULL,
+        return_date TEXT
+    );
+    CREATE INDEX loans_book ON loans(book_id, return_date);
+    """,
+    # Change journal: every committed write to books is recorded here by
+    # trigger, so other processes sharing the database can catch up.
+    """
+    CREATE TABLE changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        book_id INTEGER NOT NULL
+    );
+    CREATE TRIGGER books_insert_journal AFTER INSERT ON books BEGIN
+        INSERT INTO changes (book_id) VALUES (NEW.id);
+    END;
+    CREATE TRIGGER books_update_journal AFTER UPDATE ON books BEGIN
+        INSERT INTO changes (book_id) VALUES (NEW.id);
+    END;
+    CREATE TRIGGER books_delete_journal AFTER DELETE ON books BEGIN
+        INSERT INTO changes (book_id) VALUES (OLD.id);
+    END;
+    """,
+    # A random ID per database, so caches of its contents (snapshots) can
+    # tell a recreated database from the one they were taken from.
+    """
+    CREATE TABLE meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+    INSERT INTO meta (key, value) VALUES ('instance_id', lower(hex(randomblob(8))));
+    """,
+    # Due dates, renewals and fines. Loans already open get the default
+    # 14-day period.
+    """
+    ALTER TABLE books ADD COLUMN due_date TEXT NOT NULL DEFAULT '';
+    ALTER TABLE loans ADD COLUMN due_date TEXT NOT NULL DEFAULT '';
+    ALTER TABLE loans ADD COLUMN renewals INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE loans ADD COLUMN fine REAL NOT NULL DEFAULT 0;
+    UPDATE books SET due_date = COALESCE(datetime(issue_date, '+14 days'), '')
+        WHERE status != 'Available';
+    UPDATE loans SET due_date = COALESCE(datetime(issue_date, '+14 days'), '')
+        WHERE return_date IS NULL;
+    """,
+    # Registered members; loans made to one record its ID.
+    """
+    CREATE TABLE members (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        email TEXT NOT NULL UNIQUE,
+        mobile TEXT NOT NULL DEFAULT '',
+        role TEXT NOT NULL DEFAULT 'student',
+        joined TEXT NOT NULL
+    );
+    CREATE INDEX members_name ON members(name COLLATE NOCASE);
+    ALTER TABLE books ADD COLUMN member_id TEXT NOT NULL DEFAULT '';
+    ALTER TABLE loans ADD COLUMN member_id TEXT NOT NULL DEFAULT '';
+    CREATE INDEX loans_member ON loans(member_id, id);
+    """,
+    # Books each borrower holds, for enforcing the loan limit inside the
+    # issuing transaction.
+    """
+    CREATE INDEX books_borrower ON books(member_id, lender_name COLLATE NOCASE)
+        WHERE status != 'Available';
+    """,
+    # The next book ID to hand out. IDs only go up: loans, the event log
+    # and the ledgers refer to books by ID, so a deleted book's ID must
+    # never be given to a new one. Starts past every ID still on record.
+    f"""
+    INSERT INTO meta (key, value) VALUES ('next_book_id', (SELECT MAX(
+        {FIRST_BOOK_ID},
+        COALESCE((SELECT MAX(id) FROM books), 0) + 1,
+        COALESCE((SELECT MAX(book_id) FROM loans), 0) + 1,
+        COALESCE((SELECT MAX(book_id) FROM changes), 0) + 1)));
+    """,
+]
+
+# How many journal entries to keep; a process further behind than this
+# reloads the catalog instead of replaying.
+JOURNAL_SIZE = 10000
+
+TRANSACTION_SECONDS = REGISTRY.histogram(
+    "lms_db_transaction_seconds", "Time to run a write transaction, including the wait for the write lock.")
+
+BOOK_COLUMNS = ("id, title, author, subject, extent, publisher, "
+                "status, lender_name, issue_date, due_date, member_id")
+
+
+class Storage:
+    """ Interface every LMS storage backend implements. Book IDs are passed
+    around as strings, the same way LMS keys books_dict. """
+
+    # Identifies the store's contents for snapshots; None disables them.
+    instance_id = None
+
+    def is_empty(self):
+        raise NotImplementedError
+
+    def load_books(self):
+        """ Yields (book_id, Book) for the whole catalog in ID order. """
+        raise NotImplementedError
+
+    def add_book(self, book):
+        """ Stores a new book and returns the ID allocated for it. """
+        raise NotImplementedError
+
+    def add_books(self, books):
+        return [self.add_book(book) for book in books]
+
+    def delete_book(self, book_id):
+        """ Deletes an available book; returns False if it can't be deleted. """
+        raise NotImplementedError
+
+    def issue_book(self, book_id, name, date, due_date="", member_id="", max_loans=None):
+        """ Marks a book issued only if it is still available and the
+        borrower (the member, or else the name in any case) holds fewer
+        than `max_loans` books. Returns Outcome.OK, ALREADY_ISSUED or
+        LOAN_LIMIT. """
+        raise NotImplementedError
+
+    def return_book(self, book_id, date, fine=0):
+        """ Closes the open loan on a book, recording any fine; returns
+        False if it wasn't issued. """
+        raise NotImplementedError
+
+    def renew_book(self, book_id, due_date, max_renewals):
+        """ Moves the due date of an open loan renewed fewer than
+        `max_renewals` times; returns False otherwise. """
+        raise NotImplementedError
+
+    def issue_books(self, loans, date, due_date="", max_loans=None):
+        """ Issues each (book_id, name, member_id) loan; returns one
+        Outcome each, as issue_book. """
+        return [self.issue_book(book_id, name, date, due_date, member_id, max_loans)
+                for book_id, name, member_id in loans]
+
+    def return_books(self, returns, date):
+        """ Returns each (book_id, fine) pair; returns one bool per pair. """
+        return [self.return_book(book_id, date, fine) for book_id, fine in returns]
+
+    def get_book(self, book_id):
+        """ Returns the stored Book for an ID, or None if it doesn't exist. """
+        raise NotImplementedError
+
+    def loan_history(self):
+        """ Yields (book_id, lender_name) for every loan ever made, oldest first. """
+        return iter(())
+
+    # Members
+    def add_member(self, name, email, mobile="", role="student", joined=""):
+        """ Registers a member, or returns the one already registered with
+        that email address. """
+        raise NotImplementedError
+
+    def get_member(self, member_id):
+        raise NotImplementedError
+
+    def find_members(self, name):
+        """ Members with exactly this name (any case). """
+        return []
+
+    def count_members(self):
+        return 0
+
+    def member_loans(self, member_id, limit=50):
+        """ A member's loans, newest first, as dicts with book_id, title,
+        issue_date, due_date, return_date and fine. """
+        return []
+
+    def iter_books(self, status=None, subject=None):
+        """ Streams (book_id, Book) in ID order, optionally only books with
+        status "available"/"issued" or a given subject (any case). """
+        for book_id, book in self.load_books():
+            if status == "available" and book.status != AVAILABLE:
+                continue
+            if status == "issued" and book.status == AVAILABLE:
+                continue
+            if subject and book.subject.lower() != subject.lower():
+                continue
+            yield book_id, book
+
+    def changes_since(self, seq):
+        """ Returns (latest_seq, changed_book_ids) for writes made after
+        `seq`, or (latest_seq, None) when they can no longer be replayed. """
+        return seq, []
+
+    def import_csv(self, path):
+        return self.add_books(load_books(path))
+
+    def seed_from_csv(self, path):
+        """ Imports a catalog CSV, but only into an empty store. """
+        if self.is_empty():
+            self.import_csv(path)
+
+    def export_csv(self, path):
+        write_books(path, (book for _, book in self.load_books()))
+
+    def close(self):
+        pass
+
+
+class SQLiteStorage(Storage):
+    """ SQLite backend in WAL mode. Each mutation is one short transaction
+    touching a handful of indexed rows, so its cost doesn't depend on the
+    size of the catalog, and the database survives restarts. """
+
+    def __init__(self, path="library.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None,
+                                    check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._data_version = None
+        self._writes = 0
+        self._migrate()
+        self.instance_id = self.conn.execute(
+            "SELECT value FROM meta WHERE key = 'instance_id'").fetchone()[0]
+
+    @staticmethod
+    def _statements(script):
+        statement = ""
+        for line in script.splitlines(keepends=True):
+            statement += line
+            if sqlite3.complete_statement(statement):
+                yield statement
+                statement = ""
+
+    def _migrate(self):
+        with self._transaction() as cur:
+            version = cur.execute("PRAGMA user_version").fetchone()[0]
+            for number, script in enumerate(MIGRATIONS[version:], version + 1):
+                for statement in self._statements(script):
+                    cur.execute(statement)
+                cur.execute(f"PRAGMA user_version = {number}")
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """ BEGIN IMMEDIATE takes the write lock up front, so concurrent
+        writers queue on busy_timeout instead of failing mid-transaction. """
+        with TRANSACTION_SECONDS.time(), self._lock:
+            cur = self.conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                yield cur
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+            self._writes += 1
+            if self._writes % 1000 == 0:
+                cur.execute("DELETE FROM changes WHERE seq <= "
+                            "(SELECT MAX(seq) FROM changes) - ?", (JOURNAL_SIZE,))
+            cur.execute("COMMIT")
+            # Our own commits don't move data_version; make the next
+            # changes_since() look, so callers' seq covers them too.
+            self._data_version = None
+
+    @staticmethod
+    def _book(row):
+        return str(row[0]), Book(row[1], row[2], row[3], row[4], row[5],
+                                 row[7], row[8], row[6], row[9], row[10])
+
+    def is_empty(self):
+        with self._lock:
+            return self.conn.execute("SELECT 1 FROM books LIMIT 1").fetchone() is None
+
+    def load_books(self):
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT {BOOK_COLUMNS} FROM books ORDER BY id").fetchall()
+        return map(self._book, rows)
+
+    def get_book(self, book_id):
+        with self._lock:
+            row = self.conn.execute(
+                f"SELECT {BOOK_COLUMNS} FROM books WHERE id = ?", (int(book_id),)
+            ).fetchone()
+        return self._book(row)[1] if row else None
+
+    def loan_history(self):
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT book_id, lender_name FROM loans ORDER BY id").fetchall()
+        return ((str(book_id), name) for book_id, name in rows)
+
+    def iter_books(self, status=None, subject=None, batch=1000):
+        # A connection of its own: the SELECT reads one consistent WAL
+        # snapshot for as long as the caller takes to consume it, without
+        # holding self._lock or blocking writers.
+        where, params = [], []
+        if status == "available":
+            where.append("status = ?")
+            params.append(AVAILABLE)
+        elif status == "issued":
+            where.append("status != ?")
+            params.append(AVAILABLE)
+        if subject:
+            where.append("lower(subject) = lower(?)")
+            params.append(subject)
+        sql = f"SELECT {BOOK_COLUMNS} FROM books"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        try:
+            cur = conn.execute(sql + " ORDER BY id", params)
+            while True:
+                rows = cur.fetchmany(batch)
+                if not rows:
+                    break
+                yield from map(self._book, rows)
+        finally:
+            conn.close()
+
+    def changes_since(self, seq):
+        with self._lock:
+            # data_version only moves when another connection commits, which
+            # makes the common "nothing changed" case a single cheap pragma.
+            version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._data_version and seq is not None:
+                return seq, []
+            self._data_version = version
+            first, last = self.conn.execute(
+                "SELECT MIN(seq), MAX(seq) FROM changes").fetchone()
+            if last is None:
+                return seq or 0, []
+            if seq is None or first > seq + 1:
+                return last, None
+            rows = self.conn.execute(
+                "SELECT DISTINCT book_id FROM changes WHERE seq > ? AND seq <= ?",
+                (seq, last)).fetchall()
+        return last, [str(row[0]) for row in rows]
+
+    def _insert(self, cur, book):
+        book_id = int(cur.execute(
+            "SELECT value FROM meta WHERE key = 'next_book_id'").fetchone()[0])
+        cur.execute(
+            "INSERT INTO books (id, title, author, subject, extent, publisher) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (book_id, book.title, book.author, book.subject, book.extent, book.publisher))
+        cur.execute("UPDATE meta SET value = ? WHERE key = 'next_book_id'", (book_id + 1,))
+        return str(book_id)
+
+    def add_book(self, book):
+        with self._transaction() as cur:
+            return self._insert(cur, book)
+
+    def add_books(self, books):
+        with self._transaction() as cur:
+            return [self._insert(cur, book) for book in books]
+
+    def seed_from_csv(self, path):
+        # Checked inside the write transaction so several workers booting
+        # at once against a new database import the catalog exactly once.
+        with self._transaction() as cur:
+            if cur.execute("SELECT 1 FROM books LIMIT 1").fetchone() is None:
+                for book in load_books(path):
+                    self._insert(cur, book)
+
+    def delete_book(self, book_id):
+        with self._transaction() as cur:
+            cur.execute("DELETE FROM books WHERE id = ? AND status = ?",
+                        (int(book_id), AVAILABLE))
+            return cur.rowcount == 1
+
+    @staticmethod
+    def _holding(cur, name, member_id):
+        """ Books the borrower has out (see loans.member_key). The literal
+        status test lets SQLite use the partial books_borrower index. """
+        if member_id:
+            return cur.execute("SELECT COUNT(*) FROM books WHERE member_id = ? "
+                               "AND status != 'Available'", (member_id,)).fetchone()[0]
+        return cur.execute("SELECT COUNT(*) FROM books WHERE member_id = '' "
+                           "AND lender_name = ? COLLATE NOCASE AND status != 'Available'",
+                           (name.strip(),)).fetchone()[0]
+
+    @classmethod
+    def _issue(cls, cur, book_id, name, date, due_date, member_id, max_loans):
+        # Counted under the write lock, so concurrent issues to the same
+        # borrower (from any thread or worker) can't all slip under it.
+        if max_loans is not None and cls._holding(cur, name, member_id) >= max_loans:
+            return Outcome.LOAN_LIMIT
+        cur.execute(
+            "UPDATE books SET status = ?, lender_name = ?, issue_date = ?, due_date = ?, "
+            "member_id = ? WHERE id = ? AND status = ?",
+            (ISSUED, name, date, due_date, member_id, int(book_id), AVAILABLE))
+        if cur.rowcount != 1:
+            return Outcome.ALREADY_ISSUED
+        cur.execute(
+            "INSERT INTO loans (book_id, lender_name, issue_date, due_date, member_id) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (int(book_id), name, date, due_date, member_id))
+        return Outcome.OK
+
+    @staticmethod
+    def _return(cur, book_id, date, fine):
+        cur.execute(
+            "UPDATE books SET status = ?, lender_name = '', issue_date = '', due_date = '', "
+            "member_id = '' WHERE id = ? AND status != ?",
+            (AVAILABLE, int(book_id), AVAILABLE))
+        if cur.rowcount != 1:
+            return False
+        cur.execute(
+            "UPDATE loans SET return_date = ?, fine = ? "
+            "WHERE book_id = ? AND return_date IS NULL",
+            (date, fine, int(book_id)))
+        return True
+
+    def issue_book(self, book_id, name, date, due_date="", member_id="", max_loans=None):
+        with self._transaction() as cur:
+            return self._issue(cur, book_id, name, date, due_date, member_id, max_loans)
+
+    def return_book(self, book_id, date, fine=0):
+        with self._transaction() as cur:
+            return self._return(cur, book_id, date, fine)
+
+    def renew_book(self, book_id, due_date, max_renewals):
+        with self._transaction() as cur:
+            cur.execute(
+                "UPDATE loans SET due_date = ?, renewals = renewals + 1 "
+                "WHERE book_id = ? AND return_date IS NULL AND renewals < ?",
+                (due_date, int(book_id), max_renewals))
+            if cur.rowcount != 1:
+                return False
+            cur.execute("UPDATE books SET due_date = ? WHERE id = ?", (due_date, int(book_id)))
+            return True
+
+    # Batches run in a single transaction: one commit (and one WAL sync)
+    # however many books are involved.
+    def issue_books(self, loans, date, due_date="", max_loans=None):
+        with self._transaction() as cur:
+            return [self._issue(cur, book_id, name, date, due_date, member_id, max_loans)
+                    for book_id, name, member_id in loans]
+
+    def return_books(self, returns, date):
+        with self._transaction() as cur:
+            return [self._return(cur, book_id, date, fine) for book_id, fine in returns]
+
+    # Members
+    def add_member(self, name, email, mobile="", role="student", joined=""):
+        email = email.strip().lower()
+        with self._transaction() as cur:
+            row = cur.execute("SELECT * FROM members WHERE email = ?", (email,)).fetchone()
+            if row:
+                return Member(*row)
+            # IDs are never reused: the next number after the highest ever.
+            number = cur.execute(
+                "SELECT COALESCE(MAX(CAST(substr(id, ?) AS INTEGER)), 0) + 1 FROM members",
+                (len(MEMBER_ID_PREFIX) + 1,)).fetchone()[0]
+            member = Member(f"{MEMBER_ID_PREFIX}{number:05d}", name, email, mobile, role, joined)
+            cur.execute("INSERT INTO members (id, name, email, mobile, role, joined) "
+                        "VALUES (?, ?, ?, ?, ?, ?)", member)
+            return member
+
+    def get_member(self, member_id):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT * FROM members WHERE id = ?", (member_id,)).fetchone()
+        return Member(*row) if row else None
+
+    def find_members(self, name):
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT * FROM members WHERE name = ? COLLATE NOCASE", (name.strip(),)
+            ).fetchall()
+        return [Member(*row) for row in rows]
+
+    def count_members(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM members").fetchone()[0]
+
+    def member_loans(self, member_id, limit=50):
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT l.book_id, b.title, l.issue_date, l.due_date, l.return_date, l.fine "
+                "FROM loans l LEFT JOIN books b ON b.id = l.book_id "
+                "WHERE l.member_id = ? ORDER BY l.id DESC LIMIT ?",
+                (member_id, limit)).fetchall()
+        return [{"book_id": str(book_id), "title": title, "issue_date": issue_date,
+                 "due_date": due_date, "return_date": return_date, "fine": fine}
+                for book_id, title, issue_date, due_date, return_date, fine in rows]
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
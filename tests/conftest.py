@@ -0,0 +1,67 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """ A scratch directory holding a copy of books.csv, made the cwd, since
+    LMS keeps its database and logs next to the catalog. """
+    shutil.copy(os.path.join(ROOT, "books.csv"), tmp_path / "books.csv")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def make_lms(workdir):
+    """ Builds LMS instances in the scratch directory and closes them after
+    the test. """
+    from main import LMS
+
+    made = []
+
+    def make(**kwargs):
+        lms = LMS("books.csv", "Test Library", **kwargs)
+        made.append(lms)
+        return lms
+
+    yield make
+    for lms in made:
+        lms.close()
+        lms.storage.close()
+        lms.writer.close()
+
+
+@pytest.fixture(scope="session")
+def server_dir(tmp_path_factory):
+    """ The directory the server module's LMS lives in. server.py builds
+    its LMS at import time, so the module is imported once per session. """
+    path = tmp_path_factory.mktemp("server")
+    shutil.copy(os.path.join(ROOT, "books.csv"), path / "books.csv")
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        import server
+    finally:
+        os.chdir(cwd)
+    yield path
+    os.chdir(path)
+    try:
+        server.lms.close()
+        server.lms.storage.close()
+        server.lms.writer.close()
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture
+def server(server_dir, monkeypatch):
+    """ The server module, with the cwd set to where its LMS keeps its files. """
+    monkeypatch.chdir(server_dir)
+    import server
+    return server
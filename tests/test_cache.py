@@ -0,0 +1,66 @@
+import types
+
+import pytest
+
+import cache
+from cache import LRUCache, SQLiteCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ Replaces the cache module's clock with one the test moves. """
+    clock = types.SimpleNamespace(now=1000.0)
+    clock.monotonic = clock.time = lambda: clock.now
+    monkeypatch.setattr(cache, "time", clock)
+    return clock
+
+
+def test_entries_expire_after_ttl(clock):
+    lru = LRUCache(8, ttl=10)
+    lru.put("a", "value")
+    clock.now += 9.9
+    assert lru.get("a") == "value"
+    clock.now += 0.1
+    assert lru.get("a") is None
+    assert len(lru) == 0 and lru.bytes == 0
+    assert (lru.hits, lru.misses) == (1, 1)
+
+
+def test_maxbytes_evicts_least_recently_used_first():
+    lru = LRUCache(100, maxbytes=10)
+    lru.put("a", "1234")
+    lru.put("b", "1234")
+    lru.get("a")                    # "b" is now the least recently used
+    lru.put("c", "1234")
+    assert lru.get("b") is None
+    assert lru.get("a") == "1234" and lru.get("c") == "1234"
+    assert lru.bytes == 8 and lru.evictions == 1
+    lru.put("d", "x" * 11)          # larger than the whole budget: not stored
+    assert lru.get("d") is None and lru.bytes == 8
+    lru.put("a", "1234567")         # replacing an entry frees its old size
+    assert lru.get("c") is None and lru.bytes == 7
+
+
+def test_sqlite_prune_keeps_the_most_recently_written(tmp_path, clock):
+    shared = SQLiteCache(str(tmp_path / "cache.db"), maxsize=3)
+    shared.PRUNE_EVERY = 5
+    for i in range(4):
+        clock.now += 1
+        shared.put(("page", i), i)
+    assert shared.get(("page", 0)) == 0     # a hit doesn't count as a write
+    clock.now += 1
+    shared.put(("page", 4), 4)              # fifth put prunes
+    assert len(shared) == 3
+    assert [shared.get(("page", i)) for i in range(5)] == [None, None, 2, 3, 4]
+    assert shared.evictions == 2
+
+
+def test_sqlite_expired_entries_miss_and_are_pruned(tmp_path, clock):
+    shared = SQLiteCache(str(tmp_path / "cache.db"), maxsize=100, ttl=10)
+    shared.PRUNE_EVERY = 2
+    shared.put("old", "value")
+    clock.now += 10
+    assert shared.get("old") is None
+    shared.put("new", "value")              # second put prunes
+    assert len(shared) == 1 and shared.evictions == 1
+    assert shared.get("new") == "value"
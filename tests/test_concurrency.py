@@ -0,0 +1,102 @@
+import random
+import threading
+
+from catalog import AVAILABLE
+
+THREADS = 16
+OPERATIONS = 150
+
+
+def hammer(lms, seed, failures):
+    rng = random.Random(seed)
+    reader = f"Reader {seed % 4}"
+    try:
+        for _ in range(OPERATIONS):
+            ids = list(lms.books_dict)
+            book_id = rng.choice(ids)
+            action = rng.random()
+            if action < 0.4:
+                lms.issue(book_id, reader)
+            elif action < 0.8:
+                lms.return_book(book_id)
+            elif action < 0.9:
+                lms.add(f"Stress Book {seed}-{rng.randrange(10 ** 6)}", "Tester")
+            else:
+                lms.delete(book_id)
+    except Exception as e:      # surfaced by the assertion in the test
+        failures.append(e)
+
+
+def test_threads_keep_storage_memory_and_counters_in_step(make_lms):
+    lms = make_lms()
+    failures = []
+    threads = [threading.Thread(target=hammer, args=(lms, seed, failures))
+               for seed in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert failures == []
+
+    stored = dict(lms.storage.load_books())
+    assert stored.keys() == lms.books_dict.keys()
+    for book_id, book in stored.items():
+        mine = lms.books_dict[book_id]
+        assert (book.title, book.status, book.lender_name, book.issue_date) == \
+            (mine.title, mine.status, mine.lender_name, mine.issue_date), book_id
+    assert lms.check_stats()
+    issued = sum(book.status != AVAILABLE for book in lms.books_dict.values())
+    assert len(lms.loans) == issued == lms.stats.issued
+
+
+def test_concurrent_issues_of_one_book_lend_it_once(make_lms):
+    lms = make_lms()
+    book_id = next(b for b, book in lms.books_dict.items() if book.status == AVAILABLE)
+    barrier = threading.Barrier(THREADS)
+    results = []
+
+    def issue(i):
+        barrier.wait()
+        results.append(lms.issue(book_id, f"Reader {i}"))
+
+    threads = [threading.Thread(target=issue, args=(i,)) for i in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(r.ok for r in results) == 1
+    assert lms.storage.get_book(book_id).lender_name == lms.books_dict[book_id].lender_name
+
+
+def test_sync_never_applies_a_row_read_before_a_local_issue(make_lms):
+    lms = make_lms()
+    other = make_lms()      # a second "worker" on the same database
+    book_id = next(b for b, book in lms.books_dict.items() if book.status == AVAILABLE)
+    assert other.issue(book_id, "Other Reader").ok and other.return_book(book_id).ok
+    changes = []
+    lms.add_listener(lambda action, changed, book: changes.append((action, changed)))
+
+    # Hold sync() just after it has read the book's row, and issue the book
+    # locally meanwhile. The read must happen under the book's stripe lock,
+    # so the issue waits for sync instead of being overwritten by it.
+    read, issued = threading.Event(), threading.Event()
+    get_book = lms.storage.get_book
+
+    def slow_get_book(wanted):
+        row = get_book(wanted)
+        if wanted == book_id and threading.current_thread() is syncer:
+            read.set()
+            issued.wait(0.5)
+        return row
+
+    lms.storage.get_book = slow_get_book
+    syncer = threading.Thread(target=lms.sync)
+    syncer.start()
+    assert read.wait(5)
+    assert lms.issue(book_id, "Local Reader").ok
+    issued.set()
+    syncer.join()
+
+    assert lms.books_dict[book_id].status != AVAILABLE
+    assert ("returned", book_id) not in changes
+    assert lms.check_stats() and len(lms.loans) == lms.stats.issued
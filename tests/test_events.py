@@ -0,0 +1,133 @@
+import datetime
+import shutil
+import threading
+
+import pytest
+
+from compaction import EventArchive
+from events import EventLog, to_timestamp
+
+START = datetime.datetime(2024, 1, 1)
+
+
+def date(hours):
+    return (START + datetime.timedelta(hours=hours)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+@pytest.fixture
+def log(workdir):
+    archive = EventArchive("archive")
+    events = EventLog("events.jsonl", archive=archive)
+    events.append_many(("issued" if i % 2 == 0 else "returned", 100 + (i // 2) % 20,
+                        f"Book {(i // 2) % 20}", f"User {(i // 2) % 7}", date(i))
+                       for i in range(1000))
+    return events
+
+
+def rotate(events, keep=100, per_segment=200):
+    return events.rotate(to_timestamp(date(10 ** 6)), 0, keep,
+                         lambda items: events.archive.store_events(items, per_segment))
+
+
+def test_rotation_keeps_every_query_answer(log):
+    pages = [log.query(limit=1000), log.query(limit=7, before=905),
+             log.query(limit=50, user="User 3"), log.query(limit=30, book_id="105"),
+             log.query(limit=40, since=to_timestamp(date(200)), until=to_timestamp(date(260)))]
+    assert rotate(log) == 900
+    assert log.base == 900 and len(log) == 1000
+    assert len(log.archive.manifest()["segments"]) == 5
+    assert [log.query(limit=1000), log.query(limit=7, before=905),
+            log.query(limit=50, user="User 3"), log.query(limit=30, book_id="105"),
+            log.query(limit=40, since=to_timestamp(date(200)),
+                      until=to_timestamp(date(260)))] == pages
+    assert log.query(limit=5, archived=False)[-1]["seq"] == 995
+    assert len(log.query(limit=1000, archived=False)) == 100
+
+
+def test_time_range_only_opens_overlapping_segments(log, monkeypatch):
+    rotate(log)
+    opened = []
+    segment_lines = EventArchive._segment_lines
+
+    def spy(self, segment, below):
+        opened.append(segment["file"])
+        return segment_lines(self, segment, below)
+
+    monkeypatch.setattr(EventArchive, "_segment_lines", spy)
+    found = log.query(limit=1000, since=to_timestamp(date(410)), until=to_timestamp(date(420)))
+    assert [e["seq"] for e in found] == list(range(419, 409, -1))
+    assert opened == ["events-0000000400-0000000599.jsonl.gz"]
+
+
+def test_tail_crosses_from_archive_into_live_log(log):
+    rotate(log)
+    assert [e["seq"] for e in log.tail(894, 10)] == list(range(895, 905))
+    assert [e["seq"] for e in log.tail(-1, 3)] == [0, 1, 2]
+
+
+def test_appends_continue_the_sequence_and_other_readers_follow(log):
+    other = EventLog("events.jsonl", archive=EventArchive("archive"))
+    assert len(other) == 1000
+    rotate(log)
+    assert log.append("added", 1, "New")["seq"] == 1000
+    assert [e["seq"] for e in other.query(limit=3)] == [1000, 999, 998]
+    assert len(other) == 1001 and other.base == 900
+
+
+def test_appends_during_the_sink_survive(log):
+    def sink(items):
+        log.archive.store_events(items, 500)
+        log.append("added", 7, "Written mid-rotation")
+
+    log.rotate(to_timestamp(date(10 ** 6)), 0, 100, sink)
+    assert log.base == 900 and len(log) == 1001
+    assert log.query(limit=1)[0]["book"] == "Written mid-rotation"
+
+
+def test_appends_dont_wait_for_readers(log):
+    appended = []
+    writer = threading.Thread(target=lambda: appended.append(log.append("added", 8, "Unblocked")))
+    with log._shared():
+        writer.start()
+        writer.join(2)
+        assert appended and appended[0]["seq"] == 1000
+    assert log.query(limit=1)[0]["book"] == "Unblocked"
+
+
+def test_interrupted_swap_rebuilds_the_index(log):
+    shutil.copy("events.jsonl.idx", "old.idx")
+    rotate(log)
+    shutil.copy("old.idx", "events.jsonl.idx")     # new log, stale index
+    reopened = EventLog("events.jsonl", archive=log.archive)
+    assert reopened.base == 900 and len(reopened) == 1000
+    assert [e["seq"] for e in reopened.query(limit=3)] == [999, 998, 997]
+
+
+@pytest.mark.parametrize("index", [b"", b"\0" * 10])
+def test_first_append_cut_short_rebuilds_the_index(workdir, index):
+    with open("events.jsonl", "wb") as f:
+        f.write(b'{"seq":0,"action":"added","user":"","book_id":"5","book":"B",'
+                b'"date":"2024-01-01 00:00:00"}\n')
+    with open("events.jsonl.idx", "wb") as f:
+        f.write(index)
+    events = EventLog("events.jsonl")
+    assert len(events) == 1
+    assert events.append("added", 6, "C")["seq"] == 1
+    assert [e["book_id"] for e in events.query(limit=5, book_id="5")] == ["5"]
+
+
+def test_partial_index_of_an_empty_log_is_discarded(workdir):
+    with open("events.jsonl.idx", "wb") as f:
+        f.write(b"\0" * 10)
+    events = EventLog("events.jsonl")
+    assert len(events) == 0
+    events.append("added", 6, "C")
+    assert [e["seq"] for e in EventLog("events.jsonl").query()] == [0]
+
+
+def test_closed_loans_are_folded_once(log):
+    rotate(log, keep=500)
+    rotate(log, keep=100)
+    summary = log.archive.summary()
+    assert summary["closed_loans"] == 450
+    assert summary["through_seq"] == 899
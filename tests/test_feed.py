@@ -0,0 +1,98 @@
+import http.client
+import json
+import threading
+import time
+
+import pytest
+
+SUBSCRIBERS = 20
+CHANGES = 10
+
+
+class Subscriber(threading.Thread):
+    """ Reads one /api/events stream until it has seen `expect` changes. """
+
+    def __init__(self, port, expect, last_event_id=None):
+        super().__init__(daemon=True)
+        self.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        headers = {"Last-Event-ID": last_event_id} if last_event_id else {}
+        self.conn.request("GET", "/api/events", headers=headers)
+        self.response = self.conn.getresponse()
+        self.expect = expect
+        self.seqs, self.ids = [], []
+
+    def run(self):
+        event = {}
+        try:
+            for raw in self.response:
+                line = raw.decode("utf-8").rstrip("\n")
+                if line:
+                    field, _, value = line.partition(": ")
+                    event[field] = value
+                    continue
+                if event.get("event") == "change":
+                    self.seqs.append(json.loads(event["data"])["seq"])
+                    self.ids.append(event["id"])
+                    if len(self.seqs) == self.expect:
+                        return
+                event = {}
+        except OSError:
+            pass
+        finally:
+            self.conn.close()
+
+
+@pytest.fixture
+def base(server, monkeypatch):
+    """ The port of a threaded server serving the app in-process. """
+    from werkzeug.serving import make_server
+
+    monkeypatch.setattr(server, "SSE_MAX_WSGI_SUBSCRIBERS", SUBSCRIBERS + 5)
+    # Short heartbeats, so streams notice their clients left soon after.
+    monkeypatch.setattr(server, "SSE_HEARTBEAT", 0.1)
+    httpd = make_server("127.0.0.1", 0, server.app, threaded=True)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd.server_port
+    deadline = time.monotonic() + 5
+    while server.feed.subscribers and time.monotonic() < deadline:
+        time.sleep(0.05)
+    httpd.shutdown()
+    thread.join()
+
+
+def post(port, path, body):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    conn.request("POST", path, json.dumps(body), {"Content-Type": "application/json"})
+    status = conn.getresponse().status
+    conn.close()
+    return status
+
+
+def make_changes(port, book_id, n):
+    for i in range(n):
+        if i % 2 == 0:
+            assert post(port, "/api/issue", {"book_id": book_id, "user_name": "Feed Test"}) == 200
+        else:
+            assert post(port, "/api/return", {"book_id": book_id}) == 200
+
+
+def test_every_subscriber_gets_every_change_in_order_and_replays_on_reconnect(server, base):
+    book_id = next(bid for bid, book in server.lms.books() if book.status == server.AVAILABLE)
+    subscribers = [Subscriber(base, CHANGES) for _ in range(SUBSCRIBERS)]
+    assert all(s.response.status == 200 for s in subscribers)
+    for s in subscribers:
+        s.start()
+    make_changes(base, book_id, CHANGES)
+    for s in subscribers:
+        s.join(10)
+    first = subscribers[0].seqs
+    assert len(first) == CHANGES and first == sorted(first)
+    assert all(s.seqs == first for s in subscribers)
+
+    # A client that reconnects with its last event ID gets what it missed.
+    make_changes(base, book_id, 2)
+    again = Subscriber(base, 2, last_event_id=subscribers[0].ids[-1])
+    again.start()
+    again.join(10)
+    assert again.seqs == [first[-1] + 1, first[-1] + 2]
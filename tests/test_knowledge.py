@@ -0,0 +1,31 @@
+import random
+from collections import Counter
+
+from knowledge import AhoCorasick
+
+
+def brute_force(patterns, text):
+    return Counter(p for p in patterns for i in range(len(text))
+                   if text.startswith(p, i))
+
+
+def test_matches_every_occurrence_like_brute_force():
+    rng = random.Random(7)
+    for _ in range(200):
+        patterns = {"".join(rng.choice("ab ") for _ in range(rng.randint(1, 4)))
+                    for _ in range(rng.randint(1, 8))}
+        text = "".join(rng.choice("ab c") for _ in range(rng.randint(0, 40)))
+        assert Counter(AhoCorasick(patterns).find(text)) == brute_force(patterns, text), \
+            (patterns, text)
+
+
+def test_overlapping_and_nested_patterns_in_end_order():
+    automaton = AhoCorasick(["he", "she", "his", "hers", "big brother"])
+    assert automaton.find("ushers") == ["she", "he", "hers"]
+    assert automaton.find("a big brother is watching") == ["he", "big brother"]
+    assert automaton.find("nothing here at all") == ["he"]
+
+
+def test_no_patterns_and_empty_text():
+    assert AhoCorasick([]).find("anything") == []
+    assert AhoCorasick(["x"]).find("") == []
@@ -0,0 +1,64 @@
+import random
+import threading
+
+from events import to_timestamp
+from loans import LoanIndex, LoanPolicy
+
+NOW = to_timestamp("2024-06-01 12:00:00")
+
+
+def day(n):
+    return f"2024-05-{n:02d} 12:00:00"
+
+
+def test_overdue_lists_only_loans_due_before_now_most_overdue_first():
+    index = LoanIndex([("1", "ann", day(20)), ("2", "bob", day(3)), ("3", "ann", day(31)),
+                       ("4", "cy", "2024-07-01 00:00:00"), ("5", "cy", "")])
+    assert index.overdue(NOW) == [(to_timestamp(day(3)), "2"), (to_timestamp(day(20)), "1"),
+                                  (to_timestamp(day(31)), "3")]
+    assert [book_id for _, book_id in index.overdue(NOW, limit=1)] == ["2"]
+
+
+def test_overdue_skips_returned_and_renewed_loans():
+    index = LoanIndex([("1", "ann", day(1)), ("2", "ann", day(2)), ("3", "bob", day(3))])
+    index.remove("1")
+    index.add("2", "ann", "2024-06-15 00:00:00")       # renewed
+    assert [book_id for _, book_id in index.overdue(NOW)] == ["3"]
+    assert index.count("ann") == 1 and len(index) == 2
+
+
+def test_overdue_matches_a_full_scan_through_heavy_churn():
+    rng = random.Random(3)
+    index, live = LoanIndex(), {}
+    for _ in range(5000):
+        book_id = str(rng.randrange(300))
+        if book_id in live and rng.random() < 0.5:
+            index.remove(book_id)
+            del live[book_id]
+        else:
+            due = f"2024-{rng.randint(4, 7):02d}-{rng.randint(1, 28):02d} 00:00:00"
+            index.add(book_id, f"m{rng.randrange(20)}", due)
+            live[book_id] = to_timestamp(due)
+    expected = sorted((due, book_id) for book_id, due in live.items() if due < NOW)
+    assert index.overdue(NOW) == expected
+
+
+def test_loan_limit_holds_under_concurrent_issues(make_lms):
+    lms = make_lms(policy=LoanPolicy(max_loans=2))
+    books = [b for b, book in lms.books_dict.items() if not book.lender_name][:10]
+    barrier = threading.Barrier(len(books))
+    results = []
+
+    def issue(book_id):
+        barrier.wait()
+        results.append(lms.issue(book_id, "Race Reader"))
+
+    threads = [threading.Thread(target=issue, args=(b,)) for b in books]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(r.ok for r in results) == 2
+    assert lms.loans.count("race reader") == 2
+    batch = lms.issue_many([(b, "Race Reader") for b in books])
+    assert not any(r.ok for r in batch)
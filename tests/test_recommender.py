@@ -0,0 +1,37 @@
+from catalog import Book
+from recommender import CO_WINDOW, Recommender
+
+
+def book(title, author="", subject=""):
+    return Book(title, author, subject, None, "")
+
+
+def test_query_ranks_by_content():
+    rec = Recommender(dim=256)
+    rec.rebuild([("1", book("Signal Processing Basics", subject="signal_processing")),
+                 ("2", book("Animal Farm", "Orwell, George", "fiction")),
+                 ("3", book("Digital Signal Processing", subject="signal_processing"))])
+    assert {book_id for book_id, _ in rec.query("signal processing", k=2)} == {"1", "3"}
+
+
+def test_unchanged_update_is_not_counted_again():
+    rec = Recommender(dim=256)
+    animal_farm = book("Animal Farm", "Orwell, George", "fiction")
+    rec.rebuild([("1", animal_farm), ("2", book("Nineteen Eighty-Four", "Orwell, George"))])
+    df, n_docs, row = rec.df.copy(), rec.n_docs, rec.matrix[0].copy()
+    for _ in range(5):      # e.g. status-only "updated" notifications
+        rec._apply("updated", "1", animal_farm)
+    assert rec.n_docs == n_docs and (rec.df == df).all() and (rec.matrix[0] == row).all()
+    rec._apply("updated", "1", book("Animal Farm (Annotated)", "Orwell, George", "fiction"))
+    assert rec.n_docs == n_docs + 1
+
+
+def test_co_borrowing_pairs_within_a_bounded_window():
+    rec = Recommender(dim=64)
+    for i in range(CO_WINDOW * 3):
+        rec.borrow(str(i), "Avid Reader")
+    last = str(CO_WINDOW * 3 - 1)
+    assert len(rec.co[last]) == CO_WINDOW
+    assert "0" not in rec.co[last]
+    rec.borrow(last, "avid reader ")        # repeat loans don't count twice
+    assert len(rec.co[last]) == CO_WINDOW
@@ -0,0 +1,49 @@
+from search_index import SearchIndex
+
+
+def make_index(books):
+    index = SearchIndex()
+    for book_id, text in books.items():
+        index.add(book_id, text)
+    return index
+
+
+def test_exact_words_rank_above_prefixes_above_infixes():
+    index = make_index({"1": "Data Mining", "2": "Database Design", "3": "Big Metadata"})
+    assert index.search("data") == ["1", "2", "3"]
+
+
+def test_whole_phrase_ranks_above_scattered_words():
+    index = make_index({"1": "Learning Machine Design", "2": "Machine Learning",
+                        "3": "Practical Machine Learning"})
+    assert index.search("machine learning") == ["2", "3", "1"]
+
+
+def test_every_word_must_match():
+    index = make_index({"1": "Signal Processing", "2": "Image Processing", "3": "Signal Theory"})
+    assert index.search("signal proc") == ["1"]
+    assert index.search("signal chemistry") == []
+    assert index.search("  ") == []
+
+
+def test_short_words_match_prefixes_only():
+    index = make_index({"1": "Go Programming", "2": "Algorithms"})
+    assert index.search("go") == ["1"]
+    assert index.search("al") == ["2"]
+
+
+def test_limit_and_ties_break_by_text():
+    index = make_index({"1": "Python Zen", "2": "Python Basics", "3": "Python Advanced"})
+    assert index.search("python", limit=2) == ["3", "2"]
+
+
+def test_remove_and_re_add_update_postings_and_vocabulary():
+    index = make_index({"1": "Animal Farm", "2": "Farm Economics"})
+    index.remove("1")
+    assert index.search("farm") == ["2"]
+    assert index.search("animal") == []
+    assert "animal" not in index.postings
+    assert not any("animal" in tokens for tokens in index.grams.values())
+    index.add("2", "Urban Planning")
+    assert index.search("farm") == []
+    assert index.search("urb") == ["2"]
@@ -0,0 +1,44 @@
+def test_books_listing_skips_books_deleted_while_it_is_built(server, monkeypatch):
+    lms = server.lms
+    books = lms.books
+
+    def books_then_delete():
+        # Another thread (or sync) deletes a book right after the snapshot.
+        snapshot = books()
+        victim = next(bid for bid, book in snapshot if book.status == server.AVAILABLE)
+        assert lms.delete(victim).ok
+        return snapshot
+
+    monkeypatch.setattr(lms, "books", books_then_delete)
+    client = server.app.test_client()
+    for query in ("", "?status=available", "?sort=title", "?subject=fiction", "?q=farm&sort=-id"):
+        response = client.get("/api/books" + query)
+        assert response.status_code == 200, query
+
+
+def test_books_listing_rejects_unknown_filters(server):
+    client = server.app.test_client()
+    assert client.get("/api/books?status=bogus").status_code == 400
+    assert client.get("/api/books?sort=bogus").status_code == 400
+    assert client.get("/api/books?status=Issued&sort=-title").status_code == 200
+
+
+def test_threaded_workers_keep_threads_free_of_event_streams(server, monkeypatch):
+    monkeypatch.setattr(server, "SSE_MAX_WSGI_SUBSCRIBERS", 2)
+    client = server.app.test_client()
+    threaded = {"wsgi.multithread": True}
+    assert client.get("/api/events").status_code == 503     # sync worker
+    streams = [client.get("/api/events", buffered=False, environ_overrides=threaded)
+               for _ in range(2)]
+    assert [s.status_code for s in streams] == [200, 200]
+    for stream in streams:
+        next(iter(stream.response))
+    assert client.get("/api/events", environ_overrides=threaded).status_code == 503
+    # The ASGI bridge has a pool for streams, so only SSE_MAX_SUBSCRIBERS applies.
+    pooled = client.get("/api/events", buffered=False,
+                        environ_overrides={**threaded, "lms.stream_pool": True})
+    assert pooled.status_code == 200
+    next(iter(pooled.response))
+    for stream in streams + [pooled]:
+        stream.close()
+    assert server.feed.subscribers == 0
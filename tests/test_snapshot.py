@@ -0,0 +1,66 @@
+import sqlite3
+
+import pytest
+
+from catalog import AVAILABLE
+from loans import LoanIndex
+from main import LMS
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    """ Counts full catalog loads, i.e. startups that didn't restore. """
+    calls = []
+    load = LMS._load
+
+    def counted(self):
+        calls.append(self)
+        load(self)
+
+    monkeypatch.setattr(LMS, "_load", counted)
+    return calls
+
+
+def change_behind_snapshot(make_lms):
+    """ Saves a snapshot, then commits an issue, an add and a delete from
+    a second LMS on the same database. """
+    lms = make_lms()
+    lms.save_snapshot()
+    other = make_lms()
+    available = [bid for bid, book in other.books() if book.status == AVAILABLE]
+    assert other.issue(available[0], "Snapshot Reader").ok
+    assert other.add("Brand New Book", "New Author").ok
+    assert other.delete(available[1]).ok
+    return lms.seq, available
+
+
+def assert_matches_storage(lms):
+    stored = dict(lms.storage.load_books())
+    assert {bid: book.to_dict() for bid, book in lms.books_dict.items()} == \
+        {bid: book.to_dict() for bid, book in stored.items()}
+    assert lms.check_stats()
+    due = {bid: entry[:2] for bid, entry in lms.loans.due.items()}
+    assert due == {bid: entry[:2] for bid, entry in LoanIndex.from_books(stored.items()).due.items()}
+
+
+def test_restore_replays_the_journal_written_after_the_snapshot(make_lms, loads):
+    _, (issued, deleted, *_) = change_behind_snapshot(make_lms)
+    loads.clear()
+    lms = make_lms()
+    assert loads == []      # restored, not reloaded
+    assert_matches_storage(lms)
+    assert lms.books_dict[issued].lender_name == "Snapshot Reader"
+    assert deleted not in lms.books_dict
+    assert any(book.title == "Brand New Book" for book in lms.books_dict.values())
+
+
+def test_restore_falls_back_to_a_full_load_when_the_journal_was_trimmed(make_lms, loads):
+    seq, _ = change_behind_snapshot(make_lms)
+    conn = sqlite3.connect("library.db")
+    with conn:
+        conn.execute("DELETE FROM changes WHERE seq <= ?", (seq + 1,))
+    conn.close()
+    loads.clear()
+    lms = make_lms()
+    assert len(loads) == 1
+    assert_matches_storage(lms)
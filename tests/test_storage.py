@@ -0,0 +1,27 @@
+from storage import SQLiteStorage
+
+
+def test_seeded_ids_keep_the_legacy_numbering(workdir):
+    storage = SQLiteStorage("library.db")
+    storage.seed_from_csv("books.csv")
+    # The IDs issued_books.csv and issue_log.txt were written with.
+    assert storage.get_book("102").title == "Fundamentals of Wavelets"
+    assert storage.get_book("309").title == "Image Processing with MATLAB"
+    assert storage.get_book("310").title == "Animal Farm"
+    assert storage.get_book("101") is None
+    storage.close()
+
+
+def test_deleted_book_ids_are_never_reused(workdir):
+    storage = SQLiteStorage("library.db")
+    storage.seed_from_csv("books.csv")
+    last = max(int(book_id) for book_id, _ in storage.load_books())
+    assert storage.delete_book(str(last))
+    book = storage.get_book("102")
+    assert storage.add_book(book) == str(last + 1)
+    storage.close()
+    # The counter is stored, so it survives reopening the database.
+    storage = SQLiteStorage("library.db")
+    assert storage.delete_book(str(last + 1))
+    assert storage.add_books([book, book]) == [str(last + 2), str(last + 3)]
+    storage.close()
@@ -0,0 +1,60 @@
+import random
+
+from catalog import AVAILABLE
+from results import Outcome
+from titles import title_id, title_key
+
+
+def assert_consistent(lms):
+    """ Every title's free list holds exactly its shelved copies, and
+    `slot` points at each one's position in it. """
+    index = lms.titles
+    index.fit()
+    for tid, title in index.titles.items():
+        assert title.copies and all(index.title_of[bid] == tid for bid in title.copies)
+        shelved = {bid for bid in title.copies if lms.books_dict[bid].status == AVAILABLE}
+        assert sorted(title.free) == sorted(shelved)
+        assert title.slot == {bid: i for i, bid in enumerate(title.free)}
+
+
+def add_copies(lms, n, title="Copied Title"):
+    ids = [lms.add(title, "Copy Author").book_id for _ in range(n)]
+    return ids, title_id(title_key(lms.books_dict[ids[0]]))
+
+
+def test_free_lists_follow_issues_returns_and_deletes(make_lms):
+    lms = make_lms()
+    rng = random.Random(7)
+    ids, tid = add_copies(lms, 12)
+    for step in range(400):
+        book_id = rng.choice(ids)
+        book = lms.books_dict.get(book_id)
+        if book is None:
+            if rng.random() < 0.3:
+                ids.append(lms.add("Copied Title", "Copy Author").book_id)
+        elif book.status == AVAILABLE:
+            if rng.random() < 0.1:
+                assert lms.delete(book_id).ok
+            else:
+                assert lms.issue(book_id, f"Reader {step}").ok
+        else:
+            assert lms.return_book(book_id).ok
+        assert_consistent(lms)
+    copies = [bid for bid in ids if bid in lms.books_dict]
+    assert lms.titles.get(tid)["copies"] == len(copies)
+    assert lms.titles.get(tid)["available"] == sum(
+        lms.books_dict[bid].status == AVAILABLE for bid in copies)
+
+
+def test_issue_title_skips_a_copy_another_worker_took(make_lms):
+    lms = make_lms()
+    ids, tid = add_copies(lms, 2)
+    other = make_lms()      # a second worker on the same database
+    taken, _ = lms.titles.free_copy(tid)
+    assert other.issue(taken, "Other Reader").ok
+    # lms hasn't synced, so its free list still offers the taken copy first.
+    assert lms.titles.free_copy(tid)[0] == taken
+    result = lms.issue_title(tid, "Local Reader")
+    assert result.ok and result.book_id != taken
+    assert lms.issue_title(tid, "Local Reader").outcome is Outcome.NO_COPY_AVAILABLE
+    assert_consistent(lms)
@@ -0,0 +1,150 @@
+# Titles (what a book is) versus copies (the physical books carrying IDs).
+
+import hashlib
+import threading
+
+from catalog import AVAILABLE
+from follower import CatalogFollower
+
+
+def title_key(book):
+    """ Copies are the same title when title and author match, ignoring
+    case and surrounding whitespace. """
+    return f"{book.title.strip().lower()}\x1f{book.author.strip().lower()}"
+
+
+def title_id(key):
+    """ A short ID derived from the title key, so every worker (and every
+    restart) names a title the same way without storing anything. """
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=6).hexdigest()
+
+
+class Title:
+    """ One title and its copies. `free` lists the copies on the shelf and
+    `slot` maps each of them to its position in `free`, so a copy is taken
+    off or put back in O(1) (removal swaps the last entry into its place). """
+
+    __slots__ = ("id", "title", "author", "subject", "publisher", "copies", "free", "slot")
+
+    def __init__(self, id, book):
+        self.id = id
+        self.title = book.title
+        self.author = book.author
+        self.subject = book.subject
+        self.publisher = book.publisher
+        self.copies = set()
+        self.free = []
+        self.slot = {}
+
+    def shelve(self, book_id):
+        if book_id not in self.slot:
+            self.slot[book_id] = len(self.free)
+            self.free.append(book_id)
+
+    def unshelve(self, book_id):
+        i = self.slot.pop(book_id, None)
+        if i is None:
+            return
+        last = self.free.pop()
+        if last != book_id:
+            self.free[i] = last
+            self.slot[last] = i
+
+    def to_dict(self):
+        return {
+            "title_id": self.id,
+            "books_title": self.title,
+            "author": self.author,
+            "subject": self.subject,
+            "publisher": self.publisher,
+            "copies": len(self.copies),
+            "available": len(self.free),
+            "copy_ids": sorted(self.copies, key=int),
+        }
+
+
+class TitleIndex(CatalogFollower):
+    """ Groups the catalog's copies by title, with an availability count
+    and a free-copy list per title, so "any available copy of X" is a
+    dict lookup plus a list index instead of a catalog scan. Kept in step
+    with the LMS through its change listener (see CatalogFollower). """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.titles = {}        # title ID -> Title
+        self.title_of = {}      # book ID -> title ID
+
+    def _build(self, books):
+        self.titles, self.title_of = {}, {}
+        for book_id, book in books:
+            self._add(book_id, book)
+
+    def _add(self, book_id, book):
+        self._remove(book_id)
+        tid = title_id(title_key(book))
+        title = self.titles.get(tid)
+        if title is None:
+            title = self.titles[tid] = Title(tid, book)
+        title.copies.add(book_id)
+        if book.status == AVAILABLE:
+            title.shelve(book_id)
+        self.title_of[book_id] = tid
+
+    def _remove(self, book_id):
+        tid = self.title_of.pop(book_id, None)
+        if tid is None:
+            return
+        title = self.titles[tid]
+        title.copies.discard(book_id)
+        title.unshelve(book_id)
+        if not title.copies:
+            del self.titles[tid]
+
+    def _apply(self, action, book_id, book):
+        if action == "deleted":
+            self._remove(book_id)
+        elif action == "issued":
+            title = self.titles.get(self.title_of.get(book_id))
+            if title is not None:
+                title.unshelve(book_id)
+        elif action == "returned":
+            title = self.titles.get(self.title_of.get(book_id))
+            if title is not None:
+                title.shelve(book_id)
+        elif action in ("added", "updated"):
+            self._add(book_id, book)
+
+    def get(self, tid):
+        """ The title `tid` as a JSON-ready dict, or None. """
+        self.fit()
+        with self._lock:
+            title = self.titles.get(tid)
+            return title.to_dict() if title is not None else None
+
+    def free_copy(self, tid):
+        """ (ID of an available copy of title `tid` or None, number of
+        copies); None for the count too if there is no such title. """
+        self.fit()
+        with self._lock:
+            title = self.titles.get(tid)
+            if title is None:
+                return None, None
+            return (title.free[-1] if title.free else None), len(title.copies)
+
+    def grouped(self, book_ids):
+        """ Dicts for the distinct titles of `book_ids`, in order of first
+        appearance. """
+        self.fit()
+        seen, found = set(), []
+        with self._lock:
+            for book_id in book_ids:
+                tid = self.title_of.get(book_id)
+                if tid is not None and tid not in seen:
+                    seen.add(tid)
+                    found.append(self.titles[tid].to_dict())
+        return found
+
+    def __len__(self):
+        self.fit()
+        with self._lock:
+            return len(self.titles)
@@ -0,0 +1,89 @@
+# Serialized appends to the flat-file ledgers (issued_books.csv, issue_log.txt).
+
+import contextlib
+import os
+import threading
+
+from metrics import REGISTRY
+
+try:
+    import fcntl
+except ImportError:     # Windows: single-process CLI use only
+    fcntl = None
+
+WRITE_SECONDS = REGISTRY.histogram(
+    "lms_file_write_seconds", "Time to append to a ledger or log file.", ("file",))
+
+
+@contextlib.contextmanager
+def _locked(f):
+    if fcntl:
+        fcntl.flock(f, fcntl.LOCK_EX)
+    try:
+        yield
+    finally:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class AppendWriter:
+    """ The single writer for LMS's append-only text files. Handles stay
+    open between writes and every append happens under one lock, so lines
+    from concurrent threads never interleave and each line costs one
+    write + flush rather than an open/close cycle.
+
+    A file may be rotated away (see rotate()) by any process. Appends
+    flock the file and check it is still the one at `path`, reopening if
+    not, so no line lands in a file that has already been archived. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._files = {}
+
+    def _file(self, path):
+        f = self._files.get(path)
+        if f is None:
+            f = self._files[path] = open(path, "a", encoding="utf-8")
+        return f
+
+    def _drop(self, path):
+        f = self._files.pop(path, None)
+        if f is not None:
+            f.close()
+
+    @staticmethod
+    def _current(f, path):
+        try:
+            return os.fstat(f.fileno()).st_ino == os.stat(path).st_ino
+        except FileNotFoundError:
+            return False
+
+    def write(self, path, text):
+        with WRITE_SECONDS.labels(os.path.basename(path)).time(), self._lock:
+            while True:
+                f = self._file(path)
+                with _locked(f):
+                    if self._current(f, path):
+                        f.write(text)
+                        f.flush()
+                        return
+                self._drop(path)
+
+    def rotate(self, path, to):
+        """ Renames `path` to `to` and starts an empty file in its place,
+        without losing appends from this or any other process. Returns
+        False if there was nothing to rotate. """
+        with self._lock:
+            if not os.path.exists(path):
+                return False
+            with open(path, "a", encoding="utf-8") as f, _locked(f):
+                os.replace(path, to)
+                open(path, "a").close()
+            self._drop(path)
+            return True
+
+    def close(self):
+        with self._lock:
+            for f in self._files.values():
+                f.close()
+            self._files.clear()